@@ -0,0 +1,186 @@
+"""
+Parsing microbenchmark: the old BeautifulSoup/html.parser extraction against
+the compiled lxml extractors in extract.py, over saved HTML pages.
+
+The committed fixtures in fixtures/player/*.html and fixtures/team/*.html
+are hand-built pages that follow vlr.gg's markup: player pages with small
+and large agents (stats) tables and event placement histories, a free
+agent, a page without a stats table and one without placements, and team
+pages with and without a captain. Besides whole pages, the stats table and event placements
+extractors are timed on their own over the parsed player pages.
+
+    python bench_parse.py
+
+To benchmark against real pages instead, record some into another directory
+(goes through the fetch cache) and point the benchmark at it:
+
+    python bench_parse.py --save 20 --fixtures recorded
+    python bench_parse.py --fixtures recorded
+
+Both paths are checked to produce the same records before they are timed.
+The benchmark exits with an error when the fixture directory has no pages.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+from extract import (
+    AGENTS_TABLE_XPATH, parse_agents_table, parse_event_placements, parse_html, parse_player_page, parse_team_page,
+)
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def bs4_player_page(content):
+    """The pre-lxml extraction of a player page, kept as the benchmark baseline."""
+    from lxml import html
+    soup = BeautifulSoup(content, 'html.parser')
+    tree = html.fromstring(content)
+    team_link = tree.xpath("//*[@id='wrapper']/div[1]/div/div[2]/div[1]/div[4]/a")
+    table = tree.xpath(AGENTS_TABLE_XPATH)
+    agents = None
+    if table:
+        agents = []
+        for row in table[0].xpath('.//tr'):
+            cells = row.xpath('.//td')
+            if len(cells) < 17:
+                continue
+            agent_img = cells[0].xpath('.//img')
+            if not agent_img or 'alt' not in agent_img[0].attrib:
+                continue
+            stats = {"games_played": int(cells[1].text_content().strip().split()[0].strip('()'))}
+            for column, cell in zip(["rnd", "rating", "acs", "kd", "adr", "kast", "kpr", "apr",
+                                     "fkpr", "fdpr", "k", "d", "a", "fk", "fd"], cells[2:]):
+                stats[column] = cell.text_content().strip()
+            agents.append({agent_img[0].attrib['alt']: stats})
+    placements = None
+    h2 = soup.find('h2', string=lambda text: 'Event Placements' in text if text else False)
+    div = h2.find_next('div') if h2 else None
+    if div:
+        placements = []
+        for a_tag in div.find_all('a', class_='player-event-item'):
+            year_div = a_tag.find('div', string=lambda text: text and text.strip().isdigit())
+            placement_span = a_tag.find('span', class_='ge-text-light')
+            name_div = a_tag.find('div', class_='text-of')
+            if not year_div or not placement_span or not name_div:
+                continue
+            placement_text = placement_span.text.strip()
+            placements.append({
+                "event": name_div.text.strip() + placement_text.split('–')[0].strip(),
+                "placement": placement_text.split('–')[-1].strip(),
+                "year": int(year_div.text.strip()),
+            })
+    return {
+        "team_href": team_link[0].get('href') if team_link else None,
+        "agents": agents,
+        "placements": placements,
+    }
+
+
+def bs4_team_page(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    element = soup.find(attrs={"title": "Team Captain"})
+    captain = None
+    captain_text = None
+    if element:
+        captain_text = element.parent.get_text(strip=True) if element.parent else None
+        ancestor_a = element.find_parent('a')
+        if ancestor_a and ancestor_a.has_attr('href'):
+            captain = ancestor_a['href']
+    members = []
+    for a_tag in soup.find_all('a', href=True):
+        if a_tag['href'].startswith('/player/') and a_tag['href'] not in members:
+            members.append(a_tag['href'])
+    return {"captain": captain, "captain_text": captain_text, "members": members}
+
+
+def save_fixtures(count, fixture_dir):
+    from fetcher import fetch
+    from scoreplayers import load_json
+    players = load_json("players_international.json")["players"][:count]
+    os.makedirs(os.path.join(fixture_dir, "player"), exist_ok=True)
+    os.makedirs(os.path.join(fixture_dir, "team"), exist_ok=True)
+    for player in players:
+        content = fetch("https://" + player["player_link"] + "/?timespan=all").content
+        name = player["player_link"].rstrip("/").split("/")[-2]
+        with open(os.path.join(fixture_dir, "player", f"{name}.html"), "wb") as file:
+            file.write(content)
+        team_href = parse_player_page(content)["team_href"]
+        if team_href:
+            team_name = team_href.rstrip("/").split("/")[-2]
+            with open(os.path.join(fixture_dir, "team", f"{team_name}.html"), "wb") as file:
+                file.write(fetch("https://www.vlr.gg" + team_href).content)
+    print(f"Saved {len(players)} player pages and their team pages to {fixture_dir}")
+
+
+def bench(label, pages, new, old, repeat):
+    for content in pages:
+        if old and new(content) != old(content):
+            raise AssertionError(f"{label}: lxml and BeautifulSoup extraction disagree")
+    results = {}
+    for name, func in (("lxml", new), ("bs4", old)):
+        if func is None:
+            continue
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for content in pages:
+                func(content)
+        results[name] = (time.perf_counter() - start) * 1000 / (repeat * len(pages))
+    line = f"{label}: {len(pages)} pages, lxml {results['lxml']:.2f} ms/page"
+    if "bs4" in results:
+        line += f", bs4 {results['bs4']:.2f} ms/page, speedup {results['bs4'] / results['lxml']:.1f}x"
+    print(line)
+
+
+def bench_sections(pages, repeat):
+    """Time the stats table and event placements extractors alone, on already parsed player pages."""
+    trees = [parse_html(content) for content in pages]
+    for label, extract in (("stats", parse_agents_table), ("events", parse_event_placements)):
+        found = sum(1 for tree in trees if extract(tree) is not None)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for tree in trees:
+                extract(tree)
+        ms = (time.perf_counter() - start) * 1000 / (repeat * len(trees))
+        print(f"{label}: {found} of {len(trees)} player pages have one, lxml {ms:.3f} ms/page")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", metavar="DIR", default=FIXTURE_DIR, help="directory with player/ and team/ pages")
+    parser.add_argument("--save", type=int, metavar="N", help="save N real player pages and their team pages, then exit")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    if args.save:
+        if os.path.abspath(args.fixtures) == FIXTURE_DIR:
+            parser.error("--save needs --fixtures DIR; the committed fixtures are not overwritten")
+        save_fixtures(args.save, args.fixtures)
+        return
+
+    def read_all(kind):
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.fixtures, kind, "*.html"))):
+            with open(path, "rb") as file:
+                pages.append(file.read())
+        return pages
+
+    player_pages, team_pages = read_all("player"), read_all("team")
+    if not player_pages or not team_pages:
+        sys.exit(f"No fixtures in {args.fixtures}: expected player/*.html and team/*.html")
+    if BeautifulSoup is None:
+        print("bs4 is not installed; timing the lxml extractors only")
+    bench("player", player_pages, parse_player_page, BeautifulSoup and bs4_player_page, args.repeat)
+    bench("team", team_pages, parse_team_page, BeautifulSoup and bs4_team_page, args.repeat)
+    bench_sections(player_pages, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
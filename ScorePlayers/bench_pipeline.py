@@ -0,0 +1,344 @@
+"""
+Offline end-to-end benchmark of the scraping and scoring pipeline.
+
+A local stub server stands in for vlr.gg, with a configurable per-request
+latency, and serves a league of any size. Player and team pages come from
+the committed corpus in fixtures/player and fixtures/team (shared with
+bench_parse.py), with their team and player links rewritten so that every
+benchmark player has a team and a captain; player pages without a team link
+are left out. If the corpus is missing, pages are generated from a template
+that has the same structure.
+
+The pipeline reads each player's stats from the agents table of their player
+page and takes the league's rows from players_*.json, so player and team
+pages are the only pages it fetches; there are no stats listing pages to
+serve.
+
+Each league size runs in a fresh process and times step 1, step 2, step 3
+and combine_scored_files. The in-process page memo is cleared before each
+stage, so step 2 fetches and parses every player page again instead of
+reading step 1's records (in a real run scrape_category streams both steps
+over one fetch per page). Step 3 fetches nothing, because step 2 saved each
+player's event placements. The report gives seconds and pages/sec for each
+stage, parse ms/page for both page types, and peak RSS. Results can be
+saved as a baseline and compared against later:
+
+    python bench_pipeline.py --sizes 50 200 --latency 0.02 --save bench_baseline.json
+    python bench_pipeline.py --sizes 50 200 --latency 0.02 --compare bench_baseline.json
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import multiprocessing
+
+from extract import parse_player_page, parse_team_page
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SOURCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "players_international.json")
+STAGES = ["step1", "step2", "step3", "combine"]
+TEAM_SIZE = 5
+
+GENERATED_PLAYER_PAGE = """<html><body><div id="wrapper"><div><div><div></div><div><div>
+<div></div><div><div><table>{rows}</table></div></div><div></div><div><a href="{team_href}">team</a></div>
+</div></div></div></div><h2>Event Placements</h2><div>{events}</div></div></body></html>"""
+GENERATED_AGENT_ROW = '<tr><td><img alt="{agent}"></td><td>({games}) 10%</td>' + "<td>{value}</td>" * 15 + "</tr>"
+GENERATED_EVENT = ('<a class="player-event-item" href="#"><div class="text-of">{event}</div>'
+                   '<span class="ge-text-light">{stage} – {placement}</span><div>{year}</div></a>')
+AGENT_POOL = ["Jett", "Omen", "Sova", "Killjoy", "Raze", "Viper", "Skye", "Cypher"]
+
+
+def quoted_href(href):
+    return f'href="{href}"'.encode("utf8")
+
+
+class Corpus:
+    """The pages a benchmark league of `size` players is served from."""
+
+    def __init__(self, size):
+        self.size = size
+        self.teams = max(1, size // TEAM_SIZE)
+        self.members = {team: [] for team in range(self.teams)}
+        for index in range(1, size + 1):
+            self.members[index % self.teams].append(self.player_href(index))
+        self.recorded_players = [page for page in self._read("player") if parse_player_page(page)["team_href"]]
+        self.recorded_teams = self._read("team")
+        self.recorded = bool(self.recorded_players and self.recorded_teams)
+
+    @staticmethod
+    def _read(kind):
+        pages = []
+        for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, kind, "*.html"))):
+            with open(path, "rb") as file:
+                pages.append(file.read())
+        return pages
+
+    @staticmethod
+    def player_href(index):
+        return f"/player/{index}/bench{index}"
+
+    @staticmethod
+    def team_href(team):
+        return f"/team/{team}/benchteam{team}"
+
+    def player_page(self, index):
+        team_href = self.team_href(index % self.teams)
+        if not self.recorded:
+            return self._generated_player_page(index, team_href)
+        content = self.recorded_players[index % len(self.recorded_players)]
+        recorded_team = parse_player_page(content)["team_href"]
+        if recorded_team:
+            content = content.replace(quoted_href(recorded_team), quoted_href(team_href))
+        return content
+
+    def team_page(self, team):
+        members = self.members.get(team) or [self.player_href(1)]
+        if not self.recorded:
+            links = "".join(
+                f'<a href="{href}"><div>{href}</div>' + ('<i title="Team Captain"></i>' if position == 0 else "") + "</a>"
+                for position, href in enumerate(members)
+            )
+            return f"<html><body>{links}</body></html>".encode("utf8")
+        content = self.recorded_teams[team % len(self.recorded_teams)]
+        for position, href in enumerate(parse_team_page(content)["members"]):
+            content = content.replace(quoted_href(href), quoted_href(members[position % len(members)]))
+        return content
+
+    @staticmethod
+    def _generated_player_page(index, team_href):
+        year = datetime.now().year
+        agents = [AGENT_POOL[(index + offset) % len(AGENT_POOL)] for offset in range(index % 4 + 1)]
+        rows = "".join(
+            GENERATED_AGENT_ROW.format(agent=agent, games=index % 9 + offset + 1, value=f"1.{(index + offset) % 30:02d}")
+            for offset, agent in enumerate(agents)
+        )
+        event = ["Champions Tour Stage 1", "Champions Tour Masters", "Challengers League", "Open Qualifier"][index % 4]
+        events = GENERATED_EVENT.format(event=event, stage="Main Event", placement=["1st", "2nd", "3rd", "4th"][index % 4], year=year)
+        events += GENERATED_EVENT.format(event="Valorant Champions", stage="Playoffs", placement="1st", year=year - 1)
+        return GENERATED_PLAYER_PAGE.format(rows=rows, team_href=team_href, events=events).encode("utf8")
+
+
+class StubServer:
+    """Serves a Corpus over HTTP on 127.0.0.1, sleeping `latency` seconds per request."""
+
+    def __init__(self, corpus, latency=0.0):
+        self.corpus = corpus
+        self.latency = latency
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._pages = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/__stats":
+                    body = json.dumps({"requests": server.requests, "bytes": server.bytes}).encode("utf8")
+                else:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    body = server.page(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        ThreadingHTTPServer.request_queue_size = 128
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def page(self, path):
+        player = re.match(r"/player/(\d+)", path)
+        team = re.match(r"/team/(\d+)", path)
+        if not player and not team:
+            return None
+        key = ("player", int(player.group(1))) if player else ("team", int(team.group(1)))
+        body = self._pages.get(key)
+        if body is None:
+            body = self.corpus.player_page(key[1]) if player else self.corpus.team_page(key[1])
+            self._pages[key] = body
+        with self._lock:
+            self.requests += 1
+            self.bytes += len(body)
+        return body
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def server_stats(base_url):
+    import requests
+    return requests.get(base_url + "/__stats").json()
+
+
+def league_rows(size):
+    """size source rows for the benchmark league, cycled from the real international file."""
+    from jsonio import iter_players
+    source = list(iter_players(SOURCE_FILE))
+    rows = []
+    for index in range(1, size + 1):
+        row = dict(source[(index - 1) % len(source)])
+        row["player_name"] = f"bench{index}"
+        row["player_link"] = "www.vlr.gg" + Corpus.player_href(index)
+        rows.append(row)
+    return rows
+
+
+def run_size(size, base_url, concurrency, rate):
+    """Runs the pipeline stages for one league size in this (fresh) process and returns its timings."""
+    import fetcher
+    fetcher.configure(base_url=base_url, cache=False, concurrency=concurrency, rate=rate, burst=rate)
+    import parsepool
+    import scoreplayers
+    from checkpoint import Journal
+    from jsonio import write_players
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    input_file = "players_international.json"
+    write_players(input_file, league_rows(size))
+    journal = Journal(path="pipeline_journal.jsonl", resume=False)
+    stages = [
+        ("step1", lambda: scoreplayers.step1_process_initial_data(input_file, "VCT-International", journal=journal)),
+        ("step2", lambda: scoreplayers.step2_process_player_stats(input_file, scoreplayers.AGENTS_TABLE_XPATH, journal=journal)),
+        ("step3", lambda: scoreplayers.step3_calculate_final_scores(input_file, "players_scored_international.json")),
+        ("combine", scoreplayers.combine_scored_files),
+    ]
+    results = {}
+    for name, stage in stages:
+        # Each stage fetches its own pages rather than reading the previous stage's records
+        scoreplayers.clear_page_records()
+        before = server_stats(base_url)["requests"]
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            stage()
+        seconds = time.perf_counter() - start
+        pages = server_stats(base_url)["requests"] - before
+        results[name] = {
+            "seconds": round(seconds, 4),
+            "pages": pages,
+            "pages_per_sec": round(pages / seconds, 1) if pages and seconds else None,
+        }
+    journal.finish()
+    parsepool.shutdown()
+    shutil.rmtree(os.getcwd(), ignore_errors=True)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["peak_rss_mb"] = round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return results
+
+
+def parse_timings(corpus, sample=50):
+    """Milliseconds per page for the lxml extractors over a sample of the served pages."""
+    timings = {}
+    for kind, pages in (
+        ("player", [corpus.player_page(index) for index in range(1, min(sample, corpus.size) + 1)]),
+        ("team", [corpus.team_page(team) for team in range(min(sample, corpus.teams))]),
+    ):
+        parse = parse_player_page if kind == "player" else parse_team_page
+        start = time.perf_counter()
+        for content in pages:
+            parse(content)
+        timings[kind] = round((time.perf_counter() - start) * 1000 / len(pages), 3)
+    return timings
+
+
+def report(results):
+    for size, result in results.items():
+        print(f"\nLeague of {size} players (peak RSS {result['peak_rss_mb']} MB, "
+              f"parse {result['parse_ms']['player']} ms/player page, {result['parse_ms']['team']} ms/team page)")
+        for stage in STAGES:
+            timing = result[stage]
+            rate = f"{timing['pages_per_sec']} pages/s" if timing["pages_per_sec"] else "no pages"
+            print(f"  {stage:<8} {timing['seconds']:>8.3f} s  {timing['pages']:>6} pages  {rate}")
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """
+    Prints the change against a saved baseline; returns True if any stage
+    slowed down by more than tolerance and by more than min_delta seconds
+    (stages that take milliseconds are mostly noise).
+    """
+    regressed = False
+    print(f"\nAgainst baseline (regression = more than {tolerance:.0%} and {min_delta} s slower):")
+    for size, result in results.items():
+        previous = baseline.get("results", {}).get(size)
+        if previous is None:
+            print(f"  {size} players: no baseline")
+            continue
+        for stage in STAGES:
+            before, after = previous[stage]["seconds"], result[stage]["seconds"]
+            change = (after - before) / before if before else 0.0
+            flag = ""
+            if change > tolerance and after - before > min_delta:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"  {size} players {stage:<8} {before:.3f} s -> {after:.3f} s ({change:+.0%}){flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stub server waits per page")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--rate", type=float, default=10000, help="rate limiter requests/second (high = unthrottled)")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown as a fraction")
+    parser.add_argument("--min-delta", type=float, default=0.05, help="slowdowns under this many seconds are ignored")
+    args = parser.parse_args()
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        corpus = Corpus(size)
+        server = StubServer(corpus, args.latency)
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_size, size, server.url, args.concurrency, args.rate).result()
+        finally:
+            server.close()
+        result["parse_ms"] = parse_timings(corpus)
+        results[str(size)] = result
+    print("Corpus: " + ("fixtures" if corpus.recorded else "generated pages (no fixtures found)"))
+    report(results)
+
+    settings = {"latency": args.latency, "concurrency": args.concurrency, "rate": args.rate,
+                "corpus": "fixtures" if corpus.recorded else "generated"}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf8") as file:
+            baseline = json.load(file)
+        if baseline.get("settings") != settings:
+            print(f"\nWarning: baseline was recorded with {baseline.get('settings')}")
+        if compare(results, baseline, args.tolerance, args.min_delta):
+            sys.exit(1)
+    if args.save:
+        with open(args.save, "w", encoding="utf8") as file:
+            json.dump({"settings": settings, "results": results}, file, indent=2)
+        print(f"\nBaseline saved to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
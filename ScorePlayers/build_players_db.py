@@ -0,0 +1,270 @@
+"""
+Builds the SQLite database the chat pipe queries (data/players.db) from the
+scored pipeline output (players_scored_combined.json).
+
+Players and their agents go into normalized Players/Agents tables with typed
+numeric columns, keyed by the numeric vlr.gg player id. Everything is written
+to a temporary file in one transaction, indexed for the pipe's access paths
+(league + total_score, player_id + games_played), and then swapped over the
+old database with os.replace, so readers only ever see a complete database.
+
+The same build materializes RoleCandidates: for each (league, role) the
+players with an agent of that role among their 3 most played, with those
+agents, their IGL flag and total_score, ranked within the league. Role
+"IGL" lists every IGL with their top 3 agents, since IGLs may play any agent.
+Players without a league are left out of RoleCandidates (they cannot be
+ranked within one) but kept in Players.
+
+    python build_players_db.py [--input players_scored_combined.json] [--output data/players.db]
+"""
+
+import argparse
+import os
+import sqlite3
+
+from jsonio import iter_players
+from registry import player_id
+from scoreplayers import AGENT_ROLES
+
+SOURCE_FILE = "players_scored_combined.json"
+DATABASE_FILE = os.getenv("PLAYERS_DB", os.path.join("data", "players.db"))
+
+# (column, SQL type, source field); percentages are stored as plain numbers
+PLAYER_COLUMNS = [
+    ("player_name", "TEXT NOT NULL", "player_name"),
+    ("player_link", "TEXT NOT NULL", "player_link"),
+    ("player_league", "TEXT", "league"),
+    ("player_team_initials", "TEXT", "player_team_initials"),
+    ("player_country_initials", "TEXT", "player_country_initials"),
+    ("rounds_played", "INTEGER", "rounds_played"),
+    ("rating", "REAL", "rating"),
+    ("average_combat_score", "REAL", "average_combat_score"),
+    ("kills_deaths", "REAL", "kills_deaths"),
+    ("kill_assist_trade_survive_percentage", "REAL", "kill_assist_trade_survive_percentage"),
+    ("average_damage_per_round", "REAL", "average_damage_per_round"),
+    ("kills_per_round", "REAL", "kills_per_round"),
+    ("assists_per_round", "REAL", "assists_per_round"),
+    ("first_kills_per_round", "REAL", "first_kills_per_round"),
+    ("first_deaths_per_round", "REAL", "first_deaths_per_round"),
+    ("headshot_percentage", "REAL", "headshot_percentage"),
+    ("clutch_success_percentage", "REAL", "clutch_success_percentage"),
+    ("max_kills_in_single_map", "INTEGER", "max_kills_in_single_map"),
+    ("kills", "INTEGER", "kills"),
+    ("deaths", "INTEGER", "deaths"),
+    ("rating_score", "REAL", "rating_score"),
+    ("agent_flexibility", "REAL", "agent_flexibility"),
+    ("experience", "REAL", "experience"),
+    ("total_score", "REAL", "total_score"),
+]
+
+AGENT_COLUMNS = [
+    ("games_played", "INTEGER", "games_played"),
+    ("rounds_played", "INTEGER", "rnd"),
+    ("rating", "REAL", "rating"),
+    ("average_combat_score", "REAL", "acs"),
+    ("kills_deaths", "REAL", "kd"),
+    ("average_damage_per_round", "REAL", "adr"),
+    ("kill_assist_trade_survive_percentage", "REAL", "kast"),
+    ("kills_per_round", "REAL", "kpr"),
+    ("assists_per_round", "REAL", "apr"),
+    ("first_kills_per_round", "REAL", "fkpr"),
+    ("first_deaths_per_round", "REAL", "fdpr"),
+    ("kills", "INTEGER", "k"),
+    ("deaths", "INTEGER", "d"),
+    ("assists", "INTEGER", "a"),
+    ("first_kills", "INTEGER", "fk"),
+    ("first_deaths", "INTEGER", "fd"),
+]
+
+SCHEMA = [
+    "CREATE TABLE Players (\n    player_id INTEGER PRIMARY KEY,\n    "
+    + ",\n    ".join(f"{column} {sql_type}" for column, sql_type, _ in PLAYER_COLUMNS[:3])
+    + ",\n    igl TEXT NOT NULL,\n    "
+    + ",\n    ".join(f"{column} {sql_type}" for column, sql_type, _ in PLAYER_COLUMNS[3:])
+    + "\n)",
+    "CREATE TABLE Agents (\n    player_id INTEGER NOT NULL REFERENCES Players (player_id),\n    agent TEXT NOT NULL,\n    "
+    + ",\n    ".join(f"{column} {sql_type}" for column, sql_type, _ in AGENT_COLUMNS)
+    + ",\n    PRIMARY KEY (player_id, agent)\n) WITHOUT ROWID",
+]
+
+ROLE_SCHEMA = [
+    "CREATE TABLE AgentRoles (\n    agent TEXT PRIMARY KEY COLLATE NOCASE,\n    role TEXT NOT NULL\n)",
+    "CREATE TABLE RoleCandidates (\n    player_league TEXT NOT NULL,\n    role TEXT NOT NULL,\n    league_rank INTEGER NOT NULL,\n"
+    "    player_id INTEGER NOT NULL REFERENCES Players (player_id),\n    player_name TEXT NOT NULL,\n"
+    "    igl TEXT NOT NULL,\n    total_score REAL,\n    agents TEXT NOT NULL,\n"
+    "    PRIMARY KEY (player_league, role, league_rank)\n) WITHOUT ROWID",
+]
+
+TOP_AGENTS = 3
+
+# Top agents by games_played per player, then one row per (player, role) they qualify for
+ROLE_CANDIDATES_SQL = f"""
+INSERT INTO RoleCandidates
+WITH ranked_agents AS (
+    SELECT player_id, agent,
+           ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY games_played DESC, agent) AS agent_rank
+    FROM Agents
+),
+top_agents AS (
+    SELECT player_id, agent, agent_rank FROM ranked_agents
+    WHERE agent_rank <= {TOP_AGENTS}
+    ORDER BY player_id, agent_rank
+),
+qualified AS (
+    SELECT top_agents.player_id, AgentRoles.role, group_concat(top_agents.agent, ', ') AS agents
+    FROM top_agents JOIN AgentRoles ON AgentRoles.agent = top_agents.agent
+    GROUP BY top_agents.player_id, AgentRoles.role
+    UNION ALL
+    SELECT top_agents.player_id, 'IGL', group_concat(top_agents.agent, ', ')
+    FROM top_agents JOIN Players USING (player_id)
+    WHERE Players.igl = 'true'
+    GROUP BY top_agents.player_id
+)
+SELECT Players.player_league, qualified.role,
+       ROW_NUMBER() OVER (
+           PARTITION BY Players.player_league, qualified.role
+           ORDER BY Players.total_score DESC, Players.player_id
+       ),
+       Players.player_id, Players.player_name, Players.igl, Players.total_score, qualified.agents
+FROM qualified JOIN Players USING (player_id)
+WHERE Players.player_league IS NOT NULL
+"""
+
+# Created after the bulk insert; each covers one of the pipe's query shapes
+INDEXES = [
+    # Best players of a league, and IGLs within a league
+    "CREATE INDEX players_league_score ON Players (player_league, total_score DESC, igl, player_name)",
+    # Best players across all leagues
+    "CREATE INDEX players_score ON Players (total_score DESC, player_league, igl, player_name)",
+    # A player's most played agents
+    "CREATE INDEX agents_player_games ON Agents (player_id, games_played DESC, agent)",
+    # Who plays a given agent the most
+    "CREATE INDEX agents_agent_games ON Agents (agent, games_played DESC, player_id)",
+    # Candidates for a role across all leagues
+    "CREATE INDEX role_candidates_role_score ON RoleCandidates (role, total_score DESC, igl, player_name)",
+]
+
+
+def to_number(value, sql_type):
+    """Scraped stats are strings such as "1.26", "75%" or "1,559"; returns None for blanks."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    text = str(value).strip().rstrip("%").replace(",", "")
+    try:
+        return int(text) if sql_type.startswith("INTEGER") else float(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return None
+
+
+def player_row(pid, player):
+    row = [pid]
+    for column, sql_type, field in PLAYER_COLUMNS:
+        value = player.get(field)
+        row.append(value if sql_type.startswith("TEXT") else to_number(value, sql_type))
+        if column == "player_league":
+            row.append("true" if player.get("role", "").lower() == "igl" else "false")
+    return row
+
+
+def agent_rows(pid, agents):
+    """
+    One row per agent of the player. An agent listed twice keeps the row
+    with the most games played, so no duplicate reaches the primary key.
+    """
+    rows = {}
+    for agent in agents or []:
+        for name, stats in agent.items():
+            row = [pid, name] + [to_number(stats.get(field), sql_type) for _, sql_type, field in AGENT_COLUMNS]
+            if name not in rows or (row[2] or 0) > (rows[name][2] or 0):
+                rows[name] = row
+    return list(rows.values())
+
+
+def build_role_candidates(connection):
+    """Fill AgentRoles from AGENT_ROLES and materialize RoleCandidates from Players/Agents."""
+    connection.executemany(
+        "INSERT INTO AgentRoles VALUES (?, ?)",
+        [(agent, role) for role, agents in AGENT_ROLES.items() for agent in agents],
+    )
+    connection.execute(ROLE_CANDIDATES_SQL)
+
+
+def build_players_db(source=SOURCE_FILE, path=DATABASE_FILE):
+    """
+    Load the scored players in source into a fresh database and atomically
+    replace path with it. Players seen twice (e.g. in two leagues) keep their
+    first, highest scored row. Returns (players, agents, skipped).
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    player_sql = f"INSERT INTO Players VALUES ({', '.join('?' * (len(PLAYER_COLUMNS) + 2))})"
+    agent_sql = f"INSERT INTO Agents VALUES ({', '.join('?' * (len(AGENT_COLUMNS) + 2))})"
+    seen = set()
+    counts = {"players": 0, "agents": 0, "skipped": 0}
+
+    def players():
+        for player in iter_players(source):
+            pid = player_id(player.get("player_link"))
+            if pid is None or pid in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(pid)
+            counts["players"] += 1
+            yield pid, player
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        # Nothing reads the temporary file until it is complete, so skip the rollback journal
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        with connection:
+            for statement in SCHEMA + ROLE_SCHEMA:
+                connection.execute(statement)
+            agents = []
+            for pid, player in players():
+                connection.execute(player_sql, player_row(pid, player))
+                agents.extend(agent_rows(pid, player.get("agents")))
+                if len(agents) >= 1000:
+                    connection.executemany(agent_sql, agents)
+                    counts["agents"] += len(agents)
+                    agents = []
+            connection.executemany(agent_sql, agents)
+            counts["agents"] += len(agents)
+            build_role_candidates(connection)
+            for statement in INDEXES:
+                connection.execute(statement)
+        connection.execute("ANALYZE")
+        connection.execute("PRAGMA journal_mode = DELETE")
+        connection.close()
+        # synchronous = OFF never flushed the file; do it once before it becomes visible
+        with open(tmp_path, "rb+") as file:
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        connection.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return counts["players"], counts["agents"], counts["skipped"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default=SOURCE_FILE)
+    parser.add_argument("--output", default=DATABASE_FILE)
+    args = parser.parse_args()
+    players, agents, skipped = build_players_db(args.input, args.output)
+    print(f"Wrote {players} players and {agents} agent rows to {args.output}")
+    if skipped:
+        print(f"Skipped {skipped} duplicate or unidentifiable players")
+
+
+if __name__ == "__main__":
+    main()
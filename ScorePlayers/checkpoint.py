@@ -0,0 +1,126 @@
+"""
+Checkpoint journal for resumable and incremental pipeline runs.
+
+Each completed (stage, player) is appended to an NDJSON journal together with
+a hash of the player's source row, i.e. the row minus the fields the pipeline
+adds. Players are keyed like every other stage join (registry.player_key, or
+a PlayerRegistry's key), so a renamed player's entries are replaced rather
+than left behind under the old link. A restarted run replays the journal and
+only scrapes players that have no entry yet. In incremental mode entries from earlier, completed runs are
+reused too, so only players whose source rows changed are scraped again.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from registry import player_key
+
+JOURNAL_FILE = "pipeline_journal.jsonl"
+
+# Fields written by the pipeline itself; everything else is source data
+PIPELINE_FIELDS = {
+    "league", "role", "agents", "event_placements",
+    "rating_score", "agent_flexibility", "experience", "total_score",
+}
+
+
+def source_hash(player):
+    row = {key: value for key, value in player.items() if key not in PIPELINE_FIELDS}
+    return hashlib.sha1(json.dumps(row, sort_keys=True).encode("utf8")).hexdigest()
+
+
+class Journal:
+    """
+    resume: pick up the entries of a run that did not reach finish().
+    incremental: also reuse entries from runs that did finish.
+    Otherwise the journal starts empty.
+
+    Only (stage, player) -> (hash, file offset) is kept in memory, plus the
+    data of INLINE_STAGES, which is small. Other stages' data (a player's
+    agents and placements) is read back from the journal file on lookup, so
+    memory does not grow with the player pool.
+    """
+
+    INLINE_STAGES = {"step1"}
+
+    def __init__(self, path=JOURNAL_FILE, resume=True, incremental=False, key=player_key):
+        self.path = path
+        self._key = key
+        self._lock = threading.Lock()
+        self._index = {}  # (stage, key) -> (hash, offset, inline data or None)
+        index, finished = self._read()
+        if incremental or (resume and not finished):
+            self._index = index
+        self.reused = 0
+        self._rewrite(run_event="run_started")
+        self._file = open(self.path, "ab")
+        self._reader = open(self.path, "rb")
+
+    def lookup(self, stage, player):
+        """The data recorded for this player at this stage, if their source row is unchanged."""
+        entry = self._index.get((stage, self._key(player)))
+        if entry is None or entry[0] != source_hash(player):
+            return None
+        _, offset, data = entry
+        with self._lock:
+            self.reused += 1
+            if data is None:
+                self._reader.seek(offset)
+                data = json.loads(self._reader.readline())["data"]
+        return data
+
+    def record(self, stage, player, data):
+        entry = {"stage": stage, "key": self._key(player), "hash": source_hash(player), "data": data}
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf8")
+        with self._lock:
+            offset = self._file.seek(0, os.SEEK_END)
+            self._file.write(line)
+            self._file.flush()
+            inline = data if stage in self.INLINE_STAGES else None
+            self._index[(stage, entry["key"])] = (entry["hash"], offset, inline)
+
+    def finish(self):
+        """Mark the run complete and compact the journal to one entry per (stage, player)."""
+        with self._lock:
+            self._file.close()
+            self._reader.close()
+            self._rewrite(run_event="run_completed")
+
+    def _read(self):
+        index = {}
+        finished = True
+        if not os.path.exists(self.path):
+            return index, finished
+        offset = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                line_offset, offset = offset, offset + len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-write
+                    continue
+                if "event" in entry:
+                    finished = entry["event"] == "run_completed"
+                else:
+                    inline = entry["data"] if entry["stage"] in self.INLINE_STAGES else None
+                    index[(entry["stage"], entry["key"])] = (entry["hash"], line_offset, inline)
+        return index, finished
+
+    def _rewrite(self, run_event):
+        """Copy the live entries' lines into a fresh journal file and point the index at their new offsets."""
+        tmp_path = self.path + ".tmp"
+        index = {}
+        with open(tmp_path, "wb") as file:
+            if self._index:
+                with open(self.path, "rb") as source:
+                    for key, (entry_hash, offset, inline) in self._index.items():
+                        source.seek(offset)
+                        index[key] = (entry_hash, file.tell(), inline)
+                        file.write(source.readline())
+            file.write((json.dumps({"event": run_event, "time": time.time()}) + "\n").encode("utf8"))
+        os.replace(tmp_path, self.path)
+        self._index = index
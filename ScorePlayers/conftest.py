@@ -0,0 +1,89 @@
+"""
+Shared pytest fixtures: a local http.server stub that fetcher.py is pointed
+at instead of vlr.gg, with caching, retries and rate limiting out of the way.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fetcher
+import parsepool
+from metrics import pipeline_metrics
+from ratelimit import HostLimiters
+
+
+class StubServer:
+    """
+    Answers GET requests with respond(path) -> (status, body) or (status,
+    body, headers), after `latency` seconds, and tracks how many requests
+    were open at once and the headers each one was sent with.
+    """
+
+    def __init__(self, respond, latency=0.0):
+        self.respond = respond
+        self.latency = latency
+        self.active = 0
+        self.peak = 0
+        self.paths = []
+        self.headers = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.active += 1
+                    server.peak = max(server.peak, server.active)
+                    server.paths.append(self.path)
+                    server.headers.append(dict(self.headers))
+                try:
+                    time.sleep(server.latency)
+                    status, body, *headers = server.respond(self.path)
+                    self.send_response(status)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    for header, value in (headers[0] if headers else {}).items():
+                        self.send_header(header, value)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    """Factory: stub_server(respond, latency=0.0) starts a StubServer and routes every fetch to it."""
+    servers = []
+
+    def start(respond, latency=0.0):
+        server = StubServer(respond, latency)
+        servers.append(server)
+        monkeypatch.setattr(fetcher, "BASE_URL", server.url)
+        return server
+
+    monkeypatch.setattr(fetcher, "USE_CACHE", False)
+    monkeypatch.setattr(fetcher, "OFFLINE", False)
+    monkeypatch.setattr(fetcher, "_cache", None)
+    monkeypatch.setattr(fetcher, "MAX_RETRIES", 0)
+    monkeypatch.setattr(fetcher, "_limiters", HostLimiters(rate=10000, burst=10000, max_rate=10000))
+    monkeypatch.setattr(fetcher, "_in_flight", threading.BoundedSemaphore(16))
+    monkeypatch.setattr(parsepool, "PARSE_WORKERS", 1)
+    monkeypatch.setattr(pipeline_metrics, "log_path", None)
+    yield start
+    for server in servers:
+        server.close()
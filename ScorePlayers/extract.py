@@ -0,0 +1,180 @@
+"""
+Parsers that turn vlr.gg page bytes into plain records.
+
+A player page is parsed once into a record holding everything the pipeline
+reads from it: the team link (step 1), the agents table (step 2) and the
+event placements (step 3). Team pages are parsed into their captain and
+roster.
+
+Every selector is an XPath compiled once at import time and evaluated by
+lxml in C; nothing here walks the tree in Python with predicate callbacks.
+"""
+
+from lxml import etree, html
+
+TEAM_LINK_XPATH = "//*[@id='wrapper']/div[1]/div/div[2]/div[1]/div[4]/a"
+AGENTS_TABLE_XPATH = '//*[@id="wrapper"]/div[1]/div/div[2]/div[1]/div[2]/div/table'
+
+# vlr.gg serves UTF-8; without this lxml falls back to latin-1 for pages that
+# carry no charset declaration and mangles the "–" placement separator
+HTML_PARSER = html.HTMLParser(encoding="utf-8")
+
+# Agents table columns after the agent icon and usage cells, in page order
+AGENT_STAT_COLUMNS = [
+    "rnd", "rating", "acs", "kd", "adr", "kast", "kpr", "apr",
+    "fkpr", "fdpr", "k", "d", "a", "fk", "fd",
+]
+
+
+def _class_test(class_name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+# Player page
+TEAM_LINK = etree.XPath(TEAM_LINK_XPATH)
+AGENTS_TABLE = etree.XPath(AGENTS_TABLE_XPATH)
+TABLE_ROWS = etree.XPath(".//tr")
+ROW_CELLS = etree.XPath(".//td")
+CELL_TEXT = etree.XPath("normalize-space(string(.))")
+AGENT_ICON = etree.XPath("(.//img)[1]")
+# Headings whose only text node mentions Event Placements (BeautifulSoup's string= match)
+EVENT_PLACEMENTS_H2 = etree.XPath("//h2[count(node()) = 1][contains(., 'Event Placements')]")
+# BeautifulSoup find_next(): the first div after the opening tag, inside the heading or after it
+NEXT_DIV = etree.XPath("(descendant::div | following::div)[1]")
+EVENT_ITEMS = etree.XPath(f".//a[{_class_test('player-event-item')}]")
+EVENT_YEAR = etree.XPath(
+    "(.//div[count(node()) = 1][text()][normalize-space(.) != '']"
+    "[translate(normalize-space(.), '0123456789', '') = ''])[1]"
+)
+EVENT_NAME = etree.XPath(f"(.//div[{_class_test('text-of')}])[1]")
+EVENT_PLACEMENT = etree.XPath(f"(.//span[{_class_test('ge-text-light')}])[1]")
+
+# Team page and generic lookups
+BY_TITLE = etree.XPath("//*[@title = $title]")
+NEAREST_ANCHOR = etree.XPath("ancestor::a[1]")
+PLAYER_HREFS = etree.XPath("//a/@href[starts-with(., '/player/')]")
+
+_compiled = {AGENTS_TABLE_XPATH: AGENTS_TABLE, TEAM_LINK_XPATH: TEAM_LINK}
+
+
+def compiled_xpath(xpath):
+    """Compile an ad-hoc XPath once and reuse it on later calls."""
+    selector = _compiled.get(xpath)
+    if selector is None:
+        selector = _compiled[xpath] = etree.XPath(xpath)
+    return selector
+
+
+def parse_html(content):
+    """Parse page bytes (or text) into an lxml tree."""
+    if isinstance(content, bytes):
+        return html.fromstring(content, parser=HTML_PARSER)
+    return html.fromstring(content)
+
+
+def parse_agents_table(tree, xpath=AGENTS_TABLE_XPATH):
+    """Agents table rows as [{agent: {stats}}], or None if the table is missing."""
+    table = compiled_xpath(xpath)(tree)
+    if not table:
+        return None
+    agents_data = []
+    for row in TABLE_ROWS(table[0]):
+        cells = ROW_CELLS(row)
+        if len(cells) < 2 + len(AGENT_STAT_COLUMNS):
+            continue
+        agent_img = AGENT_ICON(cells[0])
+        if not agent_img or 'alt' not in agent_img[0].attrib:
+            continue
+        agent_name = agent_img[0].attrib['alt']
+        usage_text = CELL_TEXT(cells[1])
+        try:
+            games_played = int(usage_text.split()[0].strip('()'))
+        except (IndexError, ValueError):
+            continue
+        agent_stats = {"games_played": games_played}
+        for column, cell in zip(AGENT_STAT_COLUMNS, cells[2:]):
+            agent_stats[column] = cell.text_content().strip()
+        agents_data.append({agent_name: agent_stats})
+    return agents_data
+
+
+def parse_event_placements(tree):
+    """
+    Event placements as [{"event", "placement", "year"}], or None if the page
+    has no Event Placements section. "event" is the tournament name followed
+    by the stage, which is what calculate_score matches on.
+    """
+    h2 = EVENT_PLACEMENTS_H2(tree)
+    if not h2:
+        return None
+    div = NEXT_DIV(h2[0])
+    if not div:
+        return None
+    placements = []
+    for a_tag in EVENT_ITEMS(div[0]):
+        year_div = EVENT_YEAR(a_tag)
+        placement_span = EVENT_PLACEMENT(a_tag)
+        name_div = EVENT_NAME(a_tag)
+        if not year_div or not placement_span or not name_div:
+            continue
+        placement_text = placement_span[0].text_content().strip()
+        placements.append({
+            "event": name_div[0].text_content().strip() + placement_text.split('–')[0].strip(),
+            "placement": placement_text.split('–')[-1].strip(),
+            "year": int(year_div[0].text.strip()),
+        })
+    return placements
+
+
+def parse_player_page(content, agents_xpath=AGENTS_TABLE_XPATH):
+    """Parse a player page once into {"team_href", "agents", "placements"}."""
+    tree = parse_html(content)
+    team_link = TEAM_LINK(tree)
+    return {
+        "team_href": team_link[0].get('href') if team_link else None,
+        "agents": parse_agents_table(tree, agents_xpath),
+        "placements": parse_event_placements(tree),
+    }
+
+
+def nearest_anchor_href(element):
+    """href of the closest enclosing <a>, or None."""
+    anchor = NEAREST_ANCHOR(element)
+    if anchor and anchor[0].get('href') is not None:
+        return anchor[0].get('href')
+    return None
+
+
+def find_by_title(tree, title):
+    """
+    First element carrying the given title attribute, as {"element",
+    "parent_text", "ancestor_href"}; None when there is no such element.
+    """
+    found = BY_TITLE(tree, title=title)
+    if not found:
+        return None
+    parent = found[0].getparent()
+    return {
+        "element": found[0],
+        "parent_text": "".join(text.strip() for text in parent.itertext()) if parent is not None else None,
+        "ancestor_href": nearest_anchor_href(found[0]),
+    }
+
+
+def parse_team_page(content):
+    """
+    Parse a team page into {"captain", "captain_text", "members"}: the captain's
+    player href (None if no one carries the Team Captain badge), the text next
+    to the badge, and the href of every player linked from the page.
+    """
+    tree = parse_html(content)
+    badge = find_by_title(tree, "Team Captain")
+    members = []
+    for href in PLAYER_HREFS(tree):
+        if href not in members:
+            members.append(str(href))
+    return {
+        "captain": badge["ancestor_href"] if badge else None,
+        "captain_text": badge["parent_text"] if badge else None,
+        "members": members,
+    }
@@ -0,0 +1,239 @@
+"""
+Shared fetch engine for the ScorePlayers pipeline.
+
+Every vlr.gg request made by scoreplayers.py goes through fetch(). Stages fan
+their per-player work out over a thread pool with run_concurrently() (or its
+streaming form, imap_concurrently()), with at most CONCURRENCY calls running
+and results handed back in input order, so the JSON written is the same as
+the sequential path.
+
+Set VLR_BASE_URL (or call configure(base_url=...)) to point the pipeline at a
+local stub server instead of https://www.vlr.gg.
+
+All network requests share one budget of MAX_IN_FLIGHT slots
+(SCRAPE_MAX_IN_FLIGHT, default CONCURRENCY), however many stages or leagues
+are fetching at the same time, and are paced by a per-host adaptive token
+bucket (see ratelimit.py) that starts at SCRAPE_RATE requests/second and
+moves between SCRAPE_MIN_RATE and SCRAPE_MAX_RATE with server feedback.
+429 and 5xx responses and connection errors are retried up to
+SCRAPE_RETRIES times with jittered exponential backoff, honouring
+Retry-After. rate_report() gives per-host throughput, and every fetch is
+recorded in metrics.pipeline_metrics.
+
+Responses are kept in an on-disk HttpCache (see httpcache.py) so re-runs only
+revalidate stale pages. SCRAPE_CACHE=off disables it and SCRAPE_OFFLINE=1
+serves from the cache alone.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+from httpcache import HttpCache, CacheMiss
+from metrics import pipeline_metrics
+from ratelimit import RETRY_STATUSES, HostLimiters, backoff_delay, parse_retry_after
+
+VLR_ORIGIN = "https://www.vlr.gg"
+
+CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "8"))
+REQUEST_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("SCRAPE_RETRIES", "4"))
+BASE_URL = os.getenv("VLR_BASE_URL", "")
+USE_CACHE = os.getenv("SCRAPE_CACHE", "on").lower() not in ("0", "off", "false", "no")
+OFFLINE = os.getenv("SCRAPE_OFFLINE", "").lower() in ("1", "on", "true", "yes")
+MAX_IN_FLIGHT = int(os.getenv("SCRAPE_MAX_IN_FLIGHT", str(CONCURRENCY)))
+
+_local = threading.local()
+_in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+_limiters = HostLimiters(
+    rate=float(os.getenv("SCRAPE_RATE", "5")),
+    min_rate=float(os.getenv("SCRAPE_MIN_RATE", "0.2")),
+    max_rate=float(os.getenv("SCRAPE_MAX_RATE", "20")),
+)
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure(concurrency=None, base_url=None, cache=None, offline=None, max_in_flight=None,
+              retries=None, timeout=None, **rate_settings):
+    """
+    Override the environment defaults for this process. `cache` may be True,
+    False or an HttpCache instance. Extra keyword arguments (rate, burst,
+    min_rate, max_rate, target_latency, ...) configure the rate limiters.
+    """
+    global CONCURRENCY, BASE_URL, USE_CACHE, OFFLINE, _cache, MAX_IN_FLIGHT, _in_flight
+    global MAX_RETRIES, REQUEST_TIMEOUT, _limiters
+    if max_in_flight is not None:
+        MAX_IN_FLIGHT = max(1, int(max_in_flight))
+        _in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+    if concurrency is not None:
+        CONCURRENCY = max(1, int(concurrency))
+    if retries is not None:
+        MAX_RETRIES = int(retries)
+    if timeout is not None:
+        REQUEST_TIMEOUT = float(timeout)
+    if rate_settings:
+        _limiters = HostLimiters(**{**_limiters.settings, **rate_settings})
+    if base_url is not None:
+        BASE_URL = base_url
+    if cache is not None:
+        USE_CACHE = bool(cache)
+        _cache = cache if isinstance(cache, HttpCache) else None
+    if offline is not None:
+        OFFLINE = bool(offline)
+        if _cache is not None:
+            _cache.offline = OFFLINE
+
+
+def get_cache():
+    """The process-wide HttpCache, created on first use; None when caching is off."""
+    global _cache
+    if not USE_CACHE and not OFFLINE:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache(offline=OFFLINE)
+    return _cache
+
+
+def _session():
+    # requests.Session is not thread safe, so each worker thread keeps its own
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
+
+
+def resolve_url(url):
+    """Rewrite a vlr.gg URL onto BASE_URL when one is configured."""
+    if BASE_URL and url.startswith(VLR_ORIGIN):
+        return BASE_URL.rstrip("/") + url[len(VLR_ORIGIN):]
+    return url
+
+
+def _get(url, headers=None):
+    """
+    One network request: paced by the host's rate limiter, holding a slot of
+    the shared in-flight budget, and retried with backoff on throttling,
+    server errors and dropped connections. Returns the last response once
+    retries run out.
+    """
+    limiter = _limiters.for_url(url)
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        with _in_flight:
+            start = time.monotonic()
+            try:
+                response = _session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                limiter.on_error()
+                if attempt == MAX_RETRIES:
+                    raise
+                response = None
+            latency = time.monotonic() - start
+        retry_after = None
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            limiter.on_response(response.status_code, latency, len(response.content), retry_after)
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+        limiter.on_retry()
+        time.sleep(max(retry_after or 0.0, backoff_delay(attempt)))
+
+
+def rate_report():
+    """Per-host request counts, throttling, retries, current rate and throughput."""
+    return _limiters.report()
+
+
+def fetch(url):
+    """
+    GET a page and return the requests.Response, going through the cache when
+    enabled. Each fetch is recorded in pipeline_metrics (latency, bytes,
+    status code and cache result) and logged with its URL.
+    """
+    url = resolve_url(url)
+    start = time.perf_counter()
+    response, cache_result = _fetch(url)
+    seconds = time.perf_counter() - start
+    host = urlsplit(url).netloc
+    size = len(response.content)
+    pipeline_metrics.observe("scrape_fetch_seconds", seconds, host=host, cache=cache_result)
+    pipeline_metrics.count("scrape_fetch_bytes_total", size, host=host)
+    pipeline_metrics.count("scrape_responses_total", host=host, status=response.status_code)
+    pipeline_metrics.count("scrape_cache_total", cache=cache_result)
+    pipeline_metrics.event("fetch", url=url, status=response.status_code, cache=cache_result,
+                           seconds=round(seconds, 4), bytes=size)
+    return response
+
+
+def _fetch(url):
+    """fetch() without the bookkeeping; returns (response, cache result)."""
+    cache = get_cache()
+    entry = None
+    headers = {}
+    if cache is not None:
+        entry = cache.lookup(url)
+        if entry and (cache.offline or cache.is_fresh(url, entry)):
+            cached = cache.load(url, entry)
+            if cached is not None:
+                return cached, "hit"
+            entry = None
+        if cache.offline:
+            raise CacheMiss(f"{url} is not in the cache (offline mode)")
+        headers = cache.validators(entry)
+
+    response = _get(url, headers)
+
+    if cache is not None:
+        if response.status_code == 304 and entry:
+            cached = cache.revalidated(url, entry, response)
+            if cached is not None:
+                return cached, "revalidated"
+            # The blob vanished under us; fetch a full copy
+            response = _get(url)
+        if response.status_code == 200:
+            cache.store(url, response)
+    return response, "miss" if cache is not None else "off"
+
+
+def run_concurrently(func, items, concurrency=None):
+    """
+    Call func on every item with up to `concurrency` calls in flight.
+    Results are returned in the same order as items, and the first exception
+    raised by func is re-raised here. A concurrency of 1 runs the plain
+    sequential loop.
+    """
+    items = list(items)
+    concurrency = concurrency or CONCURRENCY
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
+def imap_concurrently(func, items, concurrency=None):
+    """
+    Lazy counterpart of run_concurrently for streaming stages: items are
+    pulled only as workers free up and results are yielded in input order, so
+    at most about 2 * concurrency records are held at once.
+    """
+    concurrency = concurrency or CONCURRENCY
+    if concurrency <= 1:
+        for item in items:
+            yield func(item)
+        return
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= 2 * concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -1,5 +1,8 @@
 import json
 
+from jsonio import iter_players, write_players
+from registry import PlayerRegistry
+
 def load_json_file(filename):
     """Load JSON data from a file."""
     with open(filename, 'r', encoding='utf-8') as f:
@@ -10,77 +13,84 @@ def save_json_file(data, filename):
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=2)
 
-def print_data_structure(data, filename):
-    """Debug function to print the structure of the loaded data."""
+def print_file_structure(filename):
+    """Debug function to print the structure of a player file from its first record only."""
     print(f"\nStructure of {filename}:")
-    print(f"Type: {type(data)}")
+    first = next(iter_players(filename), None)
+    if first is None:
+        print("No players")
+        return
+    print("First item type:", type(first))
+    if isinstance(first, dict):
+        print("First item keys:", list(first.keys()))
+    print("\nFirst item:")
+    print(json.dumps(first, indent=2))
+
+def _players(data):
     if isinstance(data, dict):
-        print("Keys:", list(data.keys()))
-    elif isinstance(data, list):
-        print(f"Length: {len(data)}")
-        if len(data) > 0:
-            print("First item type:", type(data[0]))
-            if isinstance(data[0], dict):
-                print("First item keys:", list(data[0].keys()))
-            print("\nFirst item:")
-            print(json.dumps(data[0], indent=2))
+        return data.get('players', [])
+    return data
+
+def iter_filtered_challengers(challengers_data, international_data, gamechangers_data, stats):
+    """
+    Yield challengers players who appear in neither international nor
+    gamechangers, one at a time. Accepts loaded data or any iterable of
+    players (e.g. iter_players), and fills stats with the counts and removed
+    players as it goes.
+    """
+    registry = PlayerRegistry()
+    registry.register_all(_players(international_data), 'international')
+    registry.register_all(_players(gamechangers_data), 'gamechangers')
+    stats.update(original=0, kept=0, removed_international=[], removed_gamechangers=[])
+    for player in _players(challengers_data):
+        stats['original'] += 1
+        leagues = registry.leagues(registry.key(player))
+        if 'international' in leagues:
+            stats['removed_international'].append({
+                'name': player.get('player_name', 'Unknown'),
+                'link': player['player_link'],
+                'team': player.get('player_team_initials', 'Unknown')
+            })
+        elif 'gamechangers' in leagues:
+            stats['removed_gamechangers'].append({
+                'name': player.get('player_name', 'Unknown'),
+                'link': player['player_link'],
+                'team': player.get('player_team_initials', 'Unknown')
+            })
+        else:
+            stats['kept'] += 1
+            yield player
+
+def print_filter_statistics(stats):
+    removed_international = stats['removed_international']
+    removed_gamechangers = stats['removed_gamechangers']
+
+    print("\n=== Filtering Statistics ===")
+    print(f"Original challengers players: {stats['original']}")
+    print(f"Players after filtering: {stats['kept']}")
+    print(f"Total players removed: {stats['original'] - stats['kept']}")
+
+    # Print removed international players
+    print(f"\n=== Removed International Players ({len(removed_international)}) ===")
+    for player in removed_international:
+        print(f"- {player['name']} ({player['team']}) - {player['link']}")
+
+    # Print removed gamechangers players
+    print(f"\n=== Removed Gamechangers Players ({len(removed_gamechangers)}) ===")
+    for player in removed_gamechangers:
+        print(f"- {player['name']} ({player['team']}) - {player['link']}")
 
 def filter_challengers_players(challengers_data, international_data, gamechangers_data):
     """
     Filter out players from challengers who appear in international or gamechangers.
-    Uses player_link as the unique identifier.
+    Players are matched by their numeric vlr.gg id, so renamed players still match.
     """
-    # Ensure we're working with lists of players
-    if isinstance(challengers_data, dict):
-        challengers_data = challengers_data.get('players', [])
-    if isinstance(international_data, dict):
-        international_data = international_data.get('players', [])
-    if isinstance(gamechangers_data, dict):
-        gamechangers_data = gamechangers_data.get('players', [])
-
     try:
-        # Create sets of player links from international and gamechangers
-        international_links = {player['player_link'] for player in international_data}
-        gamechangers_links = {player['player_link'] for player in gamechangers_data}
-        
-        # Track removed players
-        removed_international = []
-        removed_gamechangers = []
-        
-        # Check each challenger player
-        filtered_challengers = []
-        for player in challengers_data:
-            if player['player_link'] in international_links:
-                removed_international.append({
-                    'name': player.get('player_name', 'Unknown'),
-                    'link': player['player_link'],
-                    'team': player.get('player_team_initials', 'Unknown')
-                })
-            elif player['player_link'] in gamechangers_links:
-                removed_gamechangers.append({
-                    'name': player.get('player_name', 'Unknown'),
-                    'link': player['player_link'],
-                    'team': player.get('player_team_initials', 'Unknown')
-                })
-            else:
-                filtered_challengers.append(player)
-        
-        # Print statistics
-        print("\n=== Filtering Statistics ===")
-        print(f"Original challengers players: {len(challengers_data)}")
-        print(f"Players after filtering: {len(filtered_challengers)}")
-        print(f"Total players removed: {len(challengers_data) - len(filtered_challengers)}")
-        
-        # Print removed international players
-        print(f"\n=== Removed International Players ({len(removed_international)}) ===")
-        for player in removed_international:
-            print(f"- {player['name']} ({player['team']}) - {player['link']}")
-        
-        # Print removed gamechangers players
-        print(f"\n=== Removed Gamechangers Players ({len(removed_gamechangers)}) ===")
-        for player in removed_gamechangers:
-            print(f"- {player['name']} ({player['team']}) - {player['link']}")
-        
+        stats = {}
+        filtered_challengers = list(iter_filtered_challengers(
+            challengers_data, international_data, gamechangers_data, stats
+        ))
+        print_filter_statistics(stats)
         return filtered_challengers
     except (KeyError, TypeError) as e:
         print(f"Error accessing data structure: {e}")
@@ -89,26 +99,27 @@ def filter_challengers_players(challengers_data, international_data, gamechanger
 
 def main():
     try:
-        # Load the JSON files
-        challengers_data = load_json_file('players_challengers.json')
-        international_data = load_json_file('players_international.json')
-        gamechangers_data = load_json_file('players_gamechangers.json')
-        
         # Print debug information about the structure of each file
-        print_data_structure(challengers_data, 'players_challengers.json')
-        print_data_structure(international_data, 'players_international.json')
-        print_data_structure(gamechangers_data, 'players_gamechangers.json')
+        print_file_structure('players_challengers.json')
+        print_file_structure('players_international.json')
+        print_file_structure('players_gamechangers.json')
         
-        # Filter the data
-        filtered_data = filter_challengers_players(
-            challengers_data,
-            international_data,
-            gamechangers_data
-        )
+        # Stream challengers through the filter straight into the output file
+        stats = {}
+        try:
+            kept = write_players('filtered-challengers.json', iter_filtered_challengers(
+                iter_players('players_challengers.json'),
+                iter_players('players_international.json'),
+                iter_players('players_gamechangers.json'),
+                stats
+            ), wrap=False)
+        except (KeyError, TypeError) as e:
+            print(f"Error accessing data structure: {e}")
+            print("Please check if 'player_link' exists in all player objects")
+            return
+        print_filter_statistics(stats)
         
-        if filtered_data:
-            # Save the filtered data
-            save_json_file(filtered_data, 'filtered-challengers.json')
+        if kept:
             print("\nFiltered data has been saved to 'filtered-challengers.json'")
         
     except FileNotFoundError as e:
@@ -0,0 +1,204 @@
+"""
+Persistent on-disk cache for vlr.gg responses.
+
+Bodies are stored content-addressed (sha256) under <cache dir>/blobs and an
+SQLite index maps each URL to its blob, validators and timestamps. Entries
+younger than their URL's TTL are served without touching the network; stale
+ones are revalidated with If-None-Match / If-Modified-Since. The store is
+kept under max_bytes by evicting the least recently used URLs. In offline
+mode everything cached is served regardless of age and misses raise
+CacheMiss instead of going to the network.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+CACHE_DIR = os.getenv("SCRAPE_CACHE_DIR", ".http_cache")
+CACHE_MAX_BYTES = int(float(os.getenv("SCRAPE_CACHE_MAX_MB", "512")) * 1024 * 1024)
+DEFAULT_TTL = 6 * 3600
+
+# First matching pattern wins; TTLs are in seconds
+TTL_RULES = [
+    (re.compile(r"/team/"), 24 * 3600),
+    (re.compile(r"/player/"), 12 * 3600),
+]
+
+
+class CacheMiss(requests.exceptions.RequestException):
+    """Raised in offline mode when a URL has never been cached."""
+
+
+class HttpCache:
+    def __init__(self, path=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, ttl_rules=TTL_RULES,
+                 default_ttl=DEFAULT_TTL, offline=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_rules = ttl_rules
+        self.default_ttl = default_ttl
+        self.offline = offline
+        self._blob_dir = os.path.join(path, "blobs")
+        os.makedirs(self._blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "index.db"), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    url TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (accessed_at)")
+            row = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)"
+            ).fetchone()
+        self._total_bytes = row[0]
+
+    def ttl_for(self, url):
+        for pattern, ttl in self.ttl_rules:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def lookup(self, url):
+        """Return the index row for url as a dict, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, size, etag, last_modified, content_type, fetched_at FROM entries WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("digest", "size", "etag", "last_modified", "content_type", "fetched_at")
+        return dict(zip(keys, row))
+
+    def is_fresh(self, url, entry):
+        return time.time() - entry["fetched_at"] < self.ttl_for(url)
+
+    def validators(self, entry):
+        """Conditional request headers for a stale entry."""
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def load(self, url, entry):
+        """Build a Response from a cached entry, or None if its blob has gone missing."""
+        try:
+            with open(self._blob_path(entry["digest"]), "rb") as file:
+                body = file.read()
+        except FileNotFoundError:
+            self._delete(url)
+            return None
+        with self._lock, self._db:
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        return self._response(url, body, entry)
+
+    def revalidated(self, url, entry, response):
+        """Record a 304 for url and return the cached body as a Response."""
+        now = time.time()
+        etag = response.headers.get("ETag") or entry["etag"]
+        last_modified = response.headers.get("Last-Modified") or entry["last_modified"]
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE entries SET etag = ?, last_modified = ?, fetched_at = ?, accessed_at = ? WHERE url = ?",
+                (etag, last_modified, now, now, url),
+            )
+        return self.load(url, entry)
+
+    def store(self, url, response):
+        """Cache a 200 response."""
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(body)
+            os.replace(tmp_path, blob_path)
+        now = time.time()
+        with self._lock, self._db:
+            previous = self._db.execute("SELECT digest, size FROM entries WHERE url = ?", (url,)).fetchone()
+            already_stored = self._db.execute(
+                "SELECT 1 FROM entries WHERE digest = ? AND url != ? LIMIT 1", (digest, url)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, digest, len(body), response.headers.get("ETag"),
+                 response.headers.get("Last-Modified"), response.headers.get("Content-Type"), now, now),
+            )
+            if previous and previous[0] != digest:
+                self._release_blob(*previous)
+            if not already_stored and not (previous and previous[0] == digest):
+                self._total_bytes += len(body)
+            self._evict()
+
+    def clear(self):
+        with self._lock, self._db:
+            for digest, size in self._db.execute("SELECT DISTINCT digest, size FROM entries").fetchall():
+                self._remove_blob(digest)
+            self._db.execute("DELETE FROM entries")
+            self._total_bytes = 0
+
+    def _blob_path(self, digest):
+        return os.path.join(self._blob_dir, digest[:2], digest)
+
+    def _delete(self, url):
+        with self._lock, self._db:
+            row = self._db.execute("SELECT digest, size FROM entries WHERE url = ?", (url,)).fetchone()
+            if row:
+                self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._release_blob(*row)
+
+    def _release_blob(self, digest, size):
+        # Caller holds the lock; the blob is only removed once no URL points at it
+        in_use = self._db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+        if not in_use:
+            self._remove_blob(digest)
+            self._total_bytes -= size
+
+    def _remove_blob(self, digest):
+        try:
+            os.remove(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        # Caller holds the lock
+        while self._total_bytes > self.max_bytes:
+            row = self._db.execute(
+                "SELECT url, digest, size FROM entries ORDER BY accessed_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM entries WHERE url = ?", (row[0],))
+            self._release_blob(row[1], row[2])
+
+    @staticmethod
+    def _response(url, body, entry):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+        response._content = body
+        response.headers = CaseInsensitiveDict()
+        for header, key in (("ETag", "etag"), ("Last-Modified", "last_modified"), ("Content-Type", "content_type")):
+            if entry.get(key):
+                response.headers[header] = entry[key]
+        response.from_cache = True
+        return response
@@ -0,0 +1,154 @@
+"""
+Streaming reader and writer for player files.
+
+iter_players() yields players one at a time from either layout the pipeline
+uses, {"players": [...]} or a bare [...] array, or from NDJSON (one player
+per line, picked by a .ndjson/.jsonl extension). Only the current record and
+one read chunk are held in memory.
+
+write_players() consumes any iterable of players and writes it out record by
+record to a temporary file that replaces the target at the end. A stage can
+therefore read and rewrite the same file, and generator stages can be chained
+between a reader and a writer without building the full list. The default
+layout is byte-for-byte what json.dump(..., indent=2) produced before.
+compact=True (or PLAYERS_JSON_COMPACT=1) drops the indentation.
+"""
+
+import json
+import os
+
+CHUNK_SIZE = 1 << 16
+COMPACT = os.getenv("PLAYERS_JSON_COMPACT", "").lower() in ("1", "on", "true", "yes")
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def is_ndjson(path):
+    return path.endswith(NDJSON_EXTENSIONS)
+
+
+class _Reader:
+    """Pulls JSON values off a file handle one at a time with raw_decode."""
+
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Next non-whitespace character, or "" at end of file."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # A number cut off at the end of the buffer decodes "successfully"
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def array_items(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def iter_players(path):
+    """Yield the players stored in path one at a time."""
+    with open(path, "r", encoding="utf8") as file:
+        if is_ndjson(path):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        reader = _Reader(file)
+        if reader.peek() == "[":
+            yield from reader.array_items()
+            return
+        reader.expect("{")
+        while reader.peek() != "}":
+            key = reader.value()
+            reader.expect(":")
+            if key == "players":
+                yield from reader.array_items()
+            else:
+                reader.value()
+            if reader.peek() == ",":
+                reader.pos += 1
+
+
+def write_players(path, players, compact=None, wrap=True):
+    """
+    Write players to path one record at a time. wrap=False writes a bare JSON
+    array instead of {"players": [...]}; NDJSON paths are always one compact
+    record per line. Returns the number of players written.
+    """
+    compact = COMPACT if compact is None else compact
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    count = 0
+    try:
+        with open(tmp_path, "w", encoding="utf8") as file:
+            if is_ndjson(path):
+                for player in players:
+                    file.write(json.dumps(player, separators=(",", ":")) + "\n")
+                    count += 1
+            elif compact:
+                file.write('{"players":[' if wrap else "[")
+                for player in players:
+                    file.write(("," if count else "") + json.dumps(player, separators=(",", ":")))
+                    count += 1
+                file.write("]}" if wrap else "]")
+            else:
+                # Same bytes json.dump(data, indent=2) writes, one record at a time
+                prefix = "    " if wrap else "  "
+                file.write('{\n  "players": [' if wrap else "[")
+                for player in players:
+                    record = json.dumps(player, indent=2).replace("\n", "\n" + prefix)
+                    file.write(("," if count else "") + "\n" + prefix + record)
+                    count += 1
+                if count:
+                    file.write("\n  ]\n}" if wrap else "\n]")
+                else:
+                    file.write("]\n}" if wrap else "]")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
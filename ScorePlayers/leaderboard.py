@@ -0,0 +1,151 @@
+"""
+Streaming k-way merge of sorted player files and an incremental leaderboard.
+
+Each players_scored_{category}.json is written sorted by total_score, so the
+combined ranking is a merge of already sorted streams: merge_sorted_players()
+holds one player per league in memory instead of loading and re-sorting all
+of them.
+
+Leaderboard keeps players ranked overall, per league and per role under
+single-player updates. Every ranking is a list of (-score, sequence, key)
+kept in order with bisect, so an update costs a binary search and a list
+insert/delete per ranking the player is in, and top(k) is a slice.
+"""
+
+import heapq
+import itertools
+import threading
+from bisect import bisect_left, insort
+
+from registry import player_key
+
+
+def total_score(player):
+    return player.get('total_score', 0)
+
+
+class NotSorted(ValueError):
+    """A stream handed to merge_sorted_players was not sorted by descending total_score."""
+
+
+def _checked(players, label):
+    previous = None
+    for player in players:
+        score = total_score(player)
+        if previous is not None and score > previous:
+            raise NotSorted(f"{label} is not sorted by total_score")
+        previous = score
+        yield player
+
+
+def merge_sorted_players(*streams):
+    """
+    Merge player streams that are each sorted by descending total_score into
+    one sorted stream. Ties keep stream order, then order within a stream,
+    exactly like concatenating and stable-sorting. Raises NotSorted as soon
+    as a stream turns out to be unsorted.
+    """
+    checked = [_checked(players, f"stream {index}") for index, players in enumerate(streams)]
+    return heapq.merge(*checked, key=total_score, reverse=True)
+
+
+class Leaderboard:
+    """
+    roles(player) returns the roles a player is ranked under; leagues come
+    from player['league']. Players are keyed by vlr.gg id, so updating a
+    player replaces their previous entry.
+    """
+
+    OVERALL = ("all", None)
+
+    def __init__(self, roles=None, players=()):
+        self._roles = roles or (lambda player: ())
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._entries = {}  # key -> (sort key, rankings, player)
+        self._rankings = {}  # ("all"|"league"|"role", name) -> sorted list of (-score, seq, key)
+        for player in players:
+            self.update(player)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """The player currently ranked under key, or None."""
+        entry = self._entries.get(key)
+        return entry[2] if entry else None
+
+    def update(self, player):
+        """Insert the player or move them to the place their current score earns."""
+        key = player_key(player)
+        rankings = [self.OVERALL, ("league", player.get('league'))]
+        rankings += [("role", role) for role in self._roles(player)]
+        with self._lock:
+            self._remove(key)
+            item = (-total_score(player), next(self._sequence), key)
+            for ranking in rankings:
+                insort(self._rankings.setdefault(ranking, []), item)
+            self._entries[key] = (item, rankings, player)
+
+    def keep_best(self, player):
+        """
+        update() only if the player is new, outscores their current entry, or
+        is that entry's league being rescored. A player in several leagues
+        thus stays ranked at their best score. Returns whether they were updated.
+        """
+        current = self.get(player_key(player))
+        if (current is not None and current.get('league') != player.get('league')
+                and total_score(player) <= total_score(current)):
+            return False
+        self.update(player)
+        return True
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        item, rankings, _ = entry
+        for ranking in rankings:
+            items = self._rankings[ranking]
+            del items[bisect_left(items, item)]
+
+    def top(self, k=10, league=None, role=None):
+        """The k best players overall, in a league, in a role, or in a role within a league."""
+        with self._lock:
+            if role is None:
+                ranking = self._rankings.get(self.OVERALL if league is None else ("league", league), [])
+                return [self._entries[key][2] for _, _, key in ranking[:k]]
+            found = []
+            for _, _, key in self._rankings.get(("role", role), []):
+                player = self._entries[key][2]
+                if league is None or player.get('league') == league:
+                    found.append(player)
+                    if len(found) == k:
+                        break
+            return found
+
+    def rank(self, key, in_league=False):
+        """1-based position of a player overall (or within their league), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            item, rankings, _ = entry
+            ranking = self._rankings[rankings[1] if in_league else self.OVERALL]
+            return bisect_left(ranking, item) + 1
+
+    def __iter__(self):
+        """All players, best first."""
+        with self._lock:
+            ranking = list(self._rankings.get(self.OVERALL, []))
+        for _, _, key in ranking:
+            entry = self._entries.get(key)
+            if entry is not None:
+                yield entry[2]
@@ -0,0 +1,170 @@
+"""
+Metrics and structured logs for the ScorePlayers pipeline.
+
+fetcher.py records every fetch (latency, bytes, status code and whether the
+cache answered it) and scoreplayers.py records page parse time and the time of
+each stage. Each observation is aggregated into counters and histograms,
+labelled by host, status, cache result or stage, and written out in the
+Prometheus text format by write_prometheus(). When the structured log is
+on, each event is also written to it as one JSON line with its URL.
+
+The log is off by default: set SCRAPE_METRICS_LOG to a file name, or run
+scoreplayers.py with --metrics-log to write scrape_metrics.jsonl. It holds
+one run's events, since it is truncated when a run first writes to it.
+SCRAPE_METRICS_FILE sets the Prometheus file (default scrape_metrics.prom).
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_LOG = os.getenv("SCRAPE_METRICS_LOG", "")
+DEFAULT_METRICS_LOG = "scrape_metrics.jsonl"
+METRICS_FILE = os.getenv("SCRAPE_METRICS_FILE", "scrape_metrics.prom")
+
+# Upper bounds, in seconds, of the latency histogram buckets
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_value(value):
+    """Backslash, double quote and newline escaped, as the text format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_label_value(value)}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe counters and histograms keyed by (name, labels), plus a JSON
+    lines event log. log_path=None keeps the log off; otherwise the file is
+    truncated by the first event written, so it never grows across runs.
+    """
+
+    def __init__(self, log_path=None, buckets=SECONDS_BUCKETS):
+        self.log_path = log_path
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., count, sum]
+        self._help = {}
+        self._log = None
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def count(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += 1
+            histogram[-1] += value
+
+    @contextmanager
+    def timed(self, name, **labels):
+        """Observe how long the with-block takes, in seconds, under name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def event(self, kind, **fields):
+        """Write one structured log line: {"ts", "event": kind, **fields}."""
+        if not self.log_path:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "event": kind, **fields}, separators=(",", ":"))
+        with self._lock:
+            if self._log is None:
+                self._log = open(self.log_path, "w", encoding="utf8", buffering=1)
+            self._log.write(line + "\n")
+
+    def open_log(self, path=DEFAULT_METRICS_LOG):
+        """Turn the structured log on (or move it) for the rest of this run; the file starts empty."""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self.log_path = path
+
+    def snapshot(self):
+        """Counters as {name: {labels: value}} and histograms as {name: {labels: (count, sum)}}."""
+        with self._lock:
+            counters, histograms = {}, {}
+            for (name, labels), value in self._counters.items():
+                counters.setdefault(name, {})[labels] = value
+            for (name, labels), histogram in self._histograms.items():
+                histograms.setdefault(name, {})[labels] = (histogram[-2], histogram[-1])
+            return counters, histograms
+
+    def prometheus(self):
+        """Everything recorded so far in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_label_text(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            for bound, cumulative in zip(self.buckets, histogram):
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{_label_text(labels + (('le', '+Inf'),))} {histogram[-2]}")
+            lines.append(f"{name}_sum{_label_text(labels)} {round(histogram[-1], 6)}")
+            lines.append(f"{name}_count{_label_text(labels)} {histogram[-2]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=None):
+        """Atomically (re)write the Prometheus text file, e.g. for node_exporter's textfile collector."""
+        path = path or METRICS_FILE
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as file:
+            file.write(self.prometheus())
+        os.replace(tmp_path, path)
+        return path
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+pipeline_metrics = Metrics(METRICS_LOG or None)
+pipeline_metrics.describe("scrape_fetch_seconds", "Time to answer a fetch, from the cache or the network")
+pipeline_metrics.describe("scrape_fetch_bytes_total", "Response body bytes returned by fetch")
+pipeline_metrics.describe("scrape_responses_total", "Responses returned by fetch by status code")
+pipeline_metrics.describe("scrape_cache_total", "Fetches by cache result: hit, revalidated, miss or off")
+pipeline_metrics.describe("scrape_parse_seconds", "Time to parse a fetched page into a record")
+pipeline_metrics.describe("scrape_parse_queue_seconds", "Time a page waited for and travelled to a parser process")
+pipeline_metrics.describe("scrape_stage_seconds", "Wall-clock time of a pipeline stage")
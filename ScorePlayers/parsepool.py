@@ -0,0 +1,112 @@
+"""
+Page parsing in a process pool, separate from the threads doing network I/O.
+
+Parsing a page with lxml is CPU-bound and holds the GIL, so with every fetch
+thread also parsing, one core does all of it. parse() hands the page bytes to
+a ProcessPoolExecutor of PARSE_WORKERS processes (SCRAPE_PARSE_WORKERS,
+default the number of CPUs) and waits for the record, so the calling fetch
+thread is idle while other threads keep fetching.
+
+At most MAX_PENDING pages (SCRAPE_PARSE_QUEUE, default 2 * PARSE_WORKERS) are
+queued or being parsed at once. When parsers fall behind, fetch threads block
+in parse() before handing over their page, which stops them fetching more
+until the parsers catch up: that bound is the backpressure between the two
+stages. With one worker pages are parsed on the calling thread, as before.
+
+The parse function must be a module-level function (it is pickled by name),
+e.g. extract.parse_player_page. Worker processes are started with
+forkserver (or spawn), which re-imports the calling script's __main__
+module, so a script that parses through the pool must keep its top-level
+work under an `if __name__ == "__main__":` guard. Without one the workers
+die on start-up; the pool is then reported broken, parse() logs it once and
+parses every later page on the calling thread instead of failing.
+
+PARSE_WORKERS defaults to the number of CPUs, so on a single-CPU machine
+pages are always parsed inline; set SCRAPE_PARSE_WORKERS to override.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+PARSE_WORKERS = int(os.getenv("SCRAPE_PARSE_WORKERS", str(os.cpu_count() or 1)))
+MAX_PENDING = int(os.getenv("SCRAPE_PARSE_QUEUE", str(2 * PARSE_WORKERS)))
+
+_pool = None
+_pool_lock = threading.Lock()
+_broken = False  # Set once the pool has failed; later pages are parsed inline
+_pending = threading.BoundedSemaphore(max(1, MAX_PENDING))
+
+
+def configure(workers=None, max_pending=None):
+    """Override the environment defaults; an existing pool is shut down and restarted on next use."""
+    global PARSE_WORKERS, MAX_PENDING, _pending, _broken
+    _broken = False
+    if workers is not None:
+        PARSE_WORKERS = max(1, int(workers))
+        if max_pending is None:
+            max_pending = 2 * PARSE_WORKERS
+    if max_pending is not None:
+        MAX_PENDING = max(1, int(max_pending))
+        _pending = threading.BoundedSemaphore(MAX_PENDING)
+    shutdown()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process that has fetch threads running can copy held locks into the child
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def _timed(parse, content, args):
+    # Runs in the worker: time the parse itself, not the queueing and pickling around it
+    start = time.perf_counter()
+    record = parse(content, *args)
+    return record, time.perf_counter() - start
+
+
+def parse(parse_func, content, *args):
+    """
+    parse_func(content, *args), run in the parser pool. Returns (record,
+    parse seconds, queue seconds); queue seconds is the time spent waiting
+    for a free slot plus the transfer to and from the worker.
+    """
+    if PARSE_WORKERS <= 1 or _broken:
+        record, seconds = _timed(parse_func, content, args)
+        return record, seconds, 0.0
+    start = time.perf_counter()
+    pending = _pending
+    try:
+        with pending:
+            record, seconds = _get_pool().submit(_timed, parse_func, content, args).result()
+    except BrokenProcessPool as e:
+        _fall_back(e)
+        record, seconds = _timed(parse_func, content, args)
+        return record, seconds, 0.0
+    return record, seconds, time.perf_counter() - start - seconds
+
+
+def _fall_back(error):
+    global _broken
+    with _pool_lock:
+        first = not _broken
+        _broken = True
+    if first:
+        print(f"Parser pool failed ({error}); parsing pages inline. "
+              "Is the calling script missing an if __name__ == '__main__' guard?")
+    shutdown()
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
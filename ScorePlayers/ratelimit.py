@@ -0,0 +1,143 @@
+"""
+Adaptive per-host rate limiting for scraper traffic.
+
+Each host gets a token bucket (implemented as GCRA: a reservation clock plus a
+burst allowance). acquire() reserves the next slot under a lock and sleeps
+outside it, so callers are served in arrival order. The rate adapts AIMD
+style: it creeps up while responses come back fast, backs off when latency
+climbs, halves on 429/503, and honours Retry-After by pausing the whole host.
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+THROTTLE_STATUSES = (429, 503)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Exponential backoff with equal jitter: half fixed, half random."""
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate=5.0, burst=5, min_rate=0.2, max_rate=20.0,
+                 target_latency=1.0, increase=0.2, decrease=0.5):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self._lock = threading.Lock()
+        self._tat = time.monotonic()
+        self._paused_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.waited = 0.0
+        self._first = None
+        self._last = None
+
+    def acquire(self):
+        """Block until this caller's slot comes up; returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            interval = 1.0 / self.rate
+            tat = max(self._tat, now)
+            allowed_at = max(tat - (self.burst - 1) * interval, self._paused_until, now)
+            self._tat = max(tat, allowed_at) + interval
+        wait = allowed_at - now
+        if wait > 0:
+            time.sleep(wait)
+        with self._lock:
+            self.waited += max(wait, 0.0)
+        return max(wait, 0.0)
+
+    def on_response(self, status_code, latency, size=0, retry_after=None):
+        """Feed a response back into the rate."""
+        with self._lock:
+            now = time.monotonic()
+            self._first = self._first if self._first is not None else now - latency
+            self._last = now
+            self.requests += 1
+            self.bytes += size
+            if status_code in THROTTLE_STATUSES:
+                self.throttled += 1
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                pause = retry_after if retry_after is not None else 1.0 / self.rate
+                self._paused_until = max(self._paused_until, now + pause)
+            elif status_code >= 500:
+                self.errors += 1
+                self.rate = max(self.min_rate, self.rate * 0.8)
+            elif latency > 2 * self.target_latency:
+                self.rate = max(self.min_rate, self.rate * 0.9)
+            elif latency < self.target_latency:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_error(self):
+        """A request that failed without a response (timeout, connection reset)."""
+        with self._lock:
+            self.errors += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+
+    def on_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def stats(self):
+        with self._lock:
+            elapsed = (self._last - self._first) if self._first is not None else 0.0
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "errors": self.errors,
+                "retries": self.retries,
+                "bytes": self.bytes,
+                "rate": round(self.rate, 2),
+                "requests_per_sec": round(self.requests / elapsed, 2) if elapsed > 0 else None,
+                "wait_seconds": round(self.waited, 2),
+            }
+
+
+class HostLimiters:
+    """One AdaptiveRateLimiter per host, created on first use with shared settings."""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = AdaptiveRateLimiter(**self.settings)
+            return limiter
+
+    def report(self):
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {host: limiter.stats() for host, limiter in limiters.items()}
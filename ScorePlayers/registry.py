@@ -0,0 +1,167 @@
+"""
+Player identity registry keyed by the numeric vlr.gg player id.
+
+A player link such as www.vlr.gg/player/8480/aspas carries a stable id (8480)
+and a name slug that changes when the player renames. The registry maps each
+id to the player's current name and link, every earlier name and link it has
+seen, and the leagues the player is in this run, so stages can join, filter
+and dedupe players by id in O(1) across any number of leagues. It is saved to
+REGISTRY_FILE between runs so renames are remembered.
+
+Every stage joins on the same key: the player's id, or for a link that has
+no id, the link itself with its scheme and trailing slash removed. Such a
+player is registered under that key and only matches the same link. With a
+registry, key() also resolves a link recorded as one of a player's earlier
+links to that player's id.
+"""
+
+import json
+import os
+import re
+import threading
+
+REGISTRY_FILE = "player_registry.json"
+
+PLAYER_ID = re.compile(r"/player/(\d+)")
+
+
+def player_id(player_link):
+    """The numeric vlr.gg id in a player link, e.g. www.vlr.gg/player/8480/aspas -> 8480."""
+    match = PLAYER_ID.search(player_link or "")
+    return int(match.group(1)) if match else None
+
+
+def normalize_link(player_link):
+    """www.vlr.gg/player/... with no scheme or trailing slash, so equal links compare equal."""
+    link = (player_link or "").strip().rstrip("/")
+    for scheme in ("https://", "http://"):
+        if link.startswith(scheme):
+            link = link[len(scheme):]
+    return link or None
+
+
+def link_key(player_link):
+    """The join key of a player link: its numeric id, or the normalized link when it has none."""
+    pid = player_id(player_link)
+    return pid if pid is not None else normalize_link(player_link)
+
+
+def player_key(player):
+    return link_key(player.get("player_link"))
+
+
+def unique_players(*streams, key=player_key):
+    """
+    Yield each player once across any number of player streams, keeping the
+    first occurrence. Players are matched by key(player), their id by default.
+    """
+    seen = set()
+    for players in streams:
+        for player in players:
+            key_value = key(player)
+            if key_value in seen:
+                continue
+            seen.add(key_value)
+            yield player
+
+
+class PlayerRegistry:
+    """path=None keeps the registry in memory only."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._players = {}  # Key -> {"name", "link", "aliases", "old_links"}
+        self._links = {}  # Normalized current or earlier link -> key
+        self._leagues = {}  # League -> set of keys
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf8") as file:
+                for key, entry in json.load(file)["players"].items():
+                    key = int(key) if key.isdigit() else key
+                    self._players[key] = entry
+                    for link in [entry["link"]] + entry["old_links"]:
+                        self._links[normalize_link(link)] = key
+
+    def __contains__(self, pid):
+        return pid in self._players
+
+    def __len__(self):
+        return len(self._players)
+
+    def get(self, pid):
+        return self._players.get(pid)
+
+    def key(self, player):
+        """The player's join key: their id, or the id an earlier link of theirs was seen with."""
+        return self.link_key(player.get("player_link"))
+
+    def link_key(self, player_link):
+        pid = player_id(player_link)
+        if pid is not None:
+            return pid
+        link = normalize_link(player_link)
+        return self._links.get(link, link)
+
+    def unique(self, *streams):
+        """unique_players() joined through the registry."""
+        return unique_players(*streams, key=self.key)
+
+    def register(self, player, league=None):
+        """
+        Record the player (and their membership of league) under their key
+        and return it, or None if they have no link. A new name or link for a
+        known key replaces the current one and the old one is kept as an alias.
+        """
+        pid = self.key(player)
+        if pid is None:
+            return None
+        name = player.get("player_name")
+        link = player.get("player_link")
+        with self._lock:
+            entry = self._players.get(pid)
+            if entry is None:
+                entry = self._players[pid] = {"name": name, "link": link, "aliases": [], "old_links": []}
+            if name and name != entry["name"]:
+                if entry["name"] and entry["name"] not in entry["aliases"]:
+                    entry["aliases"].append(entry["name"])
+                entry["name"] = name
+            if link and link != entry["link"]:
+                if entry["link"] and entry["link"] not in entry["old_links"]:
+                    entry["old_links"].append(entry["link"])
+                entry["link"] = link
+            self._links[normalize_link(link)] = pid
+            if league:
+                self._leagues.setdefault(league, set()).add(pid)
+        return pid
+
+    def register_all(self, players, league=None):
+        """Register every player of an iterable; returns the number registered."""
+        return sum(1 for player in players if self.register(player, league) is not None)
+
+    def leagues(self, pid):
+        """The leagues a player has been registered in during this run."""
+        return {league for league, members in self._leagues.items() if pid in members}
+
+    def members(self, league):
+        return self._leagues.get(league, set())
+
+    def in_several_leagues(self):
+        """Ids registered in more than one league, with those leagues."""
+        found = {}
+        for league, members in self._leagues.items():
+            for pid in members:
+                found.setdefault(pid, set()).add(league)
+        return {pid: leagues for pid, leagues in found.items() if len(leagues) > 1}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock:
+            # Ids in numeric order, then the players known only by link
+            keys = sorted(key for key in self._players if isinstance(key, int))
+            keys += sorted(key for key in self._players if isinstance(key, str))
+            data = {"players": {str(key): self._players[key] for key in keys}}
+        with open(tmp_path, "w", encoding="utf8") as file:
+            json.dump(data, file, indent=2)
+        os.replace(tmp_path, self.path)
@@ -1,13 +1,24 @@
 import json
 import requests
-from lxml import html
-from bs4 import BeautifulSoup
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import time
 from typing import List, Dict
 import os
+import threading
+import copy
+import itertools
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fetcher import fetch, imap_concurrently, rate_report, run_concurrently
+from jsonio import iter_players, write_players
+from checkpoint import Journal
+from registry import REGISTRY_FILE, PlayerRegistry, link_key, unique_players
+from leaderboard import Leaderboard, NotSorted, merge_sorted_players
+from metrics import pipeline_metrics
+import parsepool
+from extract import AGENTS_TABLE_XPATH, parse_player_page, parse_team_page
 
 def load_json(file_path):
     with open(file_path, 'r', encoding="utf8") as file:
@@ -17,125 +28,112 @@ def save_json(data, file_path):
     with open(file_path, 'w') as file:
         json.dump(data, file, indent=2)
 
-def find_parent_a_tag_href(html_content, child_id):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    child_element = soup.find(id=child_id)
-    if not child_element:
-        return None
-    parent_a_tag = child_element.find_parent('a')
-    if parent_a_tag and 'href' in parent_a_tag.attrs:
-        return parent_a_tag['href']
-    else:
-        return None
+_page_locks = {}
+_page_locks_lock = threading.Lock()
 
-def get_href_by_xpath(url, xpath):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        tree = html.fromstring(response.content)
-        element = tree.xpath(xpath)
-        if element:
-            href = element[0].get('href')
-            return href
-        else:
-            return "Element not found"
-    except requests.exceptions.RequestException as e:
-        return f"Error fetching the webpage: {str(e)}"
-    except Exception as e:
-        return f"An error occurred: {str(e)}"
+def _memoized(memo, key, build):
+    """Returns memo[key], building it at most once even when several workers ask at the same time."""
+    with _page_locks_lock:
+        lock = _page_locks.setdefault((id(memo), key), threading.Lock())
+    with lock:
+        if key not in memo:
+            memo[key] = build()
+        return memo[key]
 
-def get_parent_info_by_title(url, title):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        element = soup.find(attrs={"title": title})
-        if element:
-            result = {}
-            if element.parent:
-                result["parent_text"] = element.parent.get_text(strip=True)
-            else:
-                result["parent_text"] = "Parent not found"
-            ancestor_a = element.find_parent('a')
-            if ancestor_a and ancestor_a.has_attr('href'):
-                result["ancestor_href"] = ancestor_a['href']
-            else:
-                result["ancestor_href"] = "No ancestor <a> tag with href found"
-            return result
-        else:
-            return "Element not found"
-    except requests.exceptions.RequestException as e:
-        return f"Error fetching the webpage: {str(e)}"
-    except Exception as e:
-        return f"An error occurred: {str(e)}"
+def _timed_parse(page, response, parse, *args):
+    """
+    parse(response.content, *args) in the parser pool (see parsepool.py), with
+    its parse and queue time recorded in pipeline_metrics and logged per URL.
+    """
+    record, seconds, queued = parsepool.parse(parse, response.content, *args)
+    pipeline_metrics.observe("scrape_parse_seconds", seconds, page=page)
+    pipeline_metrics.observe("scrape_parse_queue_seconds", queued, page=page)
+    pipeline_metrics.event("parse", url=response.url, page=page, seconds=round(seconds, 5),
+                           queue_seconds=round(queued, 5))
+    return record
 
-def get_parent_text_by_title(url, title):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        tree = html.fromstring(response.content)
-        xpath = f"//*[@title='{title}']/parent::*"
-        parent_element = tree.xpath(xpath)
-        if parent_element:
-            parent_text = parent_element[0].text_content().strip()
-            return parent_text
-        else:
-            return "Element or parent not found"
-    except requests.exceptions.RequestException as e:
-        return f"Error fetching the webpage: {str(e)}"
-    except Exception as e:
-        return f"An error occurred: {str(e)}"
-
-def scrape_player_data(player_link, xpath):
-    response = requests.get(player_link)
-    tree = html.fromstring(response.content)
-    table = tree.xpath(xpath)
-    if not table:
-        return None
-    agents_data = []
-    for row in table[0].xpath('.//tr'):
-        cells = row.xpath('.//td')
-        if len(cells) < 4:
-            continue
-        agent_img = cells[0].xpath('.//img')
-        if not agent_img or 'alt' not in agent_img[0].attrib:
-            continue
-        agent_name = agent_img[0].attrib['alt']
-        usage_text = cells[1].text_content().strip()
-        games_played = int(usage_text.split()[0].strip('()'))
-        agent_data = {
-            agent_name: {
-                "games_played": games_played,
-                "rnd": cells[2].text_content().strip(),
-                "rating": cells[3].text_content().strip(),
-                "acs": cells[4].text_content().strip(),
-                "kd": cells[5].text_content().strip(),
-                "adr": cells[6].text_content().strip(),
-                "kast": cells[7].text_content().strip(),
-                "kpr": cells[8].text_content().strip(),
-                "apr": cells[9].text_content().strip(),
-                "fkpr": cells[10].text_content().strip(),
-                "fdpr": cells[11].text_content().strip(),
-                "k": cells[12].text_content().strip(),
-                "d": cells[13].text_content().strip(),
-                "a": cells[14].text_content().strip(),
-                "fk": cells[15].text_content().strip(),
-                "fd": cells[16].text_content().strip(),
-            }
+_player_pages = {}
+
+def get_player_page(player_link, agents_xpath=AGENTS_TABLE_XPATH):
+    """
+    Fetches and parses a player's page once per run and returns the shared record
+    ({"team_href", "agents", "placements", "status_code"}) that steps 1-3 read from.
+    """
+    def build():
+        response = fetch("https://" + player_link + "/?timespan=all")
+        if response.status_code == 429 or response.status_code >= 500:
+            # Still failing after fetch's retries: raise instead of caching an empty record
+            response.raise_for_status()
+        if response.status_code >= 400:
+            # Error pages may have no body at all; lxml raises on an empty document
+            return {"team_href": None, "agents": None, "placements": None, "status_code": response.status_code}
+        record = _timed_parse("player", response, parse_player_page, agents_xpath)
+        record["status_code"] = response.status_code
+        return record
+    # Keyed by player id, so every stage shares one record per player whichever link it holds
+    return _memoized(_player_pages, (link_key(player_link), agents_xpath), build)
+
+_team_rosters = {}
+
+def get_team_roster(team_href):
+    """
+    Fetches and parses a team page once per run. Returns {"captain", "members"}
+    with player links in the same "www.vlr.gg/player/..." form as player_link,
+    so every teammate's IGL check is a dict lookup.
+    """
+    def build():
+        response = fetch("https://www.vlr.gg" + team_href)
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+        if response.status_code >= 400:
+            return {"captain": None, "members": []}
+        team = _timed_parse("team", response, parse_team_page)
+        return {
+            "captain": "www.vlr.gg" + team["captain"] if team["captain"] else None,
+            "members": ["www.vlr.gg" + href for href in team["members"]],
         }
-        agents_data.append(agent_data)
-    return {"agents": agents_data}
-
-def process_players(input_file, xpath):
-    data = load_json(input_file)
-    for player in data['players']:
-        player_link = "https://" + player['player_link'] + "/?timespan=all"
-        print(player_link)
-        player_data = scrape_player_data(player_link, xpath)
-        if player_data:
-            player['agents'] = player_data['agents']
-        time.sleep(.1)
-    return data
+    return _memoized(_team_rosters, team_href, build)
+
+def forget_player_page(player_link, agents_xpath=AGENTS_TABLE_XPATH):
+    """Drops a player's record once no later stage needs it, keeping streaming runs flat in memory."""
+    key = (link_key(player_link), agents_xpath)
+    with _page_locks_lock:
+        _player_pages.pop(key, None)
+        _page_locks.pop((id(_player_pages), key), None)
+
+def clear_page_records():
+    with _page_locks_lock:
+        _player_pages.clear()
+        _team_rosters.clear()
+        _page_locks.clear()
+
+def add_player_agents(player, xpath, journal=None):
+    done = journal.lookup("step2", player) if journal else None
+    if done is None:
+        print("https://" + player['player_link'] + "/?timespan=all")
+        try:
+            page = get_player_page(player['player_link'], xpath)
+        except requests.exceptions.RequestException as e:
+            # Not journaled, so a resumed run tries this player again
+            print(f"Error fetching the webpage: {str(e)}")
+            return player
+        done = {"agents": page['agents'], "event_placements": page['placements']}
+        if journal:
+            journal.record("step2", player, done)
+    if done['agents'] is not None:
+        player['agents'] = done['agents']
+    # Kept on the player so step 3 and later rescoring need no network
+    player['event_placements'] = done['event_placements']
+    return player
+
+def stats_stage(players, xpath, concurrency=None, journal=None, release_pages=False):
+    """Streaming step 2: yields each player with their agents and placements added."""
+    def run(player):
+        add_player_agents(player, xpath, journal)
+        if release_pages:
+            forget_player_page(player['player_link'], xpath)
+        return player
+    return imap_concurrently(run, players, concurrency)
 
 def calculate_rating_score(rating, is_igl):
     try:
@@ -170,13 +168,15 @@ def calculate_rating_score(rating, is_igl):
         score += 5
     return min(score, 30)
 
+AGENT_ROLES = {
+    "Duelist": ["Phoenix", "Reyna", "Jett", "Raze", "Yoru", "Neon", "Iso"],
+    "Sentinel": ["Sage", "Cypher", "Killjoy", "Chamber", "Deadlock", "Vyse"],
+    "Initiator": ["Sova", "Breach", "Skye", "Kayo", "Fade", "Gekko"],
+    "Controller": ["Brimstone", "Viper", "Omen", "Astra", "Harbor", "Clove"]
+}
+
 def calculate_agent_flexibility(agents):
-    roles = {
-        "Duelist": ["Phoenix", "Reyna", "Jett", "Raze", "Yoru", "Neon", "Iso"],
-        "Sentinel": ["Sage", "Cypher", "Killjoy", "Chamber", "Deadlock", "Vyse"],
-        "Initiator": ["Sova", "Breach", "Skye", "Kayo", "Fade", "Gekko"],
-        "Controller": ["Brimstone", "Viper", "Omen", "Astra", "Harbor", "Clove"]
-    }
+    roles = AGENT_ROLES
     played_agents = set()
     role_coverage = set()
     total_rating = 0
@@ -204,32 +204,11 @@ def calculate_agent_flexibility(agents):
         flexibility_score += scaled_rating
     return round(flexibility_score, 2)
 
-def scrape_player_scores(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    h2 = soup.find('h2', string=lambda text: 'Event Placements' in text if text else False)
-    if not h2:
-        return "H2 'Event Placements' not found."
-    div = h2.find_next('div')
-    if not div:
-        return "Div after 'Event Placements' h2 not found."
-    highest_score = float('-inf')
+def experience_from_placements(placements):
+    """Highest calculate_score over this year's event placements, 0 if there are none."""
     current_year = datetime.now().year
-    for a_tag in div.find_all('a', class_='player-event-item'):
-        year_div = a_tag.find('div', string=lambda text: text and text.strip().isdigit())
-        if not year_div or int(year_div.text.strip()) != current_year:
-            continue
-        placement_span = a_tag.find('span', class_='ge-text-light')
-        if not placement_span:
-            continue
-        tournament_name = a_tag.find('div', class_='text-of').text.strip() + placement_span.text.strip().split('–')[0].strip()
-        placement = placement_span.text.strip().split('–')[-1].strip()
-        score = calculate_score(tournament_name, placement)
-        highest_score = max(highest_score, score)
-    if highest_score != float('-inf'):
-        return highest_score
-    else:
-        return 0
+    scores = [calculate_score(p['event'], p['placement']) for p in placements or [] if p['year'] == current_year]
+    return max(scores) if scores else 0
 
 def calculate_score(tournament_name, placement):
     if "Valorant Champions" in tournament_name or ("Champions Tour" in tournament_name and "Masters" in tournament_name):
@@ -252,120 +231,483 @@ def calculate_score(tournament_name, placement):
         return 10
     return 0
 
-def process_json(input_json, output_json):
-    data = load_json(input_json)
-    for player in data['players']:
+# Batch scoring
+#
+# score_players() computes the same fields as score_player() for a whole
+# league at once: players are loaded into typed numpy/pandas columns and every
+# score is an array expression. Results are bit-for-bit identical to the scalar
+# functions above (check_scoring_parity() verifies this), so rescoring saved
+# files with different weights takes milliseconds and no network.
+
+DEFAULT_WEIGHTS = {"rating_score": 1, "agent_flexibility": 1, "experience": 1}
+
+# calculate_rating_score's buckets: [low, high] -> base + one point per 0.01 above low
+RATING_BUCKET_LOWS = np.array([0.00, 0.40, 0.50, 0.60, 0.70, 0.80, 0.90, 1.00, 1.10, 1.20, 1.30])
+RATING_BUCKET_HIGHS = np.array([0.39, 0.49, 0.59, 0.69, 0.79, 0.89, 0.99, 1.09, 1.19, 1.29, 1.40])
+RATING_BUCKET_BASES = np.array([0, 3, 6, 9, 12, 15, 18, 21, 24, 27, 30])
+
+AGENT_ROLE_OF = {agent: role for role, agents in AGENT_ROLES.items() for agent in agents}
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def rating_scores(ratings, is_igl):
+    """Vectorized calculate_rating_score over an array of float ratings."""
+    ratings = np.asarray(ratings, dtype=np.float64)
+    last = len(RATING_BUCKET_LOWS) - 1
+    bucket = np.digitize(ratings, RATING_BUCKET_LOWS) - 1
+    clipped = np.clip(bucket, 0, last)
+    low = RATING_BUCKET_LOWS[clipped]
+    in_bucket = (bucket >= 0) & (ratings <= RATING_BUCKET_HIGHS[clipped])
+    with np.errstate(invalid="ignore"):
+        stepped = RATING_BUCKET_BASES[clipped] + np.trunc((ratings - low) / 0.01)
+        lowest = np.minimum(2, np.maximum(0, np.trunc(ratings / 0.195)))
+    score = np.where(clipped == 0, lowest, np.where(clipped == last, 30, stepped))
+    score = np.where(in_bucket, score, 0) + np.where(is_igl, 5, 0)
+    return np.minimum(score, 30).astype(np.int64)
+
+def agent_flexibility_frame(agent_lists):
+    """One row per rated agent entry: player index, agent name, role and rating."""
+    rows = []
+    for index, agents in enumerate(agent_lists):
+        for agent_data in agents or []:
+            agent_name = list(agent_data.keys())[0]
+            agent_info = agent_data[agent_name]
+            if 'rating' not in agent_info or agent_info['rating'] == "":
+                continue
+            agent_rating = _parse_float(agent_info['rating'])
+            if agent_rating is not None:
+                rows.append((index, agent_name, agent_rating))
+    frame = pd.DataFrame(rows, columns=["player", "agent", "rating"]).astype({"player": np.int64, "rating": np.float64})
+    frame["role"] = frame["agent"].map(AGENT_ROLE_OF)
+    return frame
+
+def agent_flexibility_scores(agent_lists):
+    """
+    Vectorized calculate_agent_flexibility, before rounding. Also returns the
+    rated-agent count per player, since players with none score an int 0.
+    """
+    size = len(agent_lists)
+    frame = agent_flexibility_frame(agent_lists)
+    players = frame["player"].to_numpy()
+    counts = np.bincount(players, minlength=size)
+    # np.add.at sums each player's ratings in list order, like the scalar loop
+    totals = np.zeros(size)
+    np.add.at(totals, players, frame["rating"].to_numpy())
+    played = np.bincount(frame.drop_duplicates(["player", "agent"])["player"].to_numpy(), minlength=size)
+    roles = frame.dropna(subset=["role"]).drop_duplicates(["player", "role"])
+    covered = np.bincount(roles["player"].to_numpy(), minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scaled = np.where(counts > 0, ((totals / counts) / 1.4) * 6, 0.0)
+    return (played + covered) + scaled, counts
+
+def experience_scores(placement_lists, year=None):
+    """Vectorized experience_from_placements: best calculate_score among this year's placements."""
+    year = year or datetime.now().year
+    rows = [
+        (index, p['event'], p['placement'])
+        for index, placements in enumerate(placement_lists)
+        for p in placements or []
+        if p['year'] == year
+    ]
+    best = np.zeros(len(placement_lists), dtype=np.int64)
+    if not rows:
+        return best
+    frame = pd.DataFrame(rows, columns=["player", "event", "placement"])
+    event = frame["event"]
+    has = lambda text: event.str.contains(text, regex=False).to_numpy()
+    first = (frame["placement"] == "1st").to_numpy()
+    top3 = frame["placement"].isin(["1st", "2nd", "3rd"]).to_numpy()
+    major = has("Valorant Champions") | (has("Champions Tour") & has("Masters"))
+    stage = has("Champions Tour") & (has("Stage 1") | has("Stage 2"))
+    score = np.select(
+        [major, stage & has("Playoffs"), stage, has("Challengers League"), has("Game Changers Championship")],
+        [np.where(first, 30, 25), np.where(top3, 0, 20), 15, np.where(top3, 10, 5), 10],
+        0,
+    )
+    np.maximum.at(best, frame["player"].to_numpy(), score)
+    return best
+
+def score_players(players, weights=None, year=None, fetch_missing=True):
+    """
+    Scores a league's players in one pass, writing rating_score,
+    agent_flexibility, experience and total_score onto each eligible player.
+    Experience comes from the player's saved event_placements, falling back to
+    a previously computed experience and then (if fetch_missing) their page.
+    """
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    eligible = []
+    ratings = []
+    for player in players:
         player_name = player['player_name']
         rating = player.get('rating', '')
-        is_igl = player.get('role', '').lower() == 'igl'
         if rating == "" or 'agents' not in player or not player['agents']:
             print(f"Skipping player {player_name} due to missing data.")
             continue
-        rating_score = calculate_rating_score(rating, is_igl)
-        if rating_score is None:
+        value = _parse_float(rating)
+        if value is None:
             print(f"Skipping player {player_name} due to invalid rating: {rating}")
             continue
-        agent_flexibility = calculate_agent_flexibility(player['agents'])
-        time.sleep(0.1)
-        experience_score = scrape_player_scores("https://" + player['player_link'])
-        print(experience_score, player['player_link'])
-        player['rating_score'] = round(rating_score, 2)
-        player['agent_flexibility'] = round(agent_flexibility, 2)
-        player['experience'] = round(experience_score, 2)
-        player['total_score'] = round(rating_score + agent_flexibility + experience_score, 2)
+        eligible.append(player)
+        ratings.append(value)
+    if not eligible:
+        return players
+
+    is_igl = np.array([player.get('role', '').lower() == 'igl' for player in eligible])
+    rating_score = rating_scores(ratings, is_igl)
+    flexibility, rated_agents = agent_flexibility_scores([player['agents'] for player in eligible])
+
+    placements = []
+    known_experience = {}
+    for index, player in enumerate(eligible):
+        if 'event_placements' in player:
+            placements.append(player['event_placements'])
+        elif 'experience' in player:
+            placements.append(None)
+            known_experience[index] = player['experience']
+        elif fetch_missing:
+            placements.append(get_player_page(player['player_link'])['placements'])
+        else:
+            placements.append(None)
+    experience = experience_scores(placements, year)
+    for index, value in known_experience.items():
+        experience[index] = value
+
+    # Python's round() is correctly rounded and np.round is not, so the
+    # final two-decimal rounding stays scalar to keep results identical
+    int_weights = all(isinstance(weight, int) for weight in weights.values())
+    for index, player in enumerate(eligible):
+        rs = int(rating_score[index])
+        exp = int(experience[index])
+        flex = round(float(flexibility[index]), 2) if rated_agents[index] else int(flexibility[index])
+        total = weights["rating_score"] * rs + weights["agent_flexibility"] * flex + weights["experience"] * exp
+        player['rating_score'] = rs
+        player['agent_flexibility'] = flex
+        player['experience'] = exp
+        player['total_score'] = round(total, 2) if not (int_weights and isinstance(flex, int)) else int(total)
+    return players
+
+def check_scoring_parity(players, year=None):
+    """
+    Scores copies of players with score_players() and with the scalar
+    functions and returns the names of any players whose results differ.
+    """
+    batch = score_players(copy.deepcopy(players), year=year, fetch_missing=False)
+    mismatches = []
+    for original, batched in zip(players, batch):
+        scalar = copy.deepcopy(original)
+        rating = scalar.get('rating', '')
+        if rating == "" or not scalar.get('agents'):
+            continue
+        rating_score = calculate_rating_score(rating, scalar.get('role', '').lower() == 'igl')
+        if rating_score is None:
+            continue
+        flexibility = calculate_agent_flexibility(scalar['agents'])
+        if 'event_placements' in scalar:
+            placements = scalar['event_placements'] or []
+            current_year = year or datetime.now().year
+            scores = [calculate_score(p['event'], p['placement']) for p in placements if p['year'] == current_year]
+            experience = max(scores) if scores else 0
+        else:
+            experience = scalar.get('experience', 0)
+        expected = {
+            'rating_score': round(rating_score, 2),
+            'agent_flexibility': round(flexibility, 2),
+            'experience': round(experience, 2),
+            'total_score': round(rating_score + flexibility + experience, 2),
+        }
+        got = {key: batched.get(key) for key in expected}
+        if any(type(got[key]) is not type(expected[key]) or got[key] != expected[key] for key in expected):
+            mismatches.append(original['player_name'])
+    return mismatches
+
+def score_player(player):
+    player_name = player['player_name']
+    rating = player.get('rating', '')
+    is_igl = player.get('role', '').lower() == 'igl'
+    if rating == "" or 'agents' not in player or not player['agents']:
+        print(f"Skipping player {player_name} due to missing data.")
+        return
+    rating_score = calculate_rating_score(rating, is_igl)
+    if rating_score is None:
+        print(f"Skipping player {player_name} due to invalid rating: {rating}")
+        return
+    agent_flexibility = calculate_agent_flexibility(player['agents'])
+    if 'event_placements' in player:
+        experience_score = experience_from_placements(player['event_placements'])
+    else:
+        experience_score = experience_from_placements(get_player_page(player['player_link'])['placements'])
+    print(experience_score, player['player_link'])
+    player['rating_score'] = round(rating_score, 2)
+    player['agent_flexibility'] = round(agent_flexibility, 2)
+    player['experience'] = round(experience_score, 2)
+    player['total_score'] = round(rating_score + agent_flexibility + experience_score, 2)
+
+def add_event_placements(player):
+    try:
+        player['event_placements'] = get_player_page(player['player_link'])['placements']
+    except requests.exceptions.RequestException as e:
+        # Scored without experience rather than failing the whole league
+        print(f"Error fetching the webpage: {str(e)}")
+
+def process_json(input_json, output_json, concurrency=None):
+    # Scoring ranks the whole league, so this is the one stage that holds every player
+    data = {'players': list(iter_players(input_json))}
+    # Files from before step 2 kept placements need their pages once more
+    missing = [p for p in data['players'] if p.get('agents') and 'event_placements' not in p]
+    run_concurrently(add_event_placements, missing, concurrency)
+    # Pages that could not be fetched just now are not retried player by player
+    score_players(data['players'], fetch_missing=False)
     data['players'] = sorted(data['players'], key=lambda x: x.get('total_score', 0), reverse=True)
-    save_json(data, output_json)
+    write_players(output_json, data['players'])
     print(f"JSON file '{output_json}' has been created successfully.")
     return data
 
-
-
-def process_category(source_file, category, league):
-    output_file = f'players_{category}.json'
-    source_data = load_json(source_file)
-    for player in source_data['players']:
+def league_stage(players, league, registry=None):
+    for player in players:
         player['league'] = league
-    save_json(source_data, output_file)
-    print(f"Processed {category} players saved to {output_file}")
-    return output_file
+        if registry is not None:
+            registry.register(player, league)
+        yield player
 
-def combine_scored_files():
-    """Combines all players_scored_{category}.json files into a single JSON file."""
-    categories = ['international', 'gamechangers', 'challengers']
-    all_players = []
-    
+SCORED_CATEGORIES = ('international', 'gamechangers', 'challengers')
+
+def scored_files(categories=SCORED_CATEGORIES):
+    paths = []
     for category in categories:
         file_path = f'players_scored_{category}.json'
-        try:
-            data = load_json(file_path)
-            all_players.extend(data['players'])
-        except FileNotFoundError:
+        if os.path.exists(file_path):
+            paths.append(file_path)
+        else:
             print(f"Warning: {file_path} not found")
-            continue
-    
-    # Sort all players by total_score
-    all_players = sorted(all_players, key=lambda x: x.get('total_score', 0), reverse=True)
-    
-    # Save combined results
-    combined_data = {'players': all_players}
-    save_json(combined_data, 'players_scored_combined.json')
+    return paths
+
+def combine_scored_files(registry=None):
+    """
+    Combines all players_scored_{category}.json files into a single JSON file,
+    keeping each player (by vlr.gg id, or through the registry when given)
+    once, at their highest score. The files are already sorted by
+    total_score, so they are merged as streams rather than loaded and
+    re-sorted.
+    """
+    unique = registry.unique if registry is not None else unique_players
+    paths = scored_files()
+    with pipeline_metrics.timed("scrape_stage_seconds", stage="combine"):
+        try:
+            merged = merge_sorted_players(*(iter_players(path) for path in paths))
+            write_players('players_scored_combined.json', unique(merged))
+        except NotSorted:
+            # A file not written by process_json; sort everything as before
+            all_players = sorted(itertools.chain.from_iterable(iter_players(path) for path in paths),
+                                 key=lambda x: x.get('total_score', 0), reverse=True)
+            write_players('players_scored_combined.json', unique(all_players))
     print("All scored players combined into players_scored_combined.json")
 
+# Case-insensitive, like AgentRoles in players.db: pages and users may write "jett" or "KAYO"
+AGENT_ROLE_OF_LOWER = {agent.lower(): role for agent, role in AGENT_ROLE_OF.items()}
 
-# Main execution
-def step1_process_initial_data(input_file, league):
-    print(f"Step 1: Processing initial player data for {league}...")
-    source_data = load_json(input_file)
+def player_roles(player):
+    """Roles of the player's 3 most played agents, plus IGL; the roles the leaderboard ranks them under."""
+    agents = []
+    for agent_data in player.get('agents') or []:
+        for name, stats in agent_data.items():
+            agents.append((-(stats.get('games_played') or 0), name))
+    roles = {AGENT_ROLE_OF_LOWER[name.lower()] for _, name in sorted(agents)[:3] if name.lower() in AGENT_ROLE_OF_LOWER}
+    if player.get('role', '').lower() == 'igl':
+        roles.add('IGL')
+    return sorted(roles)
 
-    igls_data = []
-    for player in source_data["players"]:
-        time.sleep(0.1)
-        player["role"] = ""
-        player["league"] = league  # Add league information
-        url = "https://" + player["player_link"]
-        xpath = "//*[@id='wrapper']/div[1]/div/div[2]/div[1]/div[4]/a"
-        result = get_href_by_xpath(url, xpath)
-        if result != "Element or parent not found":
-            url = "https://www.vlr.gg" + result
-            title = "Team Captain"
-            result = get_parent_info_by_title(url, title)
-            if isinstance(result, dict):
-                if player["player_link"] == "www.vlr.gg" + result['ancestor_href']:
-                    print(f"IGL: {player['player_name']} ({league})")
+def build_leaderboard(categories=SCORED_CATEGORIES):
+    """A Leaderboard over the scored league files, ranked overall, per league and per role."""
+    return Leaderboard(player_roles, unique_players(merge_sorted_players(
+        *(iter_players(path) for path in scored_files(categories))
+    )))
+
+def rescore_player(player, leaderboard, weights=None):
+    """
+    Rescores one player from their saved data and moves them to their new
+    place on the leaderboard, unless they rank higher there from another league.
+    """
+    score_players([player], weights, fetch_missing=False)
+    leaderboard.keep_best(player)
+    return player
+
+def rescore_scored_files(weights=None, categories=SCORED_CATEGORIES):
+    """
+    Rescores the saved players_scored_{category}.json files offline. Each
+    rescored player is placed on a Leaderboard (at their best score across
+    leagues, like combine_scored_files), whose order is written out as
+    players_scored_combined.json. Returns the leaderboard.
+    """
+    leaderboard = Leaderboard(player_roles)
+    for file_path in scored_files(categories):
+        data = load_json(file_path)
+        score_players(data['players'], weights, fetch_missing=False)
+        data['players'] = sorted(data['players'], key=lambda x: x.get('total_score', 0), reverse=True)
+        save_json(data, file_path)
+        for player in data['players']:
+            leaderboard.keep_best(player)
+    write_players('players_scored_combined.json', iter(leaderboard))
+    print(f"Rescored {len(leaderboard)} players into players_scored_combined.json")
+    return leaderboard
+
+
+# Main execution
+def identify_igl(player, league, journal=None):
+    """Tags the player with their league and IGL role; returns their igls.json entry if they captain their team."""
+    player["role"] = ""
+    player["league"] = league  # Add league information
+    done = journal.lookup("step1", player) if journal else None
+    if done is not None:
+        player["role"] = done["role"]
+    else:
+        try:
+            page = get_player_page(player["player_link"])
+            if page["status_code"] < 400 and page["team_href"]:
+                team = get_team_roster(page["team_href"])
+                # By id: the team page links the player's current name, which may be newer than ours
+                captain_key = link_key(team["captain"])
+                if captain_key is not None and captain_key == link_key(player["player_link"]):
                     player["role"] = "igl"
-                    igls_data.append({
-                        "player_name": player["player_name"],
-                        "player_link": "www.vlr.gg" + result['ancestor_href'],
-                        "league": league
-                    })
-                print(player["player_name"])
-    
-    save_json(source_data, input_file)
-    
-    # Update or create igls.json
+        except requests.exceptions.RequestException as e:
+            # Not journaled, so a resumed run tries this player again
+            print(f"Error fetching the webpage: {str(e)}")
+            return None
+        if journal:
+            journal.record("step1", player, {"role": player["role"]})
+        print(player["player_name"])
+    if player["role"] != "igl":
+        return None
+    print(f"IGL: {player['player_name']} ({league})")
+    return {
+        "player_name": player["player_name"],
+        "player_link": player["player_link"],
+        "league": league
+    }
+
+def igl_stage(players, league, igls_data, concurrency=None, journal=None):
+    """Streaming step 1: yields each player tagged with league and role, collecting IGL entries into igls_data."""
+    def run(player):
+        return player, identify_igl(player, league, journal)
+    for player, igl in imap_concurrently(run, players, concurrency):
+        if igl:
+            igls_data.append(igl)
+        yield player
+
+_igls_lock = threading.Lock()
+
+def update_igls(igls_data, league):
+    """Replaces the league's entries in igls.json (or creates it)."""
+    with _igls_lock:
+        _update_igls(igls_data, league)
+
+def _update_igls(igls_data, league):
     try:
         existing_igls = load_json("igls.json")
-        existing_igls["players"].extend(igls_data)
     except FileNotFoundError:
-        existing_igls = {"players": igls_data}
-    
+        existing_igls = {"players": []}
+    kept = [igl for igl in existing_igls["players"] if igl["league"] != league]
+    kept.extend(unique_players(igls_data))
+    existing_igls["players"] = kept
     save_json(existing_igls, "igls.json")
+
+def step1_process_initial_data(input_file, league, concurrency=None, journal=None):
+    print(f"Step 1: Processing initial player data for {league}...")
+    igls_data = []
+    with pipeline_metrics.timed("scrape_stage_seconds", stage="step1", league=league):
+        write_players(input_file, igl_stage(iter_players(input_file), league, igls_data, concurrency, journal))
+        update_igls(igls_data, league)
     print(f"Step 1 completed for {league}. Updated data saved to {input_file}")
     print(f"IGL data for {league} added to igls.json")
 
-def step2_process_player_stats(input_file, xpath):
+def step2_process_player_stats(input_file, xpath, concurrency=None, journal=None):
     print("Step 2: Processing player stats...")
-    results = process_players(input_file, xpath)
-    save_json(results, input_file)
+    with pipeline_metrics.timed("scrape_stage_seconds", stage="step2", file=input_file):
+        write_players(input_file, stats_stage(iter_players(input_file), xpath, concurrency, journal))
     print("Step 2 completed. Updated data saved to", input_file)
 
-def step3_calculate_final_scores(input_file, output_file):
+def scrape_category(source_file, category, league, xpath=AGENTS_TABLE_XPATH, concurrency=None, journal=None,
+                    registry=None):
+    """
+    Runs the league stage, step 1 and step 2 as one stream: each player flows
+    through all three and the category file is written once.
+    """
+    output_file = f'players_{category}.json'
+    print(f"Steps 1-2: Scraping {league} players from {source_file}...")
+    igls_data = []
+    players = league_stage(iter_players(source_file), league, registry)
+    players = igl_stage(players, league, igls_data, concurrency, journal)
+    players = stats_stage(players, xpath, concurrency, journal, release_pages=True)
+    with pipeline_metrics.timed("scrape_stage_seconds", stage="scrape", league=league):
+        count = write_players(output_file, players)
+        update_igls(igls_data, league)
+    print(f"Steps 1-2 completed for {count} {league} players. Updated data saved to {output_file}")
+    return output_file
+
+def step3_calculate_final_scores(input_file, output_file, concurrency=None):
     print("Step 3: Calculating final scores...")
-    final_results = process_json(input_file, output_file)
+    with pipeline_metrics.timed("scrape_stage_seconds", stage="step3", file=input_file):
+        final_results = process_json(input_file, output_file, concurrency)
     print("Step 3 completed. Final results saved to", output_file)
     return final_results
 
-def main():
+def process_league(category, info, xpath, journal=None, registry=None):
+    """One category's stage graph: scrape (steps 1-2) then score (step 3)."""
+    source_file = info['file']
+    league = info['league']
+    if not os.path.exists(source_file):
+        print(f"Warning: Source file for {category} not found: {source_file}")
+        return None
+
+    # Tag league, find IGLs (step 1) and scrape player stats (step 2) in one pass
+    output_file = scrape_category(source_file, category, league, xpath, journal=journal, registry=registry)
+
+    # Step 3: Calculate final scores
+    final_output_file = f'players_scored_{category}.json'
+    step3_calculate_final_scores(output_file, final_output_file)
+
+    print(f"Processing completed for {category}. Final results saved to {final_output_file}")
+    return final_output_file
+
+def run_leagues(categories, xpath, journal=None, parallel=True, registry=None):
+    """
+    Runs every category's stage graph. In parallel mode all categories run at
+    once and share fetcher's global request budget, so the wall-clock time is
+    set by the largest league; returns once the last one is scored.
+    """
+    if not parallel:
+        for category, info in categories.items():
+            process_league(category, info, xpath, journal, registry)
+        return
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(categories)) as pool:
+        futures = {
+            pool.submit(process_league, category, info, xpath, journal, registry): category
+            for category, info in categories.items()
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error: {futures[future]} failed: {e}")
+                errors.append(e)
+    if errors:
+        # The journal stays open, so a rerun resumes the failed league
+        raise errors[0]
+
+def main(resume=True, incremental=False, parallel=True, metrics_log=False):
+    """
+    Runs the whole pipeline. Completed players are journaled, so after a crash
+    or interrupt a rerun picks up where it stopped (resume=False starts over).
+    incremental=True also reuses earlier completed runs and only re-scrapes
+    players whose source rows changed. The three leagues run concurrently
+    unless parallel=False. metrics_log=True writes this run's fetch and parse
+    events to scrape_metrics.jsonl.
+    """
     categories = {
         'international': {
             'file': 'players_international.json',
@@ -381,39 +723,49 @@ def main():
         }
     }
     
-    xpath = '//*[@id="wrapper"]/div[1]/div/div[2]/div[1]/div[2]/div/table'
+    xpath = AGENTS_TABLE_XPATH
 
     print("Starting the player data processing pipeline...")
+    if metrics_log:
+        pipeline_metrics.open_log()
+    registry = PlayerRegistry(REGISTRY_FILE)
+    # Journal entries are joined to players through the registry like every other stage
+    journal = Journal(resume=resume, incremental=incremental, key=registry.key)
 
     # Clear existing igls.json if it exists
     if os.path.exists("igls.json"):
         os.remove("igls.json")
 
     # Process each category
-    for category, info in categories.items():
-        source_file = info['file']
-        league = info['league']
-        if os.path.exists(source_file):
-            output_file = process_category(source_file, category, league)
-            
-            # Step 1: Process initial data
-            step1_process_initial_data(output_file, league)
-
-            # Step 2: Process player stats
-            step2_process_player_stats(output_file, xpath)
-
-            # Step 3: Calculate final scores
-            final_output_file = f'players_scored_{category}.json'
-            final_results = step3_calculate_final_scores(output_file, final_output_file)
-            
-            print(f"Processing completed for {category}. Final results saved to {final_output_file}")
-        else:
-            print(f"Warning: Source file for {category} not found: {source_file}")
+    run_leagues(categories, xpath, journal, parallel, registry)
+    registry.save()
+    for pid, leagues in registry.in_several_leagues().items():
+        print(f"{registry.get(pid)['name']} is in several leagues: {', '.join(sorted(leagues))}")
 
     # Combine all scored files into one
-    combine_scored_files()
+    combine_scored_files(registry)
+    journal.finish()
+    print(f"Reused {journal.reused} journaled player results.")
+    for host, stats in rate_report().items():
+        print(f"{host}: {stats['requests']} requests at {stats['requests_per_sec']} req/s "
+              f"(rate {stats['rate']}/s, {stats['throttled']} throttled, {stats['retries']} retries)")
+    parsepool.shutdown()
+    print(f"Metrics written to {pipeline_metrics.write_prometheus()}")
+    pipeline_metrics.close()
 
     print("All categories processed and combined. Check players_scored_combined.json for final results.")
 
 if __name__ == "__main__":
-    main()
+    if "--rescore" in sys.argv:
+        # Offline: rescore the saved league files and print the new leaders
+        leaderboard = rescore_scored_files()
+        for role in [None] + list(AGENT_ROLES) + ['IGL']:
+            leaders = ", ".join(f"{p['player_name']} ({p.get('total_score', 0)})" for p in leaderboard.top(5, role=role))
+            print(f"{role or 'Overall'}: {leaders}")
+    else:
+        main(
+            resume="--fresh" not in sys.argv,
+            incremental="--incremental" in sys.argv,
+            parallel="--sequential" not in sys.argv,
+            metrics_log="--metrics-log" in sys.argv,
+        )
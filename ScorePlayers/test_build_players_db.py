@@ -0,0 +1,93 @@
+"""
+build_players_db: typed Players/Agents rows keyed by vlr.gg id, duplicate
+players and agents kept once, RoleCandidates built even when a player has no
+league, the pipe's indexes in place, and a failed build leaving the previous
+database untouched.
+
+Run from this directory:
+
+    python -m pytest -q test_build_players_db.py
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+from build_players_db import build_players_db
+from jsonio import write_players
+
+
+def player(pid, score, league="VCT-International", role="", agents=()):
+    return {
+        "player_name": f"p{pid}", "player_link": f"www.vlr.gg/player/{pid}/p{pid}", "league": league,
+        "role": role, "rating": "1.10", "headshot_percentage": "25%", "kills": "1,559",
+        "total_score": score, "agents": [{name: {"games_played": games}} for name, games in agents],
+    }
+
+
+@pytest.fixture
+def build(tmp_path):
+    def build(players):
+        source = str(tmp_path / "players.json")
+        path = str(tmp_path / "data" / "players.db")
+        write_players(source, players)
+        counts = build_players_db(source, path)
+        return counts, sqlite3.connect(path)
+    return build
+
+
+def test_rows_are_typed_and_deduplicated(build):
+    (players, agents, skipped), db = build([
+        player(1, 60, role="IGL", agents=[("jett", "12"), ("omen", "3")]),
+        player(1, 40, league="VCT-Challengers"),  # Same player from a lower league
+        {"player_name": "nolink", "player_link": "www.vlr.gg/player/unknown"},
+    ])
+    assert (players, agents, skipped) == (1, 2, 2)
+    assert db.execute("SELECT player_id, player_league, igl, rating, headshot_percentage, kills FROM Players").fetchall() \
+        == [(1, "VCT-International", "true", 1.1, 25.0, 1559)]
+
+
+def test_an_agent_listed_twice_keeps_its_most_played_row(build):
+    (_, agents, _), db = build([player(1, 60, agents=[("jett", "2"), ("jett", "9")])])
+    assert agents == 1
+    assert db.execute("SELECT agent, games_played FROM Agents").fetchall() == [("jett", 9)]
+
+
+def test_role_candidates_skip_players_without_a_league(build):
+    _, db = build([
+        player(1, 60, role="IGL", agents=[("jett", "12"), ("omen", "3")]),
+        player(2, 50, agents=[("raze", "8")]),
+        player(3, 70, league=None, agents=[("jett", "5")]),
+    ])
+    rows = db.execute("SELECT player_league, role, league_rank, player_id, agents FROM RoleCandidates "
+                      "ORDER BY role, league_rank").fetchall()
+    assert rows == [
+        ("VCT-International", "Controller", 1, 1, "omen"),
+        ("VCT-International", "Duelist", 1, 1, "jett"),
+        ("VCT-International", "Duelist", 2, 2, "raze"),
+        ("VCT-International", "IGL", 1, 1, "jett, omen"),
+    ]
+    assert db.execute("SELECT count(*) FROM Players").fetchone() == (3,)
+
+
+def test_indexes_cover_the_pipes_queries(build):
+    _, db = build([player(1, 60, agents=[("jett", "12")])])
+    plan = db.execute("EXPLAIN QUERY PLAN SELECT player_name FROM Players WHERE player_league = ? "
+                      "ORDER BY total_score DESC LIMIT 5", ("VCT-International",)).fetchall()
+    assert "players_league_score" in str(plan)
+    plan = db.execute("EXPLAIN QUERY PLAN SELECT agent FROM Agents WHERE player_id = 1 "
+                      "ORDER BY games_played DESC").fetchall()
+    assert "agents_player_games" in str(plan)
+
+
+def test_a_failed_build_keeps_the_previous_database(build, tmp_path):
+    build([player(1, 60)])
+    source = str(tmp_path / "broken.json")
+    with open(source, "w", encoding="utf8") as file:
+        file.write('{"players": [{"player_name": "p2", "player_link": "www.vlr.gg/player/2/p2"}, {"pla')
+    path = str(tmp_path / "data" / "players.db")
+    with pytest.raises(ValueError):
+        build_players_db(source, path)
+    assert sqlite3.connect(path).execute("SELECT player_id FROM Players").fetchall() == [(1,)]
+    assert not [name for name in os.listdir(tmp_path / "data") if name.endswith(".tmp")]
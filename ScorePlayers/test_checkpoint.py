@@ -0,0 +1,85 @@
+"""
+Journal: an interrupted run resumes from its entries, a finished run is only
+reused in incremental mode and only for unchanged source rows, and finish()
+compacts the file to one entry per (stage, player) that still reads back.
+
+Run from this directory:
+
+    python -m pytest -q test_checkpoint.py
+"""
+
+import json
+
+import pytest
+
+from checkpoint import Journal
+
+PLAYER = {"player_name": "aspas", "player_link": "www.vlr.gg/player/8480/aspas", "rating": "1.10"}
+AGENTS = [{"Jett": {"games_played": 12}}]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "journal.jsonl")
+
+
+def lines(path):
+    with open(path, "rb") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_an_interrupted_run_resumes(path):
+    journal = Journal(path)
+    journal.record("step1", PLAYER, {"role": "IGL"})
+    journal.record("step2", PLAYER, AGENTS)
+    # No finish(): the process died
+
+    journal = Journal(path)
+    assert journal.lookup("step1", PLAYER) == {"role": "IGL"}
+    assert journal.lookup("step2", PLAYER) == AGENTS
+    assert journal.reused == 2
+    journal.finish()
+
+
+def test_a_finished_run_is_reused_only_incrementally(path):
+    journal = Journal(path)
+    journal.record("step2", PLAYER, AGENTS)
+    journal.finish()
+
+    journal = Journal(path, incremental=True)
+    assert journal.lookup("step2", PLAYER) == AGENTS
+    assert journal.lookup("step2", dict(PLAYER, rating="1.30")) is None
+    # Fields the pipeline adds do not count as a change
+    assert journal.lookup("step2", dict(PLAYER, role="IGL", total_score=61.3)) == AGENTS
+    journal.finish()
+
+    journal = Journal(path)
+    assert journal.lookup("step2", PLAYER) is None
+    journal.finish()
+
+
+def test_finish_compacts_to_the_latest_entries(path):
+    journal = Journal(path, resume=False)
+    for games in range(5):
+        journal.record("step2", PLAYER, [{"Jett": {"games_played": games}}])
+    journal.record("step1", PLAYER, {"role": ""})
+    journal.finish()
+
+    entries = lines(path)
+    assert [entry.get("stage", entry.get("event")) for entry in entries] == ["step2", "step1", "run_completed"]
+    journal = Journal(path, incremental=True)
+    assert journal.lookup("step2", PLAYER) == [{"Jett": {"games_played": 4}}]
+    journal.finish()
+
+
+def test_a_torn_last_line_is_ignored(path):
+    journal = Journal(path)
+    journal.record("step2", PLAYER, AGENTS)
+    journal._file.close()
+    journal._reader.close()
+    with open(path, "ab") as file:
+        file.write(b'{"stage":"step2","key":1,"ha')
+
+    journal = Journal(path)
+    assert journal.lookup("step2", PLAYER) == AGENTS
+    journal.finish()
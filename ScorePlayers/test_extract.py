@@ -0,0 +1,54 @@
+"""
+The lxml extractors give the same records as the old BeautifulSoup code, on
+the committed fixtures and on a heading whose div is inside it. Pages
+recorded with bench_parse.py --save are checked too when RECORDED_FIXTURES
+points at their directory:
+
+    python bench_parse.py --save 20 --fixtures recorded
+    RECORDED_FIXTURES=recorded python -m pytest -q test_extract.py
+"""
+
+import glob
+import os
+
+import pytest
+
+pytest.importorskip("bs4")
+
+from bench_parse import FIXTURE_DIR, bs4_player_page, bs4_team_page
+from extract import parse_player_page, parse_team_page
+
+DIRECTORIES = [FIXTURE_DIR] + [path for path in [os.getenv("RECORDED_FIXTURES")] if path]
+
+
+def pages(kind):
+    return sorted(path for directory in DIRECTORIES for path in glob.glob(os.path.join(directory, kind, "*.html")))
+
+
+def read(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("path", pages("player"), ids=os.path.basename)
+def test_player_pages_match_bs4(path):
+    content = read(path)
+    assert parse_player_page(content) == bs4_player_page(content)
+
+
+@pytest.mark.parametrize("path", pages("team"), ids=os.path.basename)
+def test_team_pages_match_bs4(path):
+    content = read(path)
+    assert parse_team_page(content) == bs4_team_page(content)
+
+
+def test_placements_div_inside_the_heading():
+    # find_next('div') returns the heading's own div, not the card after it
+    content = (
+        '<html><body><h2><div>Event Placements</div></h2><div class="wf-card">'
+        '<a class="player-event-item" href="/event/1"><div class="text-of">Masters</div>'
+        '<div><span class="ge-text-light">Playoffs – 1st</span></div><div>2024</div></a>'
+        '</div></body></html>'
+    ).encode("utf8")
+    assert parse_player_page(content) == bs4_player_page(content)
+    assert parse_player_page(content)["placements"] == []
@@ -0,0 +1,62 @@
+"""
+run_concurrently and imap_concurrently against a local http.server stub:
+results in input order, calls bounded by the concurrency and the shared
+in-flight budget, and errors raised to the caller.
+
+Run from this directory:
+
+    python -m pytest -q test_fetcher.py
+"""
+
+import threading
+
+import pytest
+import requests
+
+import fetcher
+
+LATENCY = 0.05
+
+
+def echo(path):
+    """The request path as the body; /fail/... answers 500."""
+    return (500 if path.startswith("/fail") else 200), path.encode("utf8")
+
+
+@pytest.fixture
+def stub(stub_server):
+    return stub_server(echo, LATENCY)
+
+
+def get_page(index):
+    return fetcher.fetch(f"{fetcher.VLR_ORIGIN}/page/{index}").text
+
+
+def test_results_keep_input_order(stub):
+    indexes = list(range(12))
+    expected = [f"/page/{index}" for index in indexes]
+    assert fetcher.run_concurrently(get_page, indexes, concurrency=4) == expected
+    assert list(fetcher.imap_concurrently(get_page, iter(indexes), concurrency=4)) == expected
+
+
+def test_calls_are_bounded_by_concurrency(stub):
+    fetcher.run_concurrently(get_page, range(12), concurrency=3)
+    assert 1 < stub.peak <= 3
+
+
+def test_requests_share_the_in_flight_budget(stub, monkeypatch):
+    monkeypatch.setattr(fetcher, "_in_flight", threading.BoundedSemaphore(2))
+    fetcher.run_concurrently(get_page, range(12), concurrency=6)
+    assert stub.peak <= 2
+
+
+def test_errors_reach_the_caller(stub):
+    def get_or_raise(index):
+        response = fetcher.fetch(f"{fetcher.VLR_ORIGIN}/{'fail' if index == 5 else 'page'}/{index}")
+        response.raise_for_status()
+        return response.text
+
+    with pytest.raises(requests.HTTPError):
+        fetcher.run_concurrently(get_or_raise, range(8), concurrency=4)
+    with pytest.raises(requests.HTTPError):
+        list(fetcher.imap_concurrently(get_or_raise, range(8), concurrency=4))
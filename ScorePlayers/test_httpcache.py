@@ -0,0 +1,110 @@
+"""
+The fetch cache against a local http.server stub: fresh entries are served
+without a request, stale ones are revalidated with their ETag and
+Last-Modified, the store stays under max_bytes by evicting the least
+recently used URL, and offline mode serves what is cached and raises
+CacheMiss for the rest.
+
+Run from this directory:
+
+    python -m pytest -q test_httpcache.py
+"""
+
+import itertools
+import types
+
+import pytest
+import requests
+
+import fetcher
+import httpcache
+from httpcache import CacheMiss, HttpCache
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Oct 2025 10:00:00 GMT"
+PAGE = b"<html>aspas</html>"
+
+
+def conditional(path):
+    """200 with an ETag and a Last-Modified date."""
+    return 200, PAGE, {"ETag": ETAG, "Last-Modified": LAST_MODIFIED}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """httpcache's time.time(), moved forward by hand."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(httpcache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def cache(stub_server, tmp_path, monkeypatch, clock):
+    cache = HttpCache(str(tmp_path / "cache"), ttl_rules=[], default_ttl=60)
+    monkeypatch.setattr(fetcher, "USE_CACHE", True)
+    monkeypatch.setattr(fetcher, "_cache", cache)
+    return cache
+
+
+def url(path):
+    return f"{fetcher.VLR_ORIGIN}{path}"
+
+
+def test_fresh_entries_skip_the_network(stub_server, cache, clock):
+    stub = stub_server(conditional)
+    assert fetcher.fetch(url("/player/1/a")).content == PAGE
+    clock[0] += 59
+    response = fetcher.fetch(url("/player/1/a"))
+    assert response.content == PAGE and response.from_cache
+    assert len(stub.paths) == 1
+
+
+def test_stale_entries_are_revalidated(stub_server, cache, clock):
+    def respond(path):
+        if len(stub.paths) > 1:
+            return 304, b"", {"ETag": ETAG}
+        return conditional(path)
+
+    stub = stub_server(respond)
+    fetcher.fetch(url("/player/1/a"))
+    clock[0] += 61
+    response = fetcher.fetch(url("/player/1/a"))
+    assert response.content == PAGE and response.from_cache
+    assert stub.headers[1]["If-None-Match"] == ETAG
+    assert stub.headers[1]["If-Modified-Since"] == LAST_MODIFIED
+    # The 304 restarted the TTL
+    clock[0] += 59
+    fetcher.fetch(url("/player/1/a"))
+    assert len(stub.paths) == 2
+
+
+def test_least_recently_used_urls_are_evicted(tmp_path, clock):
+    ticks = itertools.count()
+    clock[0] = 0.0
+    cache = HttpCache(str(tmp_path / "cache"), max_bytes=250)
+
+    def store(name):
+        clock[0] = next(ticks)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = name.encode("utf8") * 100
+        cache.store(url(f"/player/{name}"), response)
+
+    store("a")
+    store("b")
+    clock[0] = next(ticks)
+    cache.load(url("/player/a"), cache.lookup(url("/player/a")))
+    store("c")
+    assert cache.lookup(url("/player/a")) and cache.lookup(url("/player/c"))
+    assert cache.lookup(url("/player/b")) is None
+
+
+def test_offline_serves_the_cache_and_misses_loudly(stub_server, cache, clock, monkeypatch):
+    stub = stub_server(conditional)
+    fetcher.fetch(url("/player/1/a"))
+    monkeypatch.setattr(cache, "offline", True)
+    clock[0] += 10 * 24 * 3600
+    assert fetcher.fetch(url("/player/1/a")).content == PAGE
+    with pytest.raises(CacheMiss):
+        fetcher.fetch(url("/player/2/b"))
+    assert len(stub.paths) == 1
@@ -0,0 +1,66 @@
+"""
+write_players writes the same bytes json.dump(..., indent=2) did, wrapped or
+bare, empty or not, and iter_players reads every layout back, even when
+records and numbers straddle its read chunks.
+
+Run from this directory:
+
+    python -m pytest -q test_jsonio.py
+"""
+
+import json
+
+import pytest
+
+import jsonio
+from jsonio import iter_players, write_players
+
+PLAYERS = [
+    {"player_name": "aspas", "player_link": "www.vlr.gg/player/8480/aspas", "rating": "1.26",
+     "total_score": 61.25, "agents": [{"Jett": {"games_played": 12, "acs": "275.3"}}], "event_placements": []},
+    {"player_name": "Lé \"Ä\" 選手", "player_link": "www.vlr.gg/player/9/x", "total_score": 1234567890123, "role": None},
+    {},
+]
+
+
+def dumped(data):
+    return json.dumps(data, indent=2).encode("utf8")
+
+
+def read_bytes(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("players", [PLAYERS, PLAYERS[:1], []], ids=["several", "one", "none"])
+@pytest.mark.parametrize("wrap", [True, False], ids=["wrapped", "bare"])
+def test_default_layout_is_byte_identical_to_json_dump(tmp_path, players, wrap):
+    path = str(tmp_path / "players.json")
+    assert write_players(path, iter(players), compact=False, wrap=wrap) == len(players)
+    assert read_bytes(path) == dumped({"players": players} if wrap else players)
+
+
+@pytest.mark.parametrize("name, options", [
+    ("players.json", {"compact": False}),
+    ("players.json", {"compact": True}),
+    ("players.json", {"compact": True, "wrap": False}),
+    ("players.ndjson", {}),
+])
+def test_every_layout_reads_back_across_chunks(tmp_path, monkeypatch, name, options):
+    monkeypatch.setattr(jsonio, "CHUNK_SIZE", 7)
+    path = str(tmp_path / name)
+    write_players(path, PLAYERS, **options)
+    assert list(iter_players(path)) == PLAYERS
+
+
+def test_other_keys_around_players_are_skipped(tmp_path):
+    path = tmp_path / "players.json"
+    path.write_text(json.dumps({"league": "VCT", "players": PLAYERS, "count": 3}), encoding="utf8")
+    assert list(iter_players(str(path))) == PLAYERS
+
+
+def test_a_stage_can_rewrite_the_file_it_reads(tmp_path):
+    path = str(tmp_path / "players.json")
+    write_players(path, PLAYERS)
+    write_players(path, (dict(player, league="VCT") for player in iter_players(path)))
+    assert [player["league"] for player in iter_players(path)] == ["VCT"] * 3
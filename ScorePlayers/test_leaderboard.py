@@ -0,0 +1,68 @@
+"""
+Leaderboard rankings under single-player updates, merge_sorted_players
+against concatenate-and-sort, and rescoring that keeps each player at their
+best score across leagues.
+
+Run from this directory:
+
+    python -m pytest -q test_leaderboard.py
+"""
+
+import random
+
+import pytest
+
+import scoreplayers
+from leaderboard import Leaderboard, NotSorted, merge_sorted_players
+
+
+def player(pid, score, league="VCT-International", role="Duelist"):
+    return {"player_name": f"p{pid}", "player_link": f"www.vlr.gg/player/{pid}/p{pid}",
+            "total_score": score, "league": league, "role": role}
+
+
+def roles(p):
+    return [p["role"]]
+
+
+def test_rankings_follow_updates():
+    board = Leaderboard(roles, [player(1, 50), player(2, 40, role="IGL"), player(3, 30, league="VCT-Challengers")])
+    assert [p["player_name"] for p in board.top(2)] == ["p1", "p2"]
+    board.update(player(3, 60, league="VCT-Challengers"))
+    assert [p["player_name"] for p in board] == ["p3", "p1", "p2"]
+    assert board.rank(1) == 2 and board.rank(3, in_league=True) == 1
+    assert [p["player_name"] for p in board.top(league="VCT-International", role="IGL")] == ["p2"]
+    board.remove(1)
+    assert 1 not in board and len(board) == 2
+
+
+def test_merge_matches_a_stable_sort():
+    rng = random.Random(7)
+    streams = [sorted((player(index * 100 + i, rng.randint(0, 5)) for i in range(20)),
+                      key=lambda p: p["total_score"], reverse=True) for index in range(4)]
+    expected = sorted([p for stream in streams for p in stream], key=lambda p: p["total_score"], reverse=True)
+    assert list(merge_sorted_players(*streams)) == expected
+
+
+def test_merge_rejects_an_unsorted_stream():
+    with pytest.raises(NotSorted):
+        list(merge_sorted_players([player(1, 10), player(2, 20)]))
+
+
+def test_keep_best_across_leagues():
+    board = Leaderboard(roles)
+    assert board.keep_best(player(1, 50, league="VCT-International"))
+    assert not board.keep_best(player(1, 40, league="VCT-Challengers"))
+    assert board.get(1)["league"] == "VCT-International"
+    # The entry's own league is rescored in place, even downwards
+    assert board.keep_best(player(1, 30, league="VCT-International"))
+    assert board.get(1)["total_score"] == 30
+
+
+def test_rescore_player_does_not_overwrite_a_better_league(monkeypatch):
+    monkeypatch.setattr(scoreplayers, "score_players", lambda players, weights, fetch_missing: None)
+    board = Leaderboard(roles, [player(1, 50)])
+    scoreplayers.rescore_player(player(1, 20, league="VCT-Challengers"), board)
+    assert board.get(1)["total_score"] == 50
+    scoreplayers.rescore_player(player(1, 70, league="VCT-Challengers"), board)
+    assert board.get(1)["league"] == "VCT-Challengers"
@@ -0,0 +1,23 @@
+"""
+Prometheus text output: label values with backslashes, quotes and newlines
+are escaped, so a URL or error message cannot break the exposition format.
+
+Run from this directory:
+
+    python -m pytest -q test_metrics.py
+"""
+
+from metrics import Metrics
+
+NASTY = 'C:\\cache "hot"\nline'
+ESCAPED = 'C:\\\\cache \\"hot\\"\\nline'
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.count("fetch_total", error=NASTY)
+    metrics.observe("parse_seconds", 0.2, stage=NASTY)
+    text = metrics.prometheus()
+    assert f'fetch_total{{error="{ESCAPED}"}} 1' in text
+    assert f'parse_seconds_count{{stage="{ESCAPED}"}} 1' in text
+    assert all(line.count('"') % 2 == 0 for line in text.splitlines())
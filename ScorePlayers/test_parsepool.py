@@ -0,0 +1,78 @@
+"""
+The parser pool with two worker processes: records match inline parsing,
+and a pool whose workers die falls back to parsing on the calling thread,
+as it does for a script without an if __name__ == "__main__" guard.
+
+Run from this directory:
+
+    python -m pytest -q test_parsepool.py
+"""
+
+import glob
+import multiprocessing
+import os
+import subprocess
+import sys
+
+import pytest
+
+import parsepool
+from extract import parse_player_page
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAGES = sorted(glob.glob(os.path.join(HERE, "fixtures", "player", "*.html")))
+
+UNGUARDED_SCRIPT = """
+import parsepool
+from extract import parse_player_page
+parsepool.configure(workers=2)
+with open({page!r}, "rb") as file:
+    print(parsepool.parse(parse_player_page, file.read())[0]["team_href"])
+"""
+
+
+def die_in_worker(content):
+    """Kills a pool worker; on the calling thread it parses nothing and says so."""
+    if multiprocessing.parent_process() is not None:
+        os._exit(1)
+    return "inline"
+
+
+@pytest.fixture
+def two_workers():
+    workers, max_pending = parsepool.PARSE_WORKERS, parsepool.MAX_PENDING
+    parsepool.configure(workers=2)
+    yield
+    parsepool.configure(workers=workers, max_pending=max_pending)
+
+
+def test_pool_records_match_inline_parsing(two_workers):
+    for path in PAGES:
+        with open(path, "rb") as file:
+            content = file.read()
+        record, seconds, queued = parsepool.parse(parse_player_page, content)
+        assert record == parse_player_page(content)
+        assert seconds > 0 and queued >= 0
+    assert parsepool._pool is not None
+
+
+def test_broken_pool_falls_back_to_inline_parsing(two_workers):
+    assert parsepool.parse(die_in_worker, b"")[0] == "inline"
+    assert parsepool._broken
+    with open(PAGES[0], "rb") as file:
+        content = file.read()
+    assert parsepool.parse(parse_player_page, content)[0] == parse_player_page(content)
+
+
+def test_script_without_main_guard_still_parses(tmp_path):
+    script = tmp_path / "unguarded.py"
+    script.write_text(UNGUARDED_SCRIPT.format(page=PAGES[0]))
+    with open(PAGES[0], "rb") as file:
+        team_href = parse_player_page(file.read())["team_href"]
+    result = subprocess.run(
+        [sys.executable, str(script)], cwd=tmp_path, capture_output=True, text=True, timeout=120,
+        env={**os.environ, "PYTHONPATH": HERE},
+    )
+    assert result.returncode == 0, result.stderr
+    assert "parsing pages inline" in result.stdout
+    assert result.stdout.strip().endswith(team_href)
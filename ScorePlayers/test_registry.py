@@ -0,0 +1,70 @@
+"""
+Stages join players on the registry's key: the vlr.gg id, or the normalized
+link for a link without one. A renamed player resolves to the same key from
+an earlier link, and id-less links only match the same link.
+
+Run from this directory:
+
+    python -m pytest -q test_registry.py
+"""
+
+from checkpoint import Journal
+from filt_gc_chall_players import iter_filtered_challengers
+from registry import PlayerRegistry, link_key, unique_players
+
+
+def player(name, link):
+    return {"player_name": name, "player_link": link}
+
+
+def test_link_key_is_the_id_or_the_normalized_link():
+    assert link_key("www.vlr.gg/player/8480/aspas") == 8480
+    assert link_key("https://www.vlr.gg/player/8480/oldname/") == 8480
+    assert link_key("https://www.vlr.gg/player/unknown/") == "www.vlr.gg/player/unknown"
+    assert link_key("") is None
+
+
+def test_id_less_links_only_match_the_same_link():
+    players = [
+        player("a", "www.vlr.gg/player/unknown"),
+        player("a again", "https://www.vlr.gg/player/unknown/"),
+        player("b", "www.vlr.gg/player/other"),
+    ]
+    assert [p["player_name"] for p in unique_players(players)] == ["a", "b"]
+
+
+def test_earlier_links_resolve_to_the_id(tmp_path):
+    path = str(tmp_path / "registry.json")
+    registry = PlayerRegistry(path)
+    registry.register(player("aspas", "www.vlr.gg/player/8480/aspas"))
+    registry.save()
+
+    registry = PlayerRegistry(path)
+    assert registry.key(player("aspas", "www.vlr.gg/player/8480/aspas")) == 8480
+    registry.register(player("aspas2", "www.vlr.gg/player/8480/aspas2"))
+    assert registry.get(8480)["old_links"] == ["www.vlr.gg/player/8480/aspas"]
+    assert registry.link_key("https://www.vlr.gg/player/8480/aspas/") == 8480
+
+
+def test_journal_replaces_a_renamed_players_entry(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    registry = PlayerRegistry()
+    journal = Journal(str(path), key=registry.key)
+    renamed = player("aspas2", "www.vlr.gg/player/8480/aspas2")
+    journal.record("step1", player("aspas", "www.vlr.gg/player/8480/aspas"), {"role": "Duelist"})
+    journal.record("step1", renamed, {"role": "IGL"})
+    journal.finish()
+    assert len(path.read_text().splitlines()) == 2  # One entry and the run_completed event
+
+    journal = Journal(str(path), incremental=True, key=registry.key)
+    assert journal.lookup("step1", renamed) == {"role": "IGL"}
+    journal.finish()
+
+
+def test_challengers_filter_matches_id_less_links():
+    international = [player("intl", "www.vlr.gg/player/unknown")]
+    challengers = [player("same", "https://www.vlr.gg/player/unknown/"), player("other", "www.vlr.gg/player/other")]
+    stats = {}
+    kept = list(iter_filtered_challengers(challengers, international, [], stats))
+    assert [p["player_name"] for p in kept] == ["other"]
+    assert [p["name"] for p in stats["removed_international"]] == ["same"]
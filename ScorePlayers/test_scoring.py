@@ -0,0 +1,76 @@
+"""
+Parity of the batch scorer (score_players) with the scalar one (score_player).
+
+Run from this directory:
+
+    python -m pytest -q test_scoring.py
+"""
+
+import copy
+import random
+from datetime import datetime
+
+from scoreplayers import AGENT_ROLES, check_scoring_parity, score_player, score_players
+
+YEAR = datetime.now().year
+SCORED_FIELDS = ("rating_score", "agent_flexibility", "experience", "total_score")
+
+# Bucket edges, the gaps between buckets, out-of-range values and unparseable ratings
+RATINGS = ["0.39", "0.395", "0.40", "1.29", "1.295", "1.30", "1.40", "1.41", "-0.2", "nan", "", "abc"]
+
+EVENTS = [
+    ("Valorant Champions", "Playoffs"),
+    ("Champions Tour Masters", "Main Event"),
+    ("Champions Tour Stage 1", "Playoffs"),
+    ("Champions Tour Stage 2", "Group Stage"),
+    ("Challengers League", "Main Event"),
+    ("Game Changers Championship", "Main Event"),
+    ("Open Qualifier", "Main Event"),
+]
+PLACEMENTS = ["1st", "2nd", "3rd", "4th", "5th-8th"]
+
+
+def make_players(count=500, seed=7):
+    """Players cycling through RATINGS with rated and unrated agents and placements from two years."""
+    rng = random.Random(seed)
+    agent_names = [agent for agents in AGENT_ROLES.values() for agent in agents] + ["Tejo"]
+    players = []
+    for index in range(count):
+        agents = []
+        for name in rng.sample(agent_names, rng.randint(0, 5)):
+            rating = rng.choice([f"{rng.uniform(0.5, 1.5):.2f}", "", "n/a"])
+            agents.append({name: {"games_played": rng.randint(1, 40), "rating": rating}})
+        placements = [
+            {
+                "event": event + stage,
+                "placement": rng.choice(PLACEMENTS),
+                "year": rng.choice([YEAR, YEAR - 1]),
+            }
+            for event, stage in rng.sample(EVENTS, rng.randint(0, 3))
+        ]
+        players.append({
+            "player_name": f"player{index}",
+            "player_link": f"www.vlr.gg/player/{index}/player{index}",
+            "rating": RATINGS[index % len(RATINGS)],
+            "role": "igl" if index % 5 == 0 else "",
+            "agents": agents,
+            "event_placements": placements,
+        })
+    return players
+
+
+def test_batch_scores_match_scalar_scores():
+    assert check_scoring_parity(make_players(), year=YEAR) == []
+
+
+def test_batch_scores_have_scalar_types():
+    players = make_players()
+    batch = score_players(copy.deepcopy(players), year=YEAR, fetch_missing=False)
+    for original, batched in zip(players, batch):
+        scalar = copy.deepcopy(original)
+        score_player(scalar)
+        for field in SCORED_FIELDS:
+            assert (field in batched) == (field in scalar), (original["player_name"], field)
+            if field in scalar:
+                assert type(batched[field]) is type(scalar[field]), (original["player_name"], field)
+                assert batched[field] == scalar[field], (original["player_name"], field)
@@ -0,0 +1,87 @@
+"""
+Pipeline stages against a local stub of vlr.gg. Step 1 tags a player as IGL
+only when their id matches the team captain's. In steps 2 and 3 one player's
+page keeps failing: that player is logged and left out, and the rest of the
+league is still scraped, journaled and scored.
+
+Run from this directory:
+
+    python -m pytest -q test_stages.py
+"""
+
+import os
+
+import pytest
+
+import scoreplayers
+from checkpoint import Journal
+from jsonio import iter_players, write_players
+
+FIXTURE_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "player", "aspas.html")
+FAILING = "/player/2/"
+
+
+@pytest.fixture
+def league(stub_server, tmp_path, monkeypatch):
+    """Three players in a league file; player 2's page answers 500."""
+    with open(FIXTURE_PAGE, "rb") as file:
+        page = file.read()
+    stub_server(lambda path: (500, b"") if path.startswith(FAILING) else (200, page))
+    monkeypatch.chdir(tmp_path)
+    scoreplayers.clear_page_records()
+    players = [
+        {"player_name": f"player{index}", "player_link": f"www.vlr.gg/player/{index}/player{index}", "rating": "1.10"}
+        for index in (1, 2, 3)
+    ]
+    write_players("players_test.json", players)
+    yield "players_test.json"
+    scoreplayers.clear_page_records()
+
+
+def team_page(captain_href):
+    return (f'<html><body><a href="{captain_href}"><div>captain<i title="Team Captain"></i></div></a>'
+            '<a href="/player/8/teammate"><div>teammate</div></a></body></html>').encode("utf8")
+
+
+@pytest.mark.parametrize("captain_href, player_link, igl", [
+    ("/player/7/kingg", "www.vlr.gg/player/7/oldname", True),
+    ("/player/7/kingg", "www.vlr.gg/player/8/teammate", False),
+    # Neither link has an id, which must not count as a match
+    ("/player/captain", "www.vlr.gg/player/unknown", False),
+])
+def test_step1_matches_the_captain_by_id(stub_server, tmp_path, monkeypatch, captain_href, player_link, igl):
+    with open(FIXTURE_PAGE, "rb") as file:
+        page = file.read()
+    stub_server(lambda path: (200, team_page(captain_href) if path.startswith("/team/") else page))
+    monkeypatch.chdir(tmp_path)
+    scoreplayers.clear_page_records()
+    write_players("players_test.json", [{"player_name": "player", "player_link": player_link}])
+    scoreplayers.step1_process_initial_data("players_test.json", "VCT-International", concurrency=1)
+    scoreplayers.clear_page_records()
+    assert next(iter_players("players_test.json"))["role"] == ("igl" if igl else "")
+
+
+def test_step2_skips_a_failing_player(league):
+    journal = Journal(path="pipeline_journal.jsonl", resume=False)
+    scoreplayers.step2_process_player_stats(league, scoreplayers.AGENTS_TABLE_XPATH, concurrency=2, journal=journal)
+    players = {player["player_name"]: player for player in iter_players(league)}
+    assert players["player1"]["agents"] and players["player3"]["agents"]
+    assert "agents" not in players["player2"]
+    # Left unjournaled, so a resumed run fetches player 2 again
+    assert journal.lookup("step2", players["player1"]) is not None
+    assert journal.lookup("step2", players["player2"]) is None
+    journal.finish()
+
+
+def test_step3_scores_the_rest_of_the_league(league):
+    players = list(iter_players(league))
+    for player in players:
+        # Agents from an earlier step 2 but no saved placements, so step 3 fetches every page
+        player["agents"] = [{"Jett": {"games_played": 10, "rating": "1.10"}}]
+    write_players(league, players)
+    scoreplayers.step3_calculate_final_scores(league, "players_scored_test.json", concurrency=2)
+    scored = {player["player_name"]: player for player in iter_players("players_scored_test.json")}
+    assert set(scored) == {"player1", "player2", "player3"}
+    assert scored["player1"]["event_placements"] and scored["player3"]["event_placements"]
+    assert "event_placements" not in scored["player2"]
+    assert all("total_score" in player for player in scored.values())
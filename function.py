@@ -6,84 +6,773 @@ requirements: llama_index, sqlalchemy, mysql-connector, psycopg2-binary, llama_i
 """
 
 from pydantic import BaseModel, Field
-from typing import Union, Generator, Iterator, Optional
+from typing import Union, Generator, Iterator, Optional, AsyncGenerator
 import os
+import json
+import hashlib
 import sqlite3
 
 import requests
-from langchain_community.utilities.sql_database import SQLDatabase
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
-from sqlalchemy import create_engine
 from open_webui.utils.misc import get_last_user_message
-from langchain_aws import ChatBedrock
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain_community.tools.sql_database.tool import (
-    InfoSQLDatabaseTool,
-    ListSQLDatabaseTool,
-    QuerySQLCheckerTool,
-    QuerySQLDataBaseTool,
-)
-from langchain import hub
-from langgraph.prebuilt import create_react_agent
 import os.path
 from pathlib import Path
 import time
-from collections import deque
-from datetime import datetime, timedelta
+import asyncio
+import functools
+from collections import OrderedDict, deque
 import threading
+import logging
+
+# langchain, langgraph, sqlalchemy and boto3 take seconds to import, so they are
+# imported when the agent is first built rather than when Open WebUI loads the pipe.
 
 # If you need to see where the SQL query is failing, uncomment the line below
 # llama_index.core.set_global_handler("simple")
 
+PLAYERS_DB = "data/players.db"
+DB_MISSING = "players.db not found: build it with ScorePlayers/build_players_db.py, then ask again."
+
+log = logging.getLogger(__name__)
+
+# PipeMetrics events are logged at INFO, which Open WebUI only shows when its
+# log level is INFO or lower. PIPE_EVENTS_LOG names a file that receives them
+# as plain JSON lines regardless of that level.
+events_log = logging.getLogger(f"{__name__}.events")
+if os.getenv("PIPE_EVENTS_LOG") and not events_log.handlers:
+    _events_handler = logging.FileHandler(os.getenv("PIPE_EVENTS_LOG"), encoding="utf8")
+    _events_handler.setFormatter(logging.Formatter("%(message)s"))
+    events_log.addHandler(_events_handler)
+    events_log.setLevel(logging.INFO)
+
+# Status shown in the chat while the agent is using each SQL tool
+TOOL_STATUS = {
+    "sql_db_list_tables": "Listing tables",
+    "sql_db_schema": "Querying schema",
+    "sql_db_query_checker": "Checking SQL",
+    "sql_db_query": "Running SQL",
+}
+
+
+def file_version(path: str) -> Optional[tuple]:
+    """(mtime, size) of a file, changing whenever it is rebuilt; None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def message_text(content) -> str:
+    """Text of a message or message chunk; Bedrock may return a list of content blocks."""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "")
+        for block in content
+        if isinstance(block, dict) and block.get("type") == "text"
+    )
+
+
+class CallRateLimiter:
+    """
+    Allows at most max_calls calls in any `period` second window.
+
+    Each caller reserves the next free slot under the lock and then waits for
+    it outside the lock, so slots are handed out in arrival order (FIFO) and
+    no caller holds the lock while sleeping. wait() blocks the calling thread;
+    wait_async() awaits on the event loop instead, and gives its slot back if
+    it is cancelled before the slot starts.
+    """
+
+    def __init__(self, max_calls: int, period: float = 60.0):
+        self.max_calls = max_calls
+        self.period = period
+        self._slots = deque()  # Monotonic start times of reserved calls, ascending
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _reserve(self) -> tuple:
+        """Reserve the next slot and return it with how many seconds until it starts."""
+        with self._lock:
+            now = time.monotonic()
+            while self._slots and self._slots[0] <= now - self.period:
+                self._slots.popleft()
+            slot = now
+            if self._slots:
+                # Never jump ahead of a caller that is already waiting
+                slot = max(slot, self._slots[-1])
+            if len(self._slots) >= self.max_calls:
+                slot = max(slot, self._slots[-self.max_calls] + self.period)
+            self._slots.append(slot)
+            self.calls += 1
+            delay = slot - now
+            if delay > 0:
+                self.waiting += 1
+            self.total_wait += delay
+            self.max_wait = max(self.max_wait, delay)
+            return slot, delay
+
+    def _release(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def _refund(self, slot: float, delay: float):
+        """Give back a slot that was never used, as if it had not been reserved."""
+        with self._lock:
+            try:
+                self._slots.remove(slot)
+            except ValueError:
+                return  # Already expired out of the window
+            self.calls -= 1
+            self.total_wait -= delay
+
+    def wait(self) -> float:
+        """Block until this call's slot; returns the seconds waited."""
+        _, delay = self._reserve()
+        if delay > 0:
+            try:
+                time.sleep(delay)
+            finally:
+                self._release()
+        return max(delay, 0.0)
+
+    async def wait_async(self) -> float:
+        slot, delay = self._reserve()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._refund(slot, delay)
+                raise
+            finally:
+                self._release()
+        return max(delay, 0.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "queue_depth": self.waiting,
+                "avg_wait_seconds": round(self.total_wait / self.calls, 3) if self.calls else 0.0,
+                "max_wait_seconds": round(self.max_wait, 3),
+            }
+
+
+class PipeMetrics:
+    """
+    Counters and histograms for the pipe, exported in the Prometheus text
+    format, plus one JSON log line per event on the events_log logger (set
+    PIPE_EVENTS_LOG to get them without INFO logging).
+
+    Histograms are in seconds unless their name is in COUNT_HISTOGRAMS.
+    """
+
+    SECONDS_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+    COUNT_HISTOGRAMS = {"pipe_tool_calls_per_question"}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [cumulative bucket counts..., count, sum]
+
+    def buckets(self, name: str) -> tuple:
+        return self.COUNT_BUCKETS if name in self.COUNT_HISTOGRAMS else self.SECONDS_BUCKETS
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self.buckets(name)
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [0] * (len(buckets) + 2))
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += 1
+            histogram[-1] += value
+
+    @staticmethod
+    def event(kind: str, **fields):
+        events_log.info(json.dumps({"event": kind, **fields}, separators=(",", ":"), default=str))
+
+    @staticmethod
+    def _labels(labels: tuple) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{name}="{PipeMetrics._escape(value)}"' for name, value in labels) + "}"
+
+    @staticmethod
+    def _escape(value) -> str:
+        """A label value in the text format: backslash, double quote and newline escaped."""
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def prometheus(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bound, cumulative in zip(self.buckets(name), histogram):
+                lines.append(f"{name}_bucket{self._labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{self._labels(labels + (('le', '+Inf'),))} {histogram[-2]}")
+            lines.append(f"{name}_sum{self._labels(labels)} {round(histogram[-1], 6)}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram[-2]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Atomically rewrite the text file a Prometheus textfile collector reads."""
+        if not path:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf8") as file:
+            file.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+
+def token_usage(messages) -> tuple:
+    """(input, output) tokens reported in the usage_metadata of messages or message chunks."""
+    input_tokens = output_tokens = 0
+    for message in messages:
+        usage = getattr(message, "usage_metadata", None) or {}
+        input_tokens += usage.get("input_tokens", 0)
+        output_tokens += usage.get("output_tokens", 0)
+    return input_tokens, output_tokens
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are interrupted once `deadline` (monotonic) has passed."""
+
+    deadline = None
+
+    def past_deadline(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+
+class ResultShaper:
+    """
+    Encodes a query result as compact JSON within a token budget: the column
+    names once, then each row as an array. Rows past the row or token budget
+    are replaced by a summary of what was left out: how many rows, the range
+    and mean of numeric columns and the most common values of the others.
+    Tokens are estimated at CHARS_PER_TOKEN characters each.
+    """
+
+    CHARS_PER_TOKEN = 4
+    TOP_VALUES = 5
+
+    def __init__(self, max_tokens: int, max_rows: int = 50):
+        self.max_chars = max_tokens * self.CHARS_PER_TOKEN
+        self.max_rows = max_rows
+
+    @staticmethod
+    def compact(value):
+        return round(value, 4) if isinstance(value, float) else value
+
+    def shape(self, columns: list, rows: list, more_rows: bool = False) -> str:
+        rows = [[self.compact(value) for value in row] for row in rows]
+        result = {"columns": columns, "rows": []}
+        # Leave room for the summary of whatever does not fit
+        budget = self.max_chars * 3 // 4 - len(json.dumps(result, default=str))
+        for row in rows[: self.max_rows]:
+            budget -= len(json.dumps(row, default=str)) + 1
+            if budget < 0:
+                break
+            result["rows"].append(row)
+        omitted = rows[len(result["rows"]) :]
+        if omitted or more_rows:
+            result["omitted_rows"] = f"{len(omitted)}+" if more_rows else len(omitted)
+            result["omitted_summary"] = self.summarize(columns, omitted)
+            while len(json.dumps(result, default=str)) > self.max_chars and result["omitted_summary"]:
+                result["omitted_summary"].popitem()
+        return json.dumps(result, default=str, separators=(",", ":"))
+
+    def summarize(self, columns: list, rows: list) -> dict:
+        summary = {}
+        for index, column in enumerate(columns):
+            values = [row[index] for row in rows if row[index] is not None]
+            if not values:
+                continue
+            if all(isinstance(value, (int, float)) for value in values):
+                summary[column] = {
+                    "min": min(values),
+                    "max": max(values),
+                    "mean": self.compact(sum(values) / len(values)),
+                }
+            else:
+                counts = {}
+                for value in values:
+                    counts[str(value)] = counts.get(str(value), 0) + 1
+                summary[column] = {"distinct": len(counts)}
+                if len(counts) < len(values):
+                    # Most common values, unless every value is unique
+                    summary[column]["top"] = sorted(counts.items(), key=lambda item: -item[1])[: self.TOP_VALUES]
+        return summary
+
+
+class SchemaSnapshot:
+    """
+    In-memory copy of what the schema tools report for a SQLite database:
+    each table's CREATE statement, a few sample rows, and the distinct values
+    of low-cardinality text columns such as player_league. Rebuilt only when
+    the database file's size or modification time changes; a database that
+    has not been built yet has version None and no tables.
+    """
+
+    SAMPLE_ROWS = 3
+    MAX_DISTINCT = 10
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._version = None
+        self._tables = {}  # Table name -> description
+
+    def version(self) -> Optional[tuple]:
+        return file_version(self.path)
+
+    def refresh(self) -> dict:
+        version = self.version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._tables = self._describe() if version is not None else {}
+                    self._version = version
+        return self._tables
+
+    def list_tables(self, tool_input: str = "") -> str:
+        return ", ".join(self.refresh())
+
+    def info(self, table_names: str) -> str:
+        tables = self.refresh()
+        names = [name.strip() for name in table_names.split(",") if name.strip()]
+        missing = [name for name in names if name not in tables]
+        if missing:
+            return f"Error: table_names {set(missing)} not found in database"
+        return "\n\n".join(tables[name] for name in names)
+
+    def text(self) -> str:
+        return "\n\n".join(self.refresh().values())
+
+    def _describe(self) -> dict:
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            rows = connection.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view') "
+                "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            ).fetchall()
+            return {name: self._describe_table(connection, name, sql) for name, sql in rows}
+        finally:
+            connection.close()
+
+    def _describe_table(self, connection, name: str, sql: str) -> str:
+        columns = [(row[1], row[2].upper()) for row in connection.execute(f'PRAGMA table_info("{name}")')]
+        rows = connection.execute(f'SELECT * FROM "{name}" LIMIT {self.SAMPLE_ROWS}').fetchall()
+        lines = [sql.strip(), "", "/*", f"{len(rows)} rows from {name} table:"]
+        lines.append("\t".join(column for column, _ in columns))
+        lines.extend("\t".join(str(value)[:100] for value in row) for row in rows)
+        lines.append("*/")
+        for column, type_ in columns:
+            if type_ and "CHAR" not in type_ and "TEXT" not in type_:
+                continue
+            values = [
+                row[0]
+                for row in connection.execute(
+                    f'SELECT DISTINCT "{column}" FROM "{name}" WHERE "{column}" IS NOT NULL '
+                    f"LIMIT {self.MAX_DISTINCT + 1}"
+                )
+            ]
+            if 0 < len(values) <= self.MAX_DISTINCT:
+                lines.append(f"-- {name}.{column} values: {json.dumps(values)}")
+        return "\n".join(lines)
+
+
+class AnswerCache:
+    """
+    LRU cache of final answers keyed on the normalized conversation and the
+    database version, so a repeated question is answered without running the
+    agent or spending any Bedrock calls. Entries expire after ttl seconds.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # Key -> (expires at, answer)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(messages: list, version) -> str:
+        conversation = [
+            [
+                message.get("role"),
+                " ".join(message["content"].lower().split())
+                if isinstance(message.get("content"), str)
+                else message.get("content"),
+            ]
+            for message in messages
+        ]
+        payload = json.dumps([conversation, version], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, answer: str):
+        if self.max_entries <= 0 or self.ttl <= 0 or not answer:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+# Lowercase agent names by role, matching the Valorant knowledge in the system prompt
+AGENT_ROLES = {
+    "duelist": {"jett", "yoru", "reyna", "phoenix", "raze", "neon", "iso"},
+    "initiator": {"sova", "fade", "skye", "breach", "kayo", "gekko"},
+    "controller": {"brimstone", "viper", "omen", "astra", "harbor", "clove"},
+    "sentinel": {"cypher", "killjoy", "sage", "deadlock", "chamber", "vyse"},
+}
+AGENT_ROLES["scan initiator"] = {"sova", "fade", "skye"}
+AGENT_ROLES["flash initiator"] = {"skye", "breach", "kayo", "gekko"}
+AGENT_ALIASES = {"brim": "brimstone", "gecko": "gekko", "kay/o": "kayo"}
+
+# The example meta compositions from the system prompt plus the standard role layouts
+META_COMPOSITIONS = [
+    "jett, omen, killjoy, sova, kayo",
+    "raze, brimstone, skye, gekko, viper",
+    "raze, omen, cypher, gekko, kayo/sova",
+    "neon, astra, chamber, fade, yoru",
+    "jett, viper, sova, cypher, kayo/skye",
+    "jett, astra, cypher, kayo, sova",
+    "duelist, controller, sentinel, initiator, initiator",
+    "duelist, controller, controller, initiator, initiator",
+    "duelist, duelist, controller, sentinel, initiator",
+]
+
 
-class RateLimitedChatBedrock(ChatBedrock):
+class TeamBuilder:
     """
-    A rate-limited version of ChatBedrock that ensures no more than N
-    API calls are made within any 60 second window.
+    Picks the five players with the highest summed total_score for a
+    composition under the team rules of the system prompt: exactly one IGL,
+    and every other player needs an agent for their slot among their three
+    most played agents (IGLs may play any agent). Branch and bound over
+    per-slot candidate lists; player data is reloaded when the database
+    file changes. Each build's duration is recorded in `metrics`.
     """
 
-    def __init__(self, max_calls_per_minute: int = 4, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._max_calls = max_calls_per_minute
-        self._calls = deque()  # Stores timestamps of API calls
-        self._lock = threading.Lock()  # Thread-safe lock for managing calls deque
+    TEAM_SIZE = 5
+    TOP_AGENTS = 3
 
-    def _enforce_rate_limit(self):
-        """Enforces the rate limit by waiting if necessary."""
-        current_time = datetime.now()
+    PLAYERS_SQL = """
+        SELECT Players.player_id, player_name, player_league, igl, total_score, top_agents.agent
+        FROM Players LEFT JOIN (
+            SELECT player_id, agent, agent_rank FROM (
+                SELECT player_id, agent,
+                       ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY games_played DESC, agent) AS agent_rank
+                FROM Agents
+            ) WHERE agent_rank <= ?
+        ) AS top_agents USING (player_id)
+        ORDER BY total_score DESC, Players.player_id, top_agents.agent_rank
+    """
+
+    def __init__(self, path: str, metrics: Optional[PipeMetrics] = None):
+        self.path = path
+        self.metrics = metrics or PipeMetrics()
+        self._lock = threading.Lock()
+        self._version = None
+        self._players = []
 
+    def players(self) -> list:
+        version = file_version(self.path)
         with self._lock:
-            # Remove timestamps older than 1 minute
-            while self._calls and current_time - self._calls[0] > timedelta(minutes=1):
-                self._calls.popleft()
-
-            # If we've reached the rate limit, wait until we can make another call
-            if len(self._calls) >= self._max_calls:
-                wait_time = (
-                    self._calls[0] + timedelta(minutes=1) - current_time
-                ).total_seconds()
-                if wait_time > 0:
-                    time.sleep(wait_time)
-                    # After waiting, remove old timestamps again
-                    current_time = datetime.now()
-                    while self._calls and current_time - self._calls[0] > timedelta(
-                        minutes=1
-                    ):
-                        self._calls.popleft()
-
-            # Add current timestamp to the queue
-            self._calls.append(current_time)
-
-    def invoke(self, *args, **kwargs):
-        """Override invoke to add rate limiting."""
-        self._enforce_rate_limit()
-        return super().invoke(*args, **kwargs)
-
-    def generate(self, *args, **kwargs):
-        """Override generate to add rate limiting."""
-        self._enforce_rate_limit()
-        return super().generate(*args, **kwargs)
+            if version != self._version:
+                self._players = self._load() if version is not None else []
+                self._version = version
+            return self._players
+
+    def _load(self) -> list:
+        players = {}
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            for player_id, name, league, igl, score, agent in connection.execute(
+                self.PLAYERS_SQL, (self.TOP_AGENTS,)
+            ):
+                player = players.setdefault(
+                    player_id,
+                    {
+                        "player_id": player_id,
+                        "player_name": name,
+                        "player_league": league,
+                        "igl": str(igl).lower() == "true",
+                        "total_score": score or 0.0,
+                        "agents": [],
+                    },
+                )
+                if agent:
+                    player["agents"].append(agent.lower())
+        finally:
+            connection.close()
+        return list(players.values())
+
+    @staticmethod
+    def slot_agents(slot: str) -> set:
+        """Agents that can fill a slot given as a role, an agent, or alternatives like "kayo/sova"."""
+        slot = slot.strip().lower()
+        if slot in AGENT_ROLES:
+            return AGENT_ROLES[slot]
+        agents = set()
+        for name in slot.replace("kay/o", "kayo").split("/"):
+            name = AGENT_ALIASES.get(name.strip(), name.strip())
+            agents |= AGENT_ROLES.get(name, {name})
+        return agents
+
+    def best_team(self, slots: list, league: Optional[str] = None) -> Optional[dict]:
+        players = [
+            player
+            for player in self.players()
+            if league is None or (player["player_league"] or "").lower() == league.lower()
+        ]
+        # Only the top len(slots) IGLs and non-IGLs per slot can be in an optimal team:
+        # any lower one could be swapped for an unused better one of the same kind
+        options = []
+        for slot in slots:
+            agents = self.slot_agents(slot)
+            igls, others = [], []
+            for player in players:
+                playable = [agent for agent in player["agents"] if agent in agents]
+                if player["igl"] and len(igls) < len(slots):
+                    igls.append((player, playable or player["agents"]))
+                elif not player["igl"] and playable and len(others) < len(slots):
+                    others.append((player, playable))
+                if len(igls) == len(others) == len(slots):
+                    break
+            options.append(sorted(igls + others, key=lambda option: -option[0]["total_score"]))
+        order = sorted(range(len(slots)), key=lambda index: len(options[index]))
+        # bounds[depth] = best possible score of the slots not yet filled
+        bounds = [0.0] * (len(order) + 1)
+        for depth in range(len(order) - 1, -1, -1):
+            slot_options = options[order[depth]]
+            bounds[depth] = bounds[depth + 1] + (slot_options[0][0]["total_score"] if slot_options else float("-inf"))
+
+        best = {"score": float("-inf"), "picks": None}
+        picks = [None] * len(slots)
+        used = set()
+
+        def search(depth, score, igl_used):
+            if score + bounds[depth] <= best["score"]:
+                return
+            if depth == len(order):
+                if igl_used:
+                    best["score"] = score
+                    best["picks"] = list(picks)
+                return
+            slot = order[depth]
+            for player, playable in options[slot]:
+                if player["player_id"] in used or (player["igl"] and igl_used):
+                    continue
+                used.add(player["player_id"])
+                picks[slot] = (player, playable)
+                search(depth + 1, score + player["total_score"], igl_used or player["igl"])
+                used.discard(player["player_id"])
+            picks[slot] = None
+
+        search(0, 0.0, False)
+        if best["picks"] is None:
+            return None
+        return {
+            "composition": [slot.strip() for slot in slots],
+            "total_score": round(best["score"], 2),
+            "players": [
+                {
+                    "slot": slot.strip(),
+                    "player_id": player["player_id"],
+                    "player_name": player["player_name"],
+                    "player_league": player["player_league"],
+                    "igl": player["igl"],
+                    "agents": playable,
+                    "total_score": player["total_score"],
+                }
+                for slot, (player, playable) in zip(slots, best["picks"])
+            ],
+        }
+
+    def build(self, league: Optional[str] = None, composition: Optional[str] = None) -> str:
+        """
+        Build the highest scoring valid team: 5 players, exactly one IGL, and
+        every other player has an agent for their slot in their top 3 most
+        played agents. league: "VCT-International", "VCT-Game-Changers" or
+        "VCT-Challengers"; omit for any league. composition: 5 comma-separated
+        slots, each a role (duelist, initiator, controller, sentinel), an
+        agent (jett) or alternatives (kayo/sova); omit to try the meta
+        compositions and return the best three teams.
+        """
+        started = time.perf_counter()
+        if file_version(self.path) is None:
+            return f"Error: {DB_MISSING}"
+        if composition:
+            compositions = [composition]
+        else:
+            compositions = META_COMPOSITIONS
+        teams = []
+        for candidate in compositions:
+            slots = [slot for slot in candidate.split(",") if slot.strip()]
+            if len(slots) != self.TEAM_SIZE:
+                return f"Error: a composition needs {self.TEAM_SIZE} slots, got {len(slots)}"
+            team = self.best_team(slots, league)
+            if team:
+                teams.append(team)
+        teams.sort(key=lambda team: -team["total_score"])
+        seconds = time.perf_counter() - started
+        self.metrics.observe("pipe_team_build_seconds", seconds)
+        self.metrics.event(
+            "build_team", league=league, compositions=len(compositions), teams=len(teams),
+            seconds=round(seconds, 4),
+        )
+        if not teams:
+            return "No valid team: not enough players with the required agents and an IGL in this league"
+        return json.dumps({"league": league or "any", "teams": teams[:3]}, separators=(",", ":"))
+
+
+@functools.lru_cache(maxsize=None)
+def rate_limited_chat_bedrock():
+    """The RateLimitedChatBedrock class, defined on first use so langchain_aws is only imported then."""
+    from langchain_aws import ChatBedrock
+    from langchain_core.runnables.config import run_in_executor
+
+    class RateLimitedChatBedrock(ChatBedrock):
+        """
+        A rate-limited version of ChatBedrock that ensures no more than N
+        API calls are made within any 60 second window.
+
+        The limit is applied in the low-level _generate/_stream hooks, so every
+        entry point (invoke, generate, stream, batch and their async versions)
+        counts exactly once per model call. The Bedrock client is synchronous, so
+        the async hooks wait on the event loop and then run the call in the
+        default executor. Each call's limiter wait, latency and token counts
+        are recorded in `metrics`.
+        """
+
+        def __init__(self, max_calls_per_minute: int = 4, metrics: Optional[PipeMetrics] = None, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._limiter = CallRateLimiter(max_calls_per_minute, 60.0)
+            self._metrics = metrics or PipeMetrics()
+
+        def rate_limit_stats(self) -> dict:
+            """Calls made, callers currently queued and how long they have waited."""
+            return self._limiter.stats()
+
+        def _record(self, mode: str, waited: float, started: float, messages: list):
+            seconds = time.perf_counter() - started
+            input_tokens, output_tokens = token_usage(messages)
+            self._metrics.observe("pipe_rate_limit_wait_seconds", waited)
+            self._metrics.observe("pipe_bedrock_seconds", seconds, mode=mode)
+            self._metrics.count("pipe_tokens_total", input_tokens, direction="input")
+            self._metrics.count("pipe_tokens_total", output_tokens, direction="output")
+            self._metrics.event(
+                "bedrock_call", mode=mode, wait_seconds=round(waited, 3), seconds=round(seconds, 3),
+                input_tokens=input_tokens, output_tokens=output_tokens,
+            )
+
+        def _generate(self, *args, **kwargs):
+            waited = self._limiter.wait()
+            started = time.perf_counter()
+            result = super()._generate(*args, **kwargs)
+            self._record("generate", waited, started, [generation.message for generation in result.generations])
+            return result
+
+        def _stream(self, *args, **kwargs):
+            waited = self._limiter.wait()
+            started = time.perf_counter()
+            chunks = []
+            try:
+                for chunk in super()._stream(*args, **kwargs):
+                    chunks.append(chunk.message)
+                    yield chunk
+            finally:
+                self._record("stream", waited, started, chunks)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            waited = await self._limiter.wait_async()
+            started = time.perf_counter()
+            # The sync hooks call callbacks synchronously, so they get the sync manager
+            # (as BaseChatModel's own async fallbacks do); the async one would return
+            # unawaited coroutines and drop every token callback
+            result = await run_in_executor(
+                None, super()._generate, messages, stop, run_manager.get_sync() if run_manager else None, **kwargs
+            )
+            self._record("generate", waited, started, [generation.message for generation in result.generations])
+            return result
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            waited = await self._limiter.wait_async()
+            started = time.perf_counter()
+            iterator = super()._stream(messages, stop, run_manager.get_sync() if run_manager else None, **kwargs)
+            done = object()
+            chunks = []
+            # next() and close() on the sync stream never overlap: a cancelled await
+            # leaves its next() running in the executor until the chunk arrives
+            step = threading.Lock()
+
+            def advance():
+                with step:
+                    return next(iterator, done)
+
+            def close():
+                with step:
+                    iterator.close()
+
+            try:
+                while True:
+                    chunk = await run_in_executor(None, advance)
+                    if chunk is done:
+                        break
+                    chunks.append(chunk.message)
+                    yield chunk
+            finally:
+                # A consumer that stops early must not leave the Bedrock stream open
+                await run_in_executor(None, close)
+                self._record("stream", waited, started, chunks)
+
+    return RateLimitedChatBedrock
 
 
 class Pipe:
@@ -123,7 +812,35 @@ class Pipe:
         )
         CONTEXT_WINDOW: int = Field(
             os.getenv("CONTEXT_WINDOW", 100000),
-            description="The number of tokens to use in the context window",
+            description="The number of tokens to use in the context window; each SQL result may use 1/20 of it",
+        )
+        WARM_UP: bool = Field(
+            os.getenv("PIPE_WARM_UP", "true").lower() in ("1", "true", "yes", "on"),
+            description="Build the agent in a background thread at startup instead of on the first message",
+        )
+        SQL_POOL_SIZE: int = Field(
+            os.getenv("SQL_POOL_SIZE", 4),
+            description="Read-only database connections shared by concurrent chats",
+        )
+        SQL_QUERY_TIMEOUT: float = Field(
+            os.getenv("SQL_QUERY_TIMEOUT", 10),
+            description="Seconds before a SQL query is interrupted",
+        )
+        SQL_MAX_ROWS: int = Field(
+            os.getenv("SQL_MAX_ROWS", 50),
+            description="Rows of a query result passed to the model; the rest are summarized",
+        )
+        ANSWER_CACHE_SIZE: int = Field(
+            os.getenv("ANSWER_CACHE_SIZE", 256),
+            description="Number of answers to keep for repeated questions (0 disables the cache)",
+        )
+        ANSWER_CACHE_TTL: int = Field(
+            os.getenv("ANSWER_CACHE_TTL", 3600),
+            description="Seconds a cached answer stays valid",
+        )
+        METRICS_FILE: str = Field(
+            os.getenv("PIPE_METRICS_FILE", "data/pipe_metrics.prom"),
+            description="Prometheus text file rewritten after every question (empty disables it)",
         )
 
         class Config:
@@ -132,18 +849,56 @@ class Pipe:
         pass
 
     def __init__(self):
+        started = time.perf_counter()
         self.valves = self.Valves()
         self.name = "Database RAG Pipeline"
         self.engine = None
         self.nlsql_response = ""
-        engine = self.get_engine_for_chinook_db()
-        db = SQLDatabase(engine)
-        sqlite_uri = "sqlite:///./data/players.db"
-        db = SQLDatabase.from_uri(sqlite_uri)
+        self.agent_executor = None
+        self.build_seconds = None
+        self.schema = SchemaSnapshot(PLAYERS_DB)
+        self.metrics = PipeMetrics()
+        self.team_builder = TeamBuilder(PLAYERS_DB, self.metrics)
+        self.answers = AnswerCache(self.valves.ANSWER_CACHE_SIZE, self.valves.ANSWER_CACHE_TTL)
+        self._build_lock = threading.Lock()
+        if self.valves.WARM_UP:
+            threading.Thread(target=self.warm_up, name="pipe-warm-up", daemon=True).start()
+        self.startup_seconds = time.perf_counter() - started
+        print(f"Pipe started in {self.startup_seconds * 1000:.1f} ms")
+
+    def warm_up(self):
+        try:
+            self.get_agent()
+        except Exception as e:
+            # The first pipe() call will try again and report the error to the user
+            print(f"Pipe warm-up failed: {e}")
+
+    def get_agent(self):
+        """Build the SQL agent on first use; later calls return the same one."""
+        if self.agent_executor is not None:
+            return self.agent_executor
+        with self._build_lock:
+            if self.agent_executor is None:
+                started = time.perf_counter()
+                self.agent_executor = self.build_agent()
+                self.build_seconds = time.perf_counter() - started
+                print(f"Pipe agent built in {self.build_seconds:.2f} s")
+        return self.agent_executor
+
+    def build_agent(self):
+        from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+        from langchain_community.utilities.sql_database import SQLDatabase
+        from langchain_core.messages import SystemMessage
+        from langgraph.prebuilt import create_react_agent
+
+        # Reflect the schema once, through the engine the tools will query with
+        self.engine = self.get_engine_for_chinook_db()
+        db = SQLDatabase(self.engine)
 
         # Set up LLM connection; uses phi3 model with 128k context limit since some queries have returned 20k+ tokens
-        llm = RateLimitedChatBedrock(
+        llm = rate_limited_chat_bedrock()(
             max_calls_per_minute=5,
+            metrics=self.metrics,
             model="anthropic.claude-3-5-sonnet-20240620-v1:0",
             temperature=0,
             max_tokens=None,
@@ -152,7 +907,6 @@ class Pipe:
         )
 
         toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-        prompt_template = hub.pull("langchain-ai/sql-agent-system-prompt")
         system_message = """System: 
         Valorant Knowledge: {
         The following are agents, or characters in the Valorant game, as well as the agent role they fall under. They are not to be confused with players, who are pro players of the game. {
@@ -164,14 +918,13 @@ class Pipe:
         }
 
         If asked to create a team, follow these guidelines: {
+            - To create a team, call the build_team tool. It applies all of the rules below and returns the highest scoring teams in one call. Only build a team with SQL queries if the user asks for something the tool cannot express.
             - ONLY pick players from the database.
-            - For the attributes I have referenced below in quotes, you can find them by querying the Players and Agents table schema.
             - Each team MUST have one IGL, or in game leader. When querying the Players table in the database, the player's field "igl" will equal "true" if they have experience being an IGL. IGL's may play any agent.
             - You must pick 5 players total for every time including an IGL.
-            - When creating a team, first filter the player pool to choose from by the league that the user has requested. If they don't specify a league, pick from any league. Each player has a "player_league" attribute in the Players database table. The possible league values in the database are ["VCT-International", "VCT-Game-Changers", "VCT-Challengers"]
-            - When selecting a player for a specific agent role, search the player's Agents table rows by using their "player_id", and use their top 3 most played agents (using "games_played") to determine if they are a good fit for that agent role. If they do not have at least one agent belonging to the role in their top 3 most played agents, DO NOT pick them for the role. Include the agents they would play in your final response.
-            - There exists agent data for almost every player, so double check there isn't any agents associated with the current "player_id" before saying there isn't agent data.
-            - Unless you determine a statistic that is best for the agent role you are picking, use "total_score" to compare players.
+            - Only pick players from the league the user has requested; if they don't specify a league, pick from any league. Each player has a "player_league" attribute in the Players database table. The possible league values in the database are ["VCT-International", "VCT-Game-Changers", "VCT-Challengers"]
+            - A player other than the IGL may only fill a role if one of their top 3 most played agents belongs to it. Include the agents each player would play in your final response.
+            - The RoleCandidates table already lists, for each "player_league" and role (Duelist, Initiator, Controller, Sentinel, and IGL for every IGL), the players with an agent of that role in their top 3 most played agents, those "agents", their "igl" flag and "total_score", ranked by "league_rank". When you do build a team with SQL, get all candidates with one query on RoleCandidates instead of checking players one at a time.
         }
         
         
@@ -182,12 +935,84 @@ class Pipe:
         Example meta composition: {[jett, viper, sova, cypher, kayo/skye] -> [duelist, controller, initiator, sentinel, initiator]}
         Example meta composition: {[jett, astra, cypher, kayo, sova] -> [duelist, controller, sentinel, initiator, initiator]}
         }
-        Instructions: {You are an agent designed to provide information about Valorant teams/pro players, and interact with a SQL database which contains information about pro players.\nGiven an input question, determine whether it requires querying the SQLite database or can be answered with your limited Valorant knowledge.\n\nIf it requires querying the database, create a syntactically correct SQLite query to run, then look at the results of the query and return the answer.\nUnless the user specifies a specific number of examples they wish to obtain, always limit your query to at most 5 results.\nYou can order the results by a relevant column to return the most interesting examples in the database. Use JSON format for data. \nNever query for all the columns from a specific table, only ask for the relevant columns given the question.\nYou have access to tools for interacting with the database.\nOnly use the below tools. If you decide to query the database, only use the information returned by the below tools to construct your final answer.\nYou MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.\n\nDO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.\n\nTo start you should ALWAYS query the schema of the most relevant tables to see what information you have.\nDo NOT skip this step.\nIf the user's question can be answered using information from the tables, use it. Otherwise, answer using your best judgement.}"""
+        Instructions: {You are an agent designed to provide information about Valorant teams/pro players, and interact with a SQL database which contains information about pro players.\nGiven an input question, determine whether it requires querying the SQLite database or can be answered with your limited Valorant knowledge.\n\nIf it requires querying the database, create a syntactically correct SQLite query to run, then look at the results of the query and return the answer.\nUnless the user specifies a specific number of examples they wish to obtain, always limit your query to at most 5 results.\nYou can order the results by a relevant column to return the most interesting examples in the database. Use JSON format for data. \nNever query for all the columns from a specific table, only ask for the relevant columns given the question.\nYou have access to tools for interacting with the database.\nOnly use the below tools. If you decide to query the database, only use the information returned by the below tools to construct your final answer.\nYou MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.\n\nDO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.\n\nThe schema of every table, with sample rows and the values of categorical columns, is given below under Database schema. Use it instead of querying the schema; only use the schema tools for a table that is not listed there.\nIf the user's question can be answered using information from the tables, use it. Otherwise, answer using your best judgement.}"""
 
-        self.agent_executor = create_react_agent(
-            llm, toolkit.get_tools(), state_modifier=system_message
+        def with_schema(state):
+            # Rendered per turn so a rebuilt players.db is picked up without a restart
+            prompt = system_message + "\n\nDatabase schema: {\n" + self.schema.text() + "\n}"
+            return [SystemMessage(content=prompt)] + state["messages"]
+
+        return create_react_agent(
+            llm,
+            self.query_tool(self.schema_tools(toolkit.get_tools())) + [self.team_tool()],
+            state_modifier=with_schema,
         )
-        pass
+
+    # Rows read past the budget only feed the summary of omitted rows
+    SQL_SCAN_LIMIT = 10000
+
+    def run_query(self, query: str) -> str:
+        """Run a read-only query and return its result shaped to the token budget."""
+        budget = max(500, int(self.valves.CONTEXT_WINDOW) // 20)
+        shaper = ResultShaper(budget, int(self.valves.SQL_MAX_ROWS))
+        started = time.perf_counter()
+        columns, rows, error = [], [], None
+        try:
+            with self.engine.connect() as connection:
+                result = connection.exec_driver_sql(query)
+                if result.returns_rows:
+                    columns = list(result.keys())
+                    rows = [tuple(row) for row in result.fetchmany(self.SQL_SCAN_LIMIT + 1)]
+        except Exception as e:
+            error = e
+        seconds = time.perf_counter() - started
+        self.metrics.observe("pipe_sql_seconds", seconds, outcome="error" if error else "ok")
+        self.metrics.event(
+            "sql", query=query, seconds=round(seconds, 4), rows=len(rows),
+            error=str(error) if error else None,
+        )
+        if error:
+            return f"Error: {error}"
+        if not columns:
+            return ""
+        more_rows = len(rows) > self.SQL_SCAN_LIMIT
+        return shaper.shape(columns, rows[: self.SQL_SCAN_LIMIT], more_rows)
+
+    def query_tool(self, tools: list) -> list:
+        """Swap the raw sql_db_query tool for run_query, keeping its name and input."""
+        from langchain_core.tools import StructuredTool
+
+        return [
+            StructuredTool.from_function(
+                func=self.run_query,
+                name=tool.name,
+                description=tool.description
+                + " Results are JSON: column names, then rows as arrays; rows beyond the"
+                " budget are counted and summarized in omitted_rows/omitted_summary.",
+            )
+            if tool.name == "sql_db_query"
+            else tool
+            for tool in tools
+        ]
+
+    def team_tool(self):
+        from langchain_core.tools import StructuredTool
+
+        return StructuredTool.from_function(func=self.team_builder.build, name="build_team")
+
+    def schema_tools(self, tools: list) -> list:
+        """Answer the list-tables and schema tools from the snapshot instead of the database."""
+        from langchain_core.tools import StructuredTool
+
+        answers = {"sql_db_list_tables": self.schema.list_tables, "sql_db_schema": self.schema.info}
+        return [
+            StructuredTool.from_function(
+                func=answers[tool.name], name=tool.name, description=tool.description
+            )
+            if tool.name in answers
+            else tool
+            for tool in tools
+        ]
 
     def get_provider_models(self):
         return [
@@ -198,36 +1023,186 @@ class Pipe:
         ]
 
     def get_engine_for_chinook_db(self):
-        """Pull sql file, populate in-memory database, and create engine."""
+        """
+        Engine over a pool of read-only connections to the players database.
+        Each checked-out connection serves one query at a time, so concurrent
+        chats run SQL in parallel; statements running past SQL_QUERY_TIMEOUT
+        are interrupted, and connections opened before players.db was
+        rebuilt are replaced on checkout.
+        """
+        from sqlalchemy import create_engine, event, exc
+        from sqlalchemy.pool import QueuePool
+
         print("DB EXISTS:", os.path.abspath(os.getcwd()))
         print("File      Path:", Path(__file__).absolute())
-        connection = sqlite3.connect("data/players.db", check_same_thread=False)
-        return create_engine(
+        timeout = float(self.valves.SQL_QUERY_TIMEOUT)
+
+        def connect():
+            connection = sqlite3.connect(
+                f"file:{PLAYERS_DB}?mode=ro&cache=private",
+                uri=True,
+                timeout=timeout,
+                check_same_thread=False,  # The pool hands a connection to one thread at a time
+                cached_statements=256,
+                factory=TimedConnection,
+            )
+            connection.execute("PRAGMA query_only = ON")
+            connection.execute("PRAGMA temp_store = MEMORY")
+            connection.execute("PRAGMA mmap_size = 268435456")
+            connection.set_progress_handler(connection.past_deadline, 10000)
+            return connection
+
+        engine = create_engine(
             "sqlite://",
-            creator=lambda: connection,
-            poolclass=StaticPool,
-            connect_args={"check_same_thread": False},
+            creator=connect,
+            poolclass=QueuePool,
+            pool_size=int(self.valves.SQL_POOL_SIZE),
+            max_overflow=0,
+            pool_timeout=timeout,
+            # Read-only connections never hold a transaction that needs rolling back
+            pool_reset_on_return=None,
+        )
+
+        @event.listens_for(engine, "connect")
+        def remember_version(dbapi_connection, connection_record):
+            connection_record.info["db_version"] = self.schema.version()
+
+        @event.listens_for(engine, "checkout")
+        def replace_stale(dbapi_connection, connection_record, connection_proxy):
+            if connection_record.info.get("db_version") != self.schema.version():
+                raise exc.DisconnectionError("players.db was rebuilt")
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def start_deadline(conn, cursor, statement, parameters, context, executemany):
+            cursor.connection.deadline = time.monotonic() + timeout
+
+        @event.listens_for(engine, "checkin")
+        def clear_deadline(dbapi_connection, connection_record):
+            if dbapi_connection is not None:
+                dbapi_connection.deadline = None
+
+        return engine
+
+    async def emit_status(self, __event_emitter__, description: str, done: bool = False):
+        if __event_emitter__:
+            await __event_emitter__(
+                {"type": "status", "data": {"description": description, "done": done}}
+            )
+
+    def record_question(self, path: str, started: float, tool_calls: list, messages: list = ()):
+        """Record one answered question and rewrite the metrics file."""
+        seconds = time.perf_counter() - started
+        input_tokens, output_tokens = token_usage(messages)
+        self.metrics.observe("pipe_question_seconds", seconds, path=path)
+        self.metrics.observe("pipe_tool_calls_per_question", len(tool_calls))
+        for name in tool_calls:
+            self.metrics.count("pipe_tool_calls_total", tool=name)
+        self.metrics.event(
+            "question", path=path, seconds=round(seconds, 3), tool_calls=tool_calls,
+            input_tokens=input_tokens, output_tokens=output_tokens,
         )
+        try:
+            self.metrics.write_prometheus(self.valves.METRICS_FILE)
+        except OSError as e:
+            log.warning(f"Could not write {self.valves.METRICS_FILE}: {e}")
+
+    async def stream_answer(
+        self, messages: list, __event_emitter__=None, cache_key: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        Yield the agent's text token by token as it is generated, reporting each
+        tool call as a status event instead of waiting for the whole ReAct loop.
+        Once the stream completes, the final agent message alone is cached
+        under cache_key, the same answer the non-streaming path caches.
+        """
+        await self.emit_status(__event_emitter__, "Thinking")
+        started = time.perf_counter()
+        last_message_id = None
+        wrote_text = False
+        tool_calls = []
+        agent_messages = []
+        final_message_id = None
+        final_parts = []  # Text of the latest agent message so far
+        try:
+            async for message, metadata in self.agent_executor.astream(
+                {"messages": messages}, stream_mode="messages"
+            ):
+                if metadata.get("langgraph_node") != "agent":
+                    # Tool output goes back to the model, not to the user
+                    continue
+                agent_messages.append(message)
+                if message.id != final_message_id:
+                    final_message_id = message.id
+                    final_parts = []
+                for tool_call in getattr(message, "tool_call_chunks", None) or []:
+                    if tool_call.get("name"):
+                        tool_calls.append(tool_call["name"])
+                        status = TOOL_STATUS.get(tool_call["name"], f"Calling {tool_call['name']}")
+                        await self.emit_status(__event_emitter__, status)
+                text = message_text(message.content)
+                if not text:
+                    continue
+                final_parts.append(text)
+                if message.id != last_message_id and wrote_text:
+                    # Separate the text of consecutive agent turns
+                    yield "\n\n"
+                last_message_id = message.id
+                wrote_text = True
+                yield text
+            if cache_key is not None:
+                self.answers.put(cache_key, "".join(final_parts))
+        finally:
+            self.record_question("stream", started, tool_calls, agent_messages)
+            await self.emit_status(__event_emitter__, "Done", done=True)
 
-    def pipe(
+    async def pipe(
         self,
         body: dict,
         __user__: dict,
         __event_emitter__=None,
-        __event_call__=None,=
+        __event_call__=None,
         __valves__=None,
-    ) -> Union[str, Generator, Iterator]:
+    ) -> Union[str, Generator, Iterator, AsyncGenerator]:
 
         print(f"pipe:{__name__}")
 
-        print(__event_emitter__)
-        print(__event_call__)
-
         user_message = get_last_user_message(body["messages"])
 
-        response = self.agent_executor.invoke({"messages": body["messages"]})[
+        started = time.perf_counter()
+        version = self.schema.version()
+        if version is None:
+            await self.emit_status(__event_emitter__, "No database", done=True)
+            return DB_MISSING
+        cache_key = self.answers.key(body["messages"], version)
+        answer = self.answers.get(cache_key)
+        self.metrics.count("pipe_answer_cache_total", result="miss" if answer is None else "hit")
+        if answer is not None:
+            print(f"Answer cache hit: {self.answers.stats()}")
+            self.record_question("cache", started, [])
+            await self.emit_status(__event_emitter__, "Answered from cache", done=True)
+            return answer
+
+        if self.agent_executor is None:
+            await self.emit_status(__event_emitter__, "Starting up")
+            # Building imports langchain and reflects the database; keep it off the event loop
+            await asyncio.to_thread(self.get_agent)
+
+        if body.get("stream", False):
+            return self.stream_answer(body["messages"], __event_emitter__, cache_key)
+
+        await self.emit_status(__event_emitter__, "Thinking")
+        response = (await self.agent_executor.ainvoke({"messages": body["messages"]}))[
             "messages"
         ]
-        print(response)
+        await self.emit_status(__event_emitter__, "Done", done=True)
+        new_messages = response[len(body["messages"]):]
+        tool_calls = [
+            tool_call["name"]
+            for message in new_messages
+            for tool_call in getattr(message, "tool_calls", None) or []
+        ]
+        self.record_question("invoke", started, tool_calls, new_messages)
 
-        return response[-1].content
+        answer = message_text(response[-1].content)
+        self.answers.put(cache_key, answer)
+        return answer
@@ -0,0 +1,280 @@
+"""
+Pipe's answer cache: a question answered while streaming caches the same
+answer as one answered by a non-streaming request, the final agent message
+without the intermediate turns. Questions asked before players.db is built
+get a clear answer instead of an error. The call rate limiter admits at most
+max_calls per window, in arrival order, from threads and coroutines alike,
+and gives back the slot of a caller cancelled while waiting. Metric label
+values are escaped. Pooled SQL connections interrupt statements past the
+query timeout and are replaced once players.db is rebuilt. SQL results are
+shaped to fit their token budget.
+
+Needs Open WebUI and langchain-core installed. Run from this directory:
+
+    python -m pytest -q test_function.py
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+# Open WebUI refuses to import without a secret key outside its own launcher
+os.environ.setdefault("WEBUI_SECRET_KEY", "test-secret-key-for-pipe-tests-only")
+# Valve defaults are read when function.py is imported; no agent is built in these tests
+os.environ["PIPE_WARM_UP"] = "false"
+pytest.importorskip("open_webui")
+messages = pytest.importorskip("langchain_core.messages")
+
+import function
+
+QUESTION = [{"role": "user", "content": "Who is the best duelist?"}]
+THINKING = "Let me look that up."
+ANSWER = "The best duelist is aspas, with a total_score of 61.3."
+
+
+class FakeAgent:
+    """A ReAct run: one agent turn that calls the query tool, the tool result, then the final answer."""
+
+    def run(self):
+        return [
+            messages.AIMessage(
+                content=THINKING, id="turn-1",
+                tool_calls=[{"name": "sql_db_query", "args": {"query": "SELECT 1"}, "id": "call-1"}],
+            ),
+            messages.ToolMessage(content='[["aspas", 61.3]]', tool_call_id="call-1", id="tool-1"),
+            messages.AIMessage(content=ANSWER, id="turn-2"),
+        ]
+
+    async def astream(self, inputs, stream_mode):
+        for message in self.run():
+            node = "tools" if isinstance(message, messages.ToolMessage) else "agent"
+            text = message.content
+            # Stream each message in a few chunks, as the model does
+            for start in range(0, len(text), 7):
+                chunk = messages.AIMessageChunk(content=text[start:start + 7], id=message.id)
+                if start == 0 and getattr(message, "tool_calls", None):
+                    chunk = messages.AIMessageChunk(
+                        content=chunk.content, id=message.id,
+                        tool_call_chunks=[{"name": "sql_db_query", "args": "", "id": "call-1", "index": 0}],
+                    )
+                yield chunk, {"langgraph_node": node}
+
+    async def ainvoke(self, inputs):
+        return {"messages": list(inputs["messages"]) + self.run()}
+
+
+@pytest.fixture
+def pipe(tmp_path):
+    database = tmp_path / "players.db"
+    database.touch()
+    pipe = function.Pipe()
+    pipe.valves.METRICS_FILE = ""
+    pipe.schema = function.SchemaSnapshot(str(database))
+    pipe.agent_executor = FakeAgent()
+    return pipe
+
+
+def ask(pipe, stream):
+    async def run():
+        answer = await pipe.pipe({"messages": QUESTION, "stream": stream}, {})
+        if isinstance(answer, str):
+            return answer
+        return "".join([chunk async for chunk in answer])
+
+    return asyncio.run(run())
+
+
+def cached(pipe):
+    return pipe.answers.get(pipe.answers.key(QUESTION, pipe.schema.version()))
+
+
+def test_stream_and_invoke_cache_the_same_answer(pipe):
+    streamed = ask(pipe, stream=True)
+    assert THINKING in streamed and ANSWER in streamed
+    stream_entry = cached(pipe)
+
+    pipe.answers = function.AnswerCache()
+    assert ask(pipe, stream=False) == ANSWER
+    assert stream_entry == cached(pipe) == ANSWER
+
+
+def test_cached_streamed_answer_is_served_to_invoke(pipe):
+    ask(pipe, stream=True)
+    pipe.agent_executor = None  # A cache miss would now fail
+    assert ask(pipe, stream=False) == ANSWER
+
+
+def test_missing_database_is_reported(pipe, tmp_path):
+    pipe.schema = function.SchemaSnapshot(str(tmp_path / "missing.db"))
+    assert pipe.schema.version() is None
+    assert pipe.schema.text() == ""
+    assert ask(pipe, stream=False) == ask(pipe, stream=True) == function.DB_MISSING
+
+
+def test_team_builder_reports_a_missing_database(tmp_path):
+    builder = function.TeamBuilder(str(tmp_path / "missing.db"))
+    assert builder.players() == []
+    assert builder.build() == f"Error: {function.DB_MISSING}"
+
+
+def test_limiter_bounds_every_window_in_arrival_order():
+    limiter = function.CallRateLimiter(2, period=0.2)
+    started = []
+    lock = threading.Lock()
+
+    def call(index):
+        limiter.wait()
+        with lock:
+            started.append((time.monotonic(), index))
+
+    threads = []
+    for index in range(6):
+        threads.append(threading.Thread(target=call, args=(index,)))
+        threads[-1].start()
+        time.sleep(0.005)  # Fix the arrival order
+    for thread in threads:
+        thread.join()
+    times = [when for when, _ in sorted(started)]
+    assert [index for _, index in sorted(started)] == list(range(6))
+    # No three calls within one period
+    assert all(later - earlier >= 0.19 for earlier, later in zip(times, times[2:]))
+    stats = limiter.stats()
+    assert stats["calls"] == 6 and stats["queue_depth"] == 0 and stats["max_wait_seconds"] >= 0.35
+
+
+def test_async_waits_do_not_block_the_event_loop():
+    limiter = function.CallRateLimiter(1, period=0.2)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        waits = await asyncio.gather(*(limiter.wait_async() for _ in range(3)))
+        ticker.cancel()
+        return waits, ticks
+
+    waits, ticks = asyncio.run(run())
+    assert waits[0] == 0.0 and 0.15 < waits[1] < waits[2]
+    assert ticks > 20
+
+
+def test_cancelled_wait_gives_its_slot_back():
+    limiter = function.CallRateLimiter(1, period=60.0)
+
+    async def run():
+        assert await limiter.wait_async() == 0.0
+        waiter = asyncio.ensure_future(limiter.wait_async())
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["queue_depth"] == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(run())
+    stats = limiter.stats()
+    assert (stats["calls"], stats["queue_depth"], stats["avg_wait_seconds"]) == (1, 0, 0.0)
+
+
+def test_metric_label_values_are_escaped():
+    metrics = function.PipeMetrics()
+    metrics.count("pipe_tool_calls_total", tool='say "hi"\\\n')
+    assert 'pipe_tool_calls_total{tool="say \\"hi\\"\\\\\\n"} 1' in metrics.prometheus()
+
+
+@pytest.fixture
+def engine(pipe, tmp_path, monkeypatch):
+    pytest.importorskip("sqlalchemy")
+    database = tmp_path / "pool.db"
+    with sqlite3.connect(database) as connection:
+        connection.execute("CREATE TABLE Players (player_id INTEGER PRIMARY KEY, player_name TEXT)")
+        connection.execute("INSERT INTO Players VALUES (1, 'aspas')")
+    connection.close()
+    monkeypatch.setattr(function, "PLAYERS_DB", str(database))
+    pipe.schema = function.SchemaSnapshot(str(database))
+    pipe.valves.SQL_QUERY_TIMEOUT = 0.2
+    pipe.valves.SQL_POOL_SIZE = 1
+    engine = pipe.get_engine_for_chinook_db()
+    yield engine
+    engine.dispose()
+
+
+SLOW_QUERY = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+
+
+def test_statements_past_the_deadline_are_interrupted(engine):
+    from sqlalchemy import exc, text
+
+    with engine.connect() as connection:
+        started = time.monotonic()
+        with pytest.raises(exc.OperationalError, match="interrupted"):
+            connection.execute(text(SLOW_QUERY))
+        assert time.monotonic() - started < 2
+        # The next statement gets a deadline of its own
+        assert connection.execute(text("SELECT player_name FROM Players")).fetchall() == [("aspas",)]
+
+
+def test_connections_are_replaced_after_a_rebuild(engine, pipe):
+    from sqlalchemy import text
+
+    with engine.connect() as connection:
+        first = connection.connection.dbapi_connection
+    with engine.connect() as connection:
+        assert connection.connection.dbapi_connection is first
+    with sqlite3.connect(pipe.schema.path) as rebuilt:
+        rebuilt.execute("INSERT INTO Players VALUES (2, 'Derke')")
+    rebuilt.close()
+    os.utime(pipe.schema.path, (time.time() + 5, time.time() + 5))
+    with engine.connect() as connection:
+        assert connection.connection.dbapi_connection is not first
+        assert connection.execute(text("SELECT count(*) FROM Players")).scalar() == 2
+
+
+def test_a_full_pool_times_out(engine):
+    from sqlalchemy import exc
+
+    with engine.connect():
+        started = time.monotonic()
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        assert time.monotonic() - started < 2
+
+
+COLUMNS = ["player_name", "player_league", "total_score"]
+ROWS = [[f"player{index}", "VCT" if index % 3 else "GC", 80.0 - index / 3] for index in range(200)]
+
+
+def test_small_results_are_kept_whole():
+    shaped = json.loads(function.ResultShaper(max_tokens=1000).shape(COLUMNS, ROWS[:3]))
+    assert shaped == {"columns": COLUMNS, "rows": [[row[0], row[1], round(row[2], 4)] for row in ROWS[:3]]}
+
+
+@pytest.mark.parametrize("max_tokens", [40, 200, 1000])
+def test_large_results_fit_the_budget_with_a_summary(max_tokens):
+    shaper = function.ResultShaper(max_tokens=max_tokens, max_rows=50)
+    text = shaper.shape(COLUMNS, ROWS)
+    shaped = json.loads(text)
+    assert len(text) <= max_tokens * shaper.CHARS_PER_TOKEN
+    assert len(shaped["rows"]) + shaped["omitted_rows"] == len(ROWS)
+    assert len(shaped["rows"]) <= 50
+    assert shaped["rows"] == [[row[0], row[1], round(row[2], 4)] for row in ROWS[: len(shaped["rows"])]]
+
+
+def test_omitted_rows_are_summarized():
+    shaped = json.loads(function.ResultShaper(max_tokens=1000, max_rows=10).shape(COLUMNS, ROWS, more_rows=True))
+    assert shaped["omitted_rows"] == "190+"
+    summary = shaped["omitted_summary"]
+    assert summary["total_score"] == {"min": round(80.0 - 199 / 3, 4), "max": round(80.0 - 10 / 3, 4),
+                                      "mean": round(80.0 - 104.5 / 3, 4)}
+    assert summary["player_league"]["distinct"] == 2
+    assert summary["player_name"] == {"distinct": 190}